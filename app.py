@@ -6,6 +6,7 @@ import io
 import logging
 import os
 import json
+import hmac
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -41,6 +42,39 @@ BRANCH_MAP = {
 
 APP_TITLE = "Retail KPI Copilot"
 
+# Optional: local directory standing in for Drive (<root>/<folder_id>/sales.xlsx ...)
+LOCAL_DRIVE_ROOT = os.getenv("LOCAL_DRIVE_ROOT")
+
+# Optional: write a normalized sales/items.parquet next to the workbook after parsing,
+# so other sessions and replicas skip Excel. Requires a writable Drive scope.
+PUBLISH_SIDECARS = os.getenv("PUBLISH_SIDECARS", "0") == "1"
+
+# Optional: persist every load into the embedded SQLite store (services/sqlite_store)
+# and run the KPI / seller / mix queries against it. Set to a path on a mounted volume.
+KPI_STORE_ENABLED = bool(os.getenv("KPI_STORE_PATH"))
+
+# Optional: ARROW_CACHE_DIR (services/arrow_store) - loaded branches are kept as
+# memory-mapped Arrow files shared by every Streamlit process on the host.
+
+# Optional: monthly snapshot archive (services/snapshot_archive) for MoM / YoY
+# comparisons. Set SNAPSHOT_DIR to a mounted volume to keep history across deploys.
+SNAPSHOTS_ENABLED = bool(os.getenv("SNAPSHOT_DIR"))
+
+# Optional: background worker that keeps all BRANCH_MAP folders warm in the
+# shared dataset registry (seconds between change checks; 0 disables)
+PREFETCH_INTERVAL = int(os.getenv("PREFETCH_INTERVAL", "0"))
+
+# Optional: memory accounting page (services/memory_accounting) in the navigation,
+# with per-branch / per-session sizes and tracemalloc snapshots. Totals are also
+# logged after every dataset load. The page also needs ADMIN_PASSWORD, entered
+# once per session on top of the branch login.
+ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "")
+ADMIN_PANEL = os.getenv("ADMIN_PANEL", "0") == "1" and bool(ADMIN_PASSWORD)
+
+# While a branch loads, show the status cards of the sales rows parsed so far
+# (services/progressive); seller table and mix follow once items is loaded too.
+PROGRESSIVE_LOAD = os.getenv("PROGRESSIVE_LOAD", "1") == "1"
+
 
 def get_drive_service():
     """Authenticates and returns the Google Drive service (Render ENV first, then Streamlit secrets)."""
@@ -53,9 +87,10 @@ def get_drive_service():
             # 2) Local dev (Streamlit secrets.toml)
             service_account_info = dict(st.secrets["gcp_service_account"])
 
+        scope = "drive" if PUBLISH_SIDECARS else "drive.readonly"
         credentials = service_account.Credentials.from_service_account_info(
             service_account_info,
-            scopes=["https://www.googleapis.com/auth/drive.readonly"]
+            scopes=[f"https://www.googleapis.com/auth/{scope}"]
         )
         return build("drive", "v3", credentials=credentials)
 
@@ -64,6 +99,150 @@ def get_drive_service():
         st.error("Failed to authenticate with Google Drive. Please check your secrets configuration.")
         st.error(f"Drive auth error details: {e}")
         return None
+
+
+def get_data_source():
+    """Returns the branch-folder backend: local directory if configured, else Drive."""
+    from services.drive_source import DriveSource, LocalSource
+    if LOCAL_DRIVE_ROOT:
+        return LocalSource(LOCAL_DRIVE_ROOT)
+    service = get_drive_service()
+    return DriveSource(service) if service else None
+
+def store_loaded_data(branch, revision, df_sales, df_items):
+    """
+    Persists a load: monthly snapshot archive and SQLite store (each if enabled).
+    Returns the period stored in the SQLite store.
+    """
+    if SNAPSHOTS_ENABLED:
+        try:
+            from services import snapshot_archive
+            snapshot_archive.save_snapshot(branch, revision, df_sales, df_items)
+        except Exception as e:
+            # Comparisons are optional; never fail the load because of them
+            logger.error(f"Snapshot archive failed for {branch}: {e}")
+
+    if not KPI_STORE_ENABLED:
+        return None
+    try:
+        from services import sqlite_store
+        return sqlite_store.ingest(branch, revision, df_sales, df_items)
+    except Exception as e:
+        # The in-memory frames still work; the store is an accelerator
+        logger.error(f"KPI store ingest failed for {branch}: {e}")
+        return None
+
+def attach_dataset(branch, revision, loaded_files, df_sales, df_items):
+    """
+    Points the session at the shared dataset (branch, revision) instead of
+    keeping its own copy, releasing the previously held revision.
+    """
+    from services import dataset_registry
+    attach_lease(branch, revision, dataset_registry.acquire_or_publish(branch, revision, df_sales, df_items, loaded_files))
+
+
+def attach_lease(branch, revision, lease):
+    """Points the session at an acquired dataset lease (see attach_dataset)."""
+    old_lease = st.session_state.get("dataset_lease")
+    if old_lease is not None and old_lease is not lease:
+        old_lease.release()
+
+    st.session_state.dataset_lease = lease
+    build_dataset_indexes(lease)
+    st.session_state.data_period = store_loaded_data(branch, revision, lease.sales_df, lease.items_df)
+    st.session_state.data_loaded = True
+
+    from services import memory_accounting
+    memory_accounting.log_report()
+
+
+def build_dataset_indexes(lease):
+    """Builds the per-revision indexes at load time (once per revision, shared)."""
+    from services.derived_tables import DerivedTables
+    return DerivedTables(lease).get("seller_index")
+
+
+def progressive_preview(target):
+    """
+    on_batch callback for the loaders (see services/branch_loader.load_dataset) that
+    renders Tab 1 from the sales rows parsed so far; None when PROGRESSIVE_LOAD is off.
+    """
+    if not PROGRESSIVE_LOAD:
+        return None
+    from services.progressive import PartialKpis
+    from ui import tab1
+
+    partial = PartialKpis()
+    preview = st.empty()
+
+    def on_batch(dataset, rows, rows_done, rows_total):
+        partial.add(rows, rows_done, rows_total)
+        kpis = partial.kpis(target)
+        if kpis is None:
+            return
+        with preview.container():
+            tab1.render(kpis, partial=None if partial.complete else partial.fraction)
+            if partial.complete:
+                st.caption("טבלת המוכרים ותמהיל המכירות יוצגו בסיום טעינת קובץ הפריטים (items).")
+
+    return on_batch
+
+
+def record_session_memory(branch):
+    """Records this session's private state sizes (services/memory_accounting)."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    from services import memory_accounting
+    ctx = get_script_run_ctx()
+    memory_accounting.record_session(ctx.session_id if ctx else "local", branch, st.session_state)
+
+
+def admin_unlocked():
+    """True once this session entered ADMIN_PASSWORD (asks for it otherwise)."""
+    if st.session_state.get("admin_unlocked"):
+        return True
+    password = st.text_input("סיסמת מנהל", type="password", key="admin_password")
+    if password and hmac.compare_digest(password.encode(), ADMIN_PASSWORD.encode()):
+        st.session_state.admin_unlocked = True
+        return True
+    if password:
+        st.error("סיסמה שגויה.")
+    return False
+
+
+def follow_latest_dataset(branch):
+    """Switches the session to a newer revision published by another session or the prefetcher."""
+    from services import dataset_registry
+    lease = st.session_state.get("dataset_lease")
+    latest = dataset_registry.latest_revision(branch)
+    if lease is None or latest is None or latest == lease.revision:
+        return
+    new_lease = dataset_registry.acquire(branch, latest)
+    if new_lease is None:
+        return
+    lease.release()
+    st.session_state.dataset_lease = new_lease
+    build_dataset_indexes(new_lease)
+    st.session_state.data_period = store_loaded_data(branch, latest, new_lease.sales_df, new_lease.items_df)
+
+
+@st.cache_resource
+def start_prefetcher():
+    """Starts the branch prefetcher once per process (see services/prefetch)."""
+    source = get_data_source()
+    if not source:
+        return None
+    from services.prefetch import Prefetcher
+    worker = Prefetcher(
+        source,
+        BRANCH_MAP,
+        interval=PREFETCH_INTERVAL,
+        publish_sidecars=PUBLISH_SIDECARS,
+        on_loaded=store_loaded_data
+    )
+    worker.start()
+    logger.info(f"Prefetcher started (every {PREFETCH_INTERVAL}s, {len(BRANCH_MAP)} branches)")
+    return worker
+
 def get_gemini_credentials():
     """Loads Gemini/Vertex service account JSON from Render ENV first, then Streamlit secrets."""
     raw = os.getenv("GEMINI_SERVICE_ACCOUNT_JSON")
@@ -79,6 +258,11 @@ def init_vertex_ai_once():
     if st.session_state.get("_vertex_inited"):
         return
 
+    from services.ai_assistant import AI_BACKEND
+    if AI_BACKEND == "fake":
+        st.session_state["_vertex_inited"] = True
+        return
+
     try:
         # 1. טעינת האישורים
         creds, info = get_gemini_credentials()
@@ -118,15 +302,11 @@ def load_data(service, folder_id):
             st.warning("File 'sales.xlsx' not found in this branch's folder.")
             return None
 
-        # Get the first matching file (assuming unique name per folder)
-        file_id = files[0]['id']
+        from services.drive_source import DriveSource
         
-        # Download the file content
-        request = service.files().get_media(fileId=file_id)
-        file_content = io.BytesIO()
-        downloader = request.execute()
-        file_content.write(downloader)
-        file_content.seek(0)
+        # Download the first matching file (assuming unique name per folder),
+        # chunked into a single buffer
+        file_content = DriveSource(service).download(files[0])
         
         # Read into Pandas DataFrame
         df = pd.read_excel(file_content, engine='calamine')
@@ -141,6 +321,9 @@ def main():
     st.set_page_config(page_title=APP_TITLE, layout="wide")
     st.title(APP_TITLE)
 
+    if PREFETCH_INTERVAL > 0:
+        start_prefetcher()
+
     # Login Logic
     if 'logged_in' not in st.session_state:
         st.session_state.logged_in = False
@@ -192,6 +375,8 @@ def main():
     if st.session_state.data_loaded:
         if st.sidebar.button("רענן נתונים"):
             st.session_state.data_loaded = False
+            # Bypass the cached folder listing on the next load
+            st.session_state.force_relist = True
             st.rerun()
 
     # Determine if we need to load/reload data
@@ -206,18 +391,40 @@ def main():
                     
                     from services.load_sales import load_and_normalize_sales
                     from services.load_items import load_and_normalize_items
+                    from services import dataset_registry
                     
-                    # Read using calamine engine as per requirements.txt and existing code
-                    with open(sales_path, "rb") as f:
-                        df_sales = load_and_normalize_sales(io.BytesIO(f.read()))
-                    with open(items_path, "rb") as f:
-                        df_items = load_and_normalize_items(io.BytesIO(f.read()))
+                    revision = "|".join(
+                        f"{os.path.basename(p)}@{os.path.getmtime(p)}" for p in (sales_path, items_path)
+                    )
+                    loaded_files = ["sales_demo.xlsx", "items_demo.xlsx"]
                     
-                    if df_sales is not None and df_items is not None:
-                        st.session_state.sales_df = df_sales
-                        st.session_state.items_df = df_items
-                        st.session_state.data_loaded = True
+                    from services import arrow_store
+                    from services.branch_loader import share_frames
+
+                    # Shared across sessions: only the first DEMO login parses the files
+                    # (and across processes with ARROW_CACHE_DIR: the first one maps, the rest reuse)
+                    lease = dataset_registry.acquire(selected_branch, revision)
+                    if lease is not None:
+                        attach_lease(selected_branch, revision, lease)
                         st.rerun()
+
+                    stored = arrow_store.load(selected_branch, revision) if arrow_store.ENABLED else None
+                    if stored is not None:
+                        df_sales, df_items, _ = stored
+                    else:
+                        # Read using calamine engine as per requirements.txt and existing code
+                        on_batch = progressive_preview(target)
+                        on_rows = (lambda rows, done, total: on_batch("sales", rows, done, total)) if on_batch else None
+                        with open(sales_path, "rb") as f:
+                            df_sales = load_and_normalize_sales(io.BytesIO(f.read()), on_batch=on_rows)
+                        with open(items_path, "rb") as f:
+                            df_items = load_and_normalize_items(io.BytesIO(f.read()))
+                        if df_sales is None or df_items is None:
+                            return
+                        df_sales, df_items = share_frames(selected_branch, revision, df_sales, df_items, loaded_files)
+                    
+                    attach_dataset(selected_branch, revision, loaded_files, df_sales, df_items)
+                    st.rerun()
                 except Exception as e:
                     st.error(f"שגיאה בטעינת נתוני DEMO: {e}")
             return
@@ -228,28 +435,35 @@ def main():
              return
 
         with st.spinner("טוען נתונים... (Loading Data)"):
-            service = get_drive_service()
-            if service:
-                # 1. Download Files
-                sales_stream = get_file_stream(service, folder_id, 'sales.xlsx')
-                items_stream = get_file_stream(service, folder_id, 'items.xlsx')
+            source = get_data_source()
+            if source:
+                from services.branch_loader import list_branch_files, load_branch_cached
+
+                # Folder listing is cached briefly (services/folder_metadata) unless refreshing
+                max_age = 0 if st.session_state.pop("force_relist", False) else None
+                files = list_branch_files(source, folder_id, max_age=max_age)
+
+                progress_bar = st.progress(0.0)
+
+                def show_progress(dataset, fraction):
+                    progress_bar.progress(min(fraction, 1.0), text=f"מוריד {dataset}... {fraction:.0%}")
+
+                # 1. Download & Process (fastest available format per file),
+                #    unless the shared registry already holds this folder revision.
+                #    Status cards fill in from the sales rows parsed so far.
+                df_sales, df_items, loaded_files, revision = load_branch_cached(
+                    source, selected_branch, folder_id, publish_sidecars=PUBLISH_SIDECARS,
+                    files=files, progress=show_progress, on_batch=progressive_preview(target)
+                )
+                progress_bar.empty()
                 
                 # 2. validation
-                if not sales_stream or not items_stream:
-                     st.error("שגיאה: לא נמצאו קבצי נתונים בתיקיית הסניף. נדרש: sales.xlsx ו-items.xlsx")
+                if len(loaded_files) < 2:
+                     st.error("שגיאה: לא נמצאו קבצי נתונים בתיקיית הסניף. נדרש: sales ו-items (xlsx / csv / parquet)")
                      return
                 
-                # 3. Process
-                from services.load_sales import load_and_normalize_sales
-                from services.load_items import load_and_normalize_items
-                
-                df_sales = load_and_normalize_sales(sales_stream)
-                df_items = load_and_normalize_items(items_stream)
-                
                 if df_sales is not None and df_items is not None:
-                     st.session_state.sales_df = df_sales
-                     st.session_state.items_df = df_items
-                     st.session_state.data_loaded = True
+                     attach_dataset(selected_branch, revision, loaded_files, df_sales, df_items)
                      st.rerun() 
                 else:
                      st.error("Failed to process data files.")
@@ -259,7 +473,12 @@ def main():
 
     # --- MAIN NAVIGATION & RENDER ---
     if st.session_state.data_loaded:
-         st.sidebar.success("נטען: sales.xlsx, items.xlsx")
+         # Pick up a newer revision published by a refresh in another session
+         follow_latest_dataset(selected_branch)
+         lease = st.session_state.dataset_lease
+         
+         loaded_files = lease.loaded_files
+         st.sidebar.success(f"נטען: {', '.join(loaded_files)}")
          st.sidebar.markdown("---")
          
          # NAVIGATION MENU
@@ -269,39 +488,93 @@ def main():
              "תמהיל מוצרים": "mix",
              "תובנות ופעולות": "ai"
          }
+         if ADMIN_PANEL:
+             NAV_OPTIONS["זיכרון (ניהול)"] = "admin"
          
          selected_nav = st.sidebar.radio("ניווט", list(NAV_OPTIONS.keys()))
          page_key = NAV_OPTIONS[selected_nav]
 
-         sales_df = st.session_state.sales_df
-         items_df = st.session_state.items_df
          target_amount = st.session_state.target_amount
          
-         # --- SHARED CALCS ---
-         from services.kpi_tab1 import calculate_kpis
-         from services import kpi_tab2
+         # --- DERIVED TABLES (lazy, memoized per dataset revision) ---
+         from services.derived_tables import DerivedTables
+         
+         data_period = st.session_state.get("data_period")
+         tables = DerivedTables(
+             lease,
+             {"target": target_amount, "branch": selected_branch, "period": data_period},
+             # Indexed SQL over the persisted store when enabled
+             use_store=KPI_STORE_ENABLED and bool(data_period)
+         )
+         
+         # Only what the current page declared is computed
+         needs = tables.page(page_key)
+
+         # Private session state sizes for the memory panel (services/memory_accounting)
+         record_session_memory(selected_branch)
+         
+         # --- EXPORT (built only when clicked, in the background) ---
+         from services import report_export
          
-         kpis = calculate_kpis(sales_df, target=target_amount)
-         df_sellers = kpi_tab2.get_seller_table(sales_df, items_df)
-         df_top_qty = kpi_tab2.get_top_products_qty(sales_df) 
-         df_top_amt = kpi_tab2.get_top_products_amount(sales_df)
+         def branch_export(fmt):
+             def build():
+                 reports = report_export.branch_reports(tables["kpis"], tables["sellers"], tables["category_pivot"])
+                 return report_export.export_bytes([(selected_branch, reports)], fmt)
+             return build
+         
+         st.sidebar.markdown("---")
+         for fmt, label in (("xlsx", "הורד דוח (Excel)"), ("csv", "הורד דוח (CSV)")):
+             st.sidebar.download_button(
+                 label,
+                 data=branch_export(fmt),
+                 file_name=report_export.export_file_name(selected_branch, fmt),
+                 mime=report_export.EXPORT_FORMATS[fmt],
+                 on_click="ignore",
+                 key=f"export_{fmt}"
+             )
          
          # --- PAGE ROUTING ---
          if page_key == "status":
              from ui import tab1
              # Page Title (Matches Nav)
              st.markdown(f"<h2 style='text-align: right; direction: rtl;'>{selected_nav}</h2>", unsafe_allow_html=True)
-             tab1.render(kpis)
+             tab1.render(
+                 needs["kpis"],
+                 comparisons=needs["kpi_comparisons"],
+                 get_pace_base=lambda: tables["pace_base"]
+             )
 
          elif page_key == "team":
              from ui import tab2
              st.markdown(f"<h2 style='text-align: right; direction: rtl;'>{selected_nav}</h2>", unsafe_allow_html=True)
-             tab2.render(df_sellers, df_top_qty, df_top_amt)
+             from services import snapshot_archive
+             tab2.render(
+                 needs["sellers"], needs["top_qty"], needs["top_amt"],
+                 get_deltas=lambda baseline: snapshot_archive.seller_deltas(
+                     selected_branch, needs["month"], needs["sellers"], baseline
+                 ),
+                 seller_search=needs["seller_search"],
+                 search_products=lambda query: tables["product_totals"].iloc[
+                     tables["product_search"].search(query)
+                 ],
+                 get_basket=lambda: tables["basket"],
+                 ticket_sketches=needs["ticket_sketches"],
+                 ticket_percentiles=needs["ticket_percentiles"],
+                 get_region_tickets=lambda: snapshot_archive.region_ticket_sketch(needs["month"]) if needs["month"] else None
+             )
              
          elif page_key == "mix":
              from ui import tab3
              st.markdown(f"<h2 style='text-align: right; direction: rtl;'>{selected_nav}</h2>", unsafe_allow_html=True)
-             tab3.render(items_df)
+             from services import snapshot_archive
+             tab3.render(
+                 needs["items_view"],
+                 seller_index=needs["seller_index"],
+                 get_pivot=lambda: tables["category_pivot"],
+                 get_share_deltas=lambda df_dist, seller_name, baseline: snapshot_archive.category_share_deltas(
+                     selected_branch, needs["month"], df_dist, seller_name, baseline
+                 )
+             )
              
          elif page_key == "ai":
              from ui import tab4
@@ -318,37 +591,19 @@ def main():
                  return
 
              tab4.render(
-                 kpis,
-                 df_sellers,
-                 df_top_qty,
-                 df_top_amt,
-                 items_df
+                 needs["kpis"],
+                 needs["sellers"],
+                 needs["top_qty"],
+                 needs["top_amt"],
+                 needs["items_view"],
+                 general_seller=needs["general_seller"]
              )
 
-
-def get_file_stream(service, folder_id, filename):
-    """Helper to get BytesIO stream of a file from Drive."""
-    try:
-        query = f"name = '{filename}' and '{folder_id}' in parents and trashed = false"
-        results = service.files().list(q=query, fields="files(id, name)").execute()
-        files = results.get('files', [])
-
-        if not files:
-            st.warning(f"קובץ '{filename}' לא נמצא בתיקייה.")
-            return None
-
-        file_id = files[0]['id']
-        request = service.files().get_media(fileId=file_id)
-        file_content = io.BytesIO()
-        downloader = request.execute()
-        file_content.write(downloader)
-        file_content.seek(0)
-        return file_content
-    except Exception as e:
-        logger.error(f"Error downloading {filename}: {e}")
-        st.error(f"שגיאה בהורדת הקובץ: {e}")
-        return None
-
+         elif page_key == "admin":
+             from ui import admin
+             st.markdown(f"<h2 style='text-align: right; direction: rtl;'>{selected_nav}</h2>", unsafe_allow_html=True)
+             if admin_unlocked():
+                 admin.render()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+
+# Factorized aggregation kernel behind the KPI tables.
+# Keys (transaction, seller, product, category) are factorized once per frame into
+# integer codes; every sum/count is then a np.bincount over those codes.
+# Codes are sorted like groupby keys and missing keys get -1 (dropped, as in groupby).
+
+
+def factorize(values):
+    """
+    Sorted integer codes for a key column: (codes, uniques Index).
+    Missing keys get -1. Uniques get the dtype groupby would give its keys.
+    """
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes, pd.Index(np.asarray(uniques))
+
+
+def group_sum(codes, weights, size):
+    """Sum of `weights` per code (rows with code -1 are skipped, NaN counts as 0)."""
+    valid = codes >= 0
+    weights = np.nan_to_num(weights[valid], nan=0.0)
+    return np.bincount(codes[valid], weights=weights, minlength=size)
+
+
+def group_count(codes, size):
+    """Rows per code (rows with code -1 are skipped)."""
+    return np.bincount(codes[codes >= 0], minlength=size)
+
+
+def safe_divide(numerator, denominator):
+    """numerator / denominator, 0 where the denominator is not positive."""
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    out = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+class SalesKernel:
+    """
+    SALES factorized once: transaction / seller / product codes plus the numeric columns.
+    Safe to share across sessions (read-only arrays).
+    """
+
+    def __init__(self, sales_df):
+        self.period_end = sales_df['date'].max()
+        self.amount = sales_df['line_amount'].to_numpy(dtype=float)
+        self.qty = sales_df['qty'].to_numpy(dtype=float)
+
+        self.txn_codes, self.txn_keys = factorize(sales_df['transaction_id'])
+        self.seller_codes, self.seller_keys = factorize(sales_df['seller_id'])
+        self.product_codes, self.product_keys = factorize(sales_df['product_desc'])
+
+        # First name seen per seller (drop_duplicates('seller_id') semantics)
+        valid = self.seller_codes >= 0
+        _, first_rows = np.unique(self.seller_codes[valid], return_index=True)
+        self.seller_names = sales_df['seller_name'].iloc[np.flatnonzero(valid)[first_rows]]
+
+        # (transaction, seller) pairs, for per-seller netting
+        pair_valid = (self.txn_codes >= 0) & valid
+        pair_keys = self.txn_codes.astype(np.int64) * len(self.seller_keys) + self.seller_codes
+        pair_uniques, pair_inverse = np.unique(pair_keys[pair_valid], return_inverse=True)
+        self.pair_codes = np.full(len(pair_keys), -1, dtype=np.int64)
+        self.pair_codes[pair_valid] = pair_inverse
+        self.pair_seller = (pair_uniques % max(len(self.seller_keys), 1)).astype(np.int64)
+
+    @property
+    def nbytes(self):
+        arrays = (self.amount, self.qty, self.txn_codes, self.seller_codes, self.product_codes,
+                  self.pair_codes, self.pair_seller)
+        return int(sum(a.nbytes for a in arrays))
+
+    def net_sales(self):
+        """Sum of positive transaction totals (returns netted within the transaction)."""
+        txn_net = group_sum(self.txn_codes, self.amount, len(self.txn_keys))
+        return txn_net[txn_net > 0].sum()
+
+    def seller_series(self):
+        """
+        Per-seller series indexed by seller_id, as get_seller_table joins them:
+        (names, sales, transactions, units).
+        """
+        n_sellers = len(self.seller_keys)
+        pair_net = group_sum(self.pair_codes, self.amount, len(self.pair_seller))
+        positive = pair_net > 0
+
+        txns = np.bincount(self.pair_seller[positive], minlength=n_sellers)
+        sales = np.bincount(self.pair_seller[positive], weights=pair_net[positive], minlength=n_sellers)
+
+        pos_qty = self.qty > 0
+        unit_codes = np.where(pos_qty, self.seller_codes, -1)
+        units = group_sum(unit_codes, self.qty, n_sellers)
+        has_units = group_count(unit_codes, n_sellers) > 0
+
+        index = self.seller_keys.rename('seller_id')
+        has_txns = txns > 0
+        return (
+            self.seller_names.set_axis(index),
+            pd.Series(sales[has_txns], index=index[has_txns], name='sales'),
+            pd.Series(txns[has_txns], index=index[has_txns], name='transactions'),
+            pd.Series(units[has_units], index=index[has_units], name='total_units')
+        )
+
+    def product_totals(self, by="qty"):
+        """
+        Per-product totals as a (product_desc, value) frame in key order.
+        'qty' sums positive quantities only; 'amount' sums every line.
+        """
+        if by == "qty":
+            codes = np.where(self.qty > 0, self.product_codes, -1)
+            values, column = self.qty, 'qty'
+        else:
+            codes = self.product_codes
+            values, column = self.amount, 'line_amount'
+
+        n_products = len(self.product_keys)
+        totals = group_sum(codes, values, n_products)
+        present = group_count(codes, n_products) > 0
+        return pd.DataFrame({
+            'product_desc': self.product_keys[present],
+            column: totals[present]
+        })
+
+
+class ItemsKernel:
+    """ITEMS factorized once: seller id / seller name / category codes plus the metrics."""
+
+    def __init__(self, items_df):
+        from services.kpi_tab2 import is_excluded_category
+        from services.kpi_tab3 import clean_category
+
+        self.values = {
+            metric: items_df[metric].to_numpy(dtype=float)
+            for metric in ('units', 'revenue') if metric in items_df.columns
+        }
+        self.seller_id_codes, self.seller_id_keys = factorize(items_df['seller_id'])
+        self.seller_name_codes, self.seller_name_keys = factorize(items_df['seller_name'])
+
+        # Category rules run once per distinct category, not once per row.
+        # A trailing entry for missing categories is picked up by code -1.
+        category_codes, categories = factorize(items_df['category_param12'])
+        excluded = np.array([is_excluded_category(c) for c in categories], dtype=bool)
+        self.excluded = np.append(excluded, is_excluded_category(np.nan))[category_codes]
+
+        clean = [clean_category(c) for c in categories]
+        self.clean_keys = np.array(sorted(set(clean) | {""}), dtype=object)
+        clean_codes = np.searchsorted(self.clean_keys, np.array(clean + [""], dtype=object))
+        self.clean_codes = clean_codes[category_codes]
+
+    @property
+    def nbytes(self):
+        arrays = (self.seller_id_codes, self.seller_name_codes, self.excluded, self.clean_codes,
+                  *self.values.values())
+        return int(sum(a.nbytes for a in arrays))
+
+    def complement_units(self):
+        """Units outside the excluded categories, per seller_id."""
+        codes = np.where(self.excluded, -1, self.seller_id_codes)
+        n_sellers = len(self.seller_id_keys)
+        present = group_count(codes, n_sellers) > 0
+        totals = group_sum(codes, self.values['units'], n_sellers)
+        return pd.Series(
+            totals[present], index=self.seller_id_keys[present].rename('seller_id'),
+            name='complement_units'
+        )
+
+    def category_matrix(self, categories, metric="units"):
+        """
+        seller_name x clean category sums over rows whose clean category is in `categories`
+        (pivot_table(index='seller_name', columns='clean_cat', aggfunc='sum', fill_value=0)).
+        """
+        allowed = np.isin(self.clean_keys, list(categories))
+        row_mask = allowed[self.clean_codes] & (self.seller_name_codes >= 0)
+        if not row_mask.any():
+            return pd.DataFrame()
+
+        n_cats = len(self.clean_keys)
+        flat = self.seller_name_codes[row_mask].astype(np.int64) * n_cats + self.clean_codes[row_mask]
+        size = len(self.seller_name_keys) * n_cats
+        sums = np.bincount(flat, weights=np.nan_to_num(self.values[metric][row_mask]), minlength=size)
+        counts = np.bincount(flat, minlength=size)
+        sums = sums.reshape(-1, n_cats)
+        counts = counts.reshape(-1, n_cats)
+
+        rows = counts.sum(axis=1) > 0
+        cols = counts.sum(axis=0) > 0
+        return pd.DataFrame(
+            sums[rows][:, cols],
+            index=self.seller_name_keys[rows].rename('seller_name'),
+            columns=pd.Index(self.clean_keys[cols], name='clean_cat')
+        )
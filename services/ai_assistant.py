@@ -1,7 +1,18 @@
+import os
+import random
+import threading
+import time
+
+import pandas as pd
 import streamlit as st
 
 from google.oauth2 import service_account
 
+# "vertex" (default) or "fake" - a local stand-in for offline runs and load tests
+AI_BACKEND = os.getenv("AI_BACKEND", "vertex")
+
+MODEL_NAME = "gemini-2.5-pro"
+
 # --- Helper: Init Vertex AI ---
 def init_vertex_ai():
     """Initializes Vertex AI with secrets."""
@@ -41,24 +52,145 @@ def init_vertex_ai():
     except Exception as e:
         return False, str(e)
 
-# --- Helper: Call Gemini ---
-def call_gemini(prompt):
-    success, msg = init_vertex_ai()
-    if not success:
-        return f"System Error: {msg}"
-    
-    try:
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) for prompt sizing."""
+    return max(len(text) // 4, 1)
+
+
+# --- Model Backends ---
+# A backend turns a prompt into text: generate(prompt) -> str.
+# Failures raise; BackendError carries the HTTP-like status (429 quota, 5xx).
+
+class BackendError(Exception):
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class BackendInitError(BackendError):
+    """Credentials / project configuration problem (not retryable)."""
+
+
+class VertexBackend:
+    """Gemini on Vertex AI (needs GEMINI_SERVICE_ACCOUNT_JSON or secrets)."""
+
+    name = "vertex"
+
+    def __init__(self, model_name=MODEL_NAME):
+        self.model_name = model_name
+
+    def generate(self, prompt):
+        success, msg = init_vertex_ai()
+        if not success:
+            raise BackendInitError(msg)
+
         from vertexai.generative_models import GenerativeModel
-        model = GenerativeModel("gemini-2.5-pro")
+        model = GenerativeModel(self.model_name)
         response = model.generate_content(prompt)
         return response.text
+
+
+class FakeBackend:
+    """
+    Local stand-in for Vertex: no credentials, no network.
+    Latency = fixed latency + output tokens / token rate.
+    error_rate injects quota (429) / unavailable (503) failures at random.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency=0.5, tokens_per_sec=0.0, output_tokens=400, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency=float(os.getenv("FAKE_AI_LATENCY", "0.5")),
+            tokens_per_sec=float(os.getenv("FAKE_AI_TOKENS_PER_SEC", "0")),
+            output_tokens=int(os.getenv("FAKE_AI_OUTPUT_TOKENS", "400")),
+            error_rate=float(os.getenv("FAKE_AI_ERROR_RATE", "0"))
+        )
+
+    def generate(self, prompt):
+        with self._lock:
+            self.calls += 1
+            roll = self._random.random()
+
+        delay = self.latency
+        if self.tokens_per_sec > 0:
+            delay += self.output_tokens / self.tokens_per_sec
+        time.sleep(delay)
+
+        if roll < self.error_rate:
+            code = 429 if roll < self.error_rate / 2 else 503
+            raise BackendError(f"fake backend injected error {code}", code=code)
+        return f"[fake] ניתוח לדוגמה ({len(prompt)} תווים בפרומפט)"
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Process-wide model backend, chosen by AI_BACKEND."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = FakeBackend.from_env() if AI_BACKEND == "fake" else VertexBackend()
+        return _backend
+
+
+def set_backend(backend):
+    """Replaces the process-wide backend (harnesses, offline runs)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+# --- Helper: Call Gemini ---
+def call_gemini(prompt, on_queue=None):
+    """
+    Generates through the shared gateway (services/ai_gateway): identical prompts
+    in flight are coalesced, rate/concurrency limited, 429/5xx retried.
+    on_queue(position) is called while the request waits its turn.
+    """
+    from services.ai_gateway import get_gateway
+    try:
+        return get_gateway().call(get_backend().generate, prompt, on_queue)
+    except BackendInitError as e:
+        return f"System Error: {e}"
     except Exception as e:
         return f"AI Error: {str(e)}"
 
 # --- Data Summarization ---
-def summarize_data(kpis, df_sellers, df_top_qty, df_top_amt, items_df):
+GENERAL_SELLER = "מוכרן כללי"
+
+def general_seller_totals(items_df):
+    """
+    (units, revenue) of the "מוכרן כללי" rows in ITEMS (the bonus budget, not a person).
+    Matched on normalized seller names (services/search_index), so quote / spacing variants count.
+    """
+    if items_df is None or items_df.empty:
+        return 0, 0
+    from services.search_index import SearchIndex
+
+    names = pd.unique(items_df['seller_name'].dropna())
+    matched = [names[i] for i in SearchIndex(names).search(GENERAL_SELLER)]
+    gen_seller = items_df[items_df['seller_name'].isin(matched)]
+    units = gen_seller['units'].sum()
+    revenue = gen_seller['revenue'].sum() if 'revenue' in gen_seller.columns else 0
+    return units, revenue
+
+def summarize_data(kpis, df_sellers, df_top_qty, df_top_amt, items_df, general_seller=None):
     """
     Creates a text summary of the store data for the AI.
+    general_seller: precomputed general_seller_totals(items_df) (e.g. once per dataset revision).
     """
     summary = []
     
@@ -74,14 +206,7 @@ def summarize_data(kpis, df_sellers, df_top_qty, df_top_amt, items_df):
         summary.append(f"Days left in month: {kpis.get('days_in_month', 30) - kpis.get('elapsed_days', 0)}")
     
     # 2. General Seller Stats (Bonus Logic)
-    gen_seller_units = 0
-    gen_seller_sales = 0
-    if items_df is not None and not items_df.empty:
-        # Search for "מוכרן כללי" or similar
-        gen_seller = items_df[items_df['seller_name'].str.contains("מוכרן כללי", na=False)]
-        gen_seller_units = gen_seller['units'].sum()
-        if 'revenue' in gen_seller.columns:
-            gen_seller_sales = gen_seller['revenue'].sum()
+    gen_seller_units, gen_seller_sales = general_seller or general_seller_totals(items_df)
     
     summary.append(f"General Seller Units ('מוכרן כללי'): {gen_seller_units}")
     summary.append(f"General Seller Sales (Revenue): {gen_seller_sales}")
@@ -107,9 +232,15 @@ def summarize_data(kpis, df_sellers, df_top_qty, df_top_amt, items_df):
 
 
 # --- Mode 1: Management Analysis ---
-def generate_management_analysis(kpis, df_sellers, df_top_qty, df_top_amt, items_df):
+def generate_management_analysis(kpis, df_sellers, df_top_qty, df_top_amt, items_df, on_queue=None,
+                                 general_seller=None):
+    prompt = build_management_prompt(kpis, df_sellers, df_top_qty, df_top_amt, items_df, general_seller)
+    return call_gemini(prompt, on_queue)
+
+
+def build_management_prompt(kpis, df_sellers, df_top_qty, df_top_amt, items_df, general_seller=None):
     data_summary = summarize_data(
-        kpis, df_sellers, df_top_qty, df_top_amt, items_df
+        kpis, df_sellers, df_top_qty, df_top_amt, items_df, general_seller
     )
 
     prompt = f"""
@@ -162,12 +293,18 @@ STRUCTURE:
    - If Tx Count is low -> Focus on "Approaching customers" (יוזמה).
 
 """
-    return call_gemini(prompt)
+    return prompt
 
 
 # --- Mode 2: Team Message ---
-def generate_team_message(topic, tone, kpis, df_sellers, df_top_qty, df_top_amt, items_df):
-    data_summary = summarize_data(kpis, df_sellers, df_top_qty, df_top_amt, items_df)
+def generate_team_message(topic, tone, kpis, df_sellers, df_top_qty, df_top_amt, items_df, on_queue=None,
+                          general_seller=None):
+    prompt = build_team_message_prompt(topic, tone, kpis, df_sellers, df_top_qty, df_top_amt, items_df, general_seller)
+    return call_gemini(prompt, on_queue)
+
+
+def build_team_message_prompt(topic, tone, kpis, df_sellers, df_top_qty, df_top_amt, items_df, general_seller=None):
+    data_summary = summarize_data(kpis, df_sellers, df_top_qty, df_top_amt, items_df, general_seller)
     
     prompt = f"""
     You are a Store Manager writing a WhatsApp message to your team.
@@ -187,4 +324,4 @@ def generate_team_message(topic, tone, kpis, df_sellers, df_top_qty, df_top_amt,
     - No salary mentions.
     - Focus on the chosen Topic and Tone.
     """
-    return call_gemini(prompt)
+    return prompt
@@ -0,0 +1,240 @@
+import os
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Process-wide gateway in front of the model backend (services/ai_assistant):
+#   - identical prompts already in flight are coalesced into one call
+#   - a token bucket caps the request rate, a slot count caps concurrency
+#   - excess requests wait in FIFO order and can report their queue position
+#   - quota (429) and server (5xx) errors are retried with jittered backoff
+RATE_PER_MINUTE = float(os.getenv("AI_RATE_PER_MIN", "30"))
+BURST = int(os.getenv("AI_BURST", "5"))
+MAX_CONCURRENT = int(os.getenv("AI_MAX_CONCURRENT", "4"))
+MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("AI_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = 30.0
+
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+
+def is_retryable(error):
+    """Quota and server errors (BackendError / google.api_core exceptions carry `.code`)."""
+    try:
+        return int(getattr(error, "code", 0) or 0) in RETRYABLE_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Takes a token. Returns 0 on success, else seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        if self.rate <= 0:
+            return 1.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # Leader's queue position, shared with the coalesced callers
+        self.position = None
+        self.changed = threading.Condition()
+
+    def report(self, position):
+        with self.changed:
+            self.position = position
+            self.changed.notify_all()
+
+    def finish(self):
+        self.done.set()
+        with self.changed:
+            self.changed.notify_all()
+
+    def wait(self, on_queue=None):
+        """Blocks until the leader is done, passing its queue positions to on_queue."""
+        reported = None
+        while True:
+            with self.changed:
+                while not self.done.is_set() and self.position == reported:
+                    self.changed.wait()
+                position = self.position
+            if self.done.is_set():
+                return
+            reported = position
+            if on_queue:
+                on_queue(position)
+
+
+class GeminiGateway:
+    """Single-flight, rate-limited and retrying front for model calls (see module comment)."""
+
+    def __init__(self, rate_per_minute=RATE_PER_MINUTE, burst=BURST, max_concurrent=MAX_CONCURRENT,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE):
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self.max_concurrent = max(max_concurrent, 1)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._active = 0
+
+        self._flights_lock = threading.Lock()
+        self._flights = {}
+
+        self.counters = {"calls": 0, "coalesced": 0, "retries": 0, "failures": 0}
+
+    def call(self, generate, prompt, on_queue=None):
+        """
+        Runs generate(prompt) through the gateway and returns its text.
+        Callers with the same prompt in flight share one call.
+        on_queue(position) is called (1 = next) whenever the request has to wait;
+        callers sharing a call are told the queue position of that call.
+        """
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.counters["calls"] += 1
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            flight.wait(on_queue)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            def report(position):
+                flight.report(position)
+                if on_queue:
+                    on_queue(position)
+
+            flight.result = self._execute(generate, prompt, report)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        except BaseException:
+            # Leader's script was interrupted (e.g. a rerun); waiters must not hang
+            flight.error = RuntimeError("request cancelled")
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.finish()
+
+    def _execute(self, generate, prompt, on_queue):
+        self._admit(on_queue)
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return generate(prompt)
+                except Exception as e:
+                    if attempt == self.max_retries or not is_retryable(e):
+                        with self._cond:
+                            self.counters["failures"] += 1
+                        raise
+                    delay = random.uniform(0, min(BACKOFF_MAX, self.backoff_base * 2 ** attempt))
+                    logger.warning(f"AI call failed ({e}), retry {attempt + 1} in {delay:.1f}s")
+                    with self._cond:
+                        self.counters["retries"] += 1
+                    time.sleep(delay)
+                    # Retries are requests too: they draw from the rate bucket
+                    self._wait_for_token()
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def _admit(self, on_queue):
+        """
+        Blocks until this request is at the head of the queue, a slot is free and the bucket has a token.
+        on_queue runs outside the lock (it may render UI), then the queue is checked again.
+        """
+        ticket = object()
+        reported = None
+        with self._cond:
+            self._queue.append(ticket)
+        try:
+            while True:
+                report = None
+                with self._cond:
+                    position = self._queue.index(ticket)
+                    wait = None
+                    if position == 0 and self._active < self.max_concurrent:
+                        wait = self.bucket.take()
+                        if wait == 0:
+                            self._queue.popleft()
+                            self._active += 1
+                            self._cond.notify_all()
+                            return
+                    if on_queue and position + 1 != reported:
+                        report = reported = position + 1
+                    else:
+                        self._cond.wait(timeout=wait if wait else 1.0)
+                if report is not None:
+                    on_queue(report)
+        except BaseException:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                self._cond.notify_all()
+            raise
+
+    def _wait_for_token(self):
+        with self._cond:
+            while True:
+                wait = self.bucket.take()
+                if wait == 0:
+                    return
+                self._cond.wait(timeout=wait)
+
+    def stats(self):
+        with self._cond:
+            return {**self.counters, "active": self._active, "queued": len(self._queue)}
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """Process-wide gateway (shared by every session)."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = GeminiGateway()
+        return _gateway
+
+
+def set_gateway(gateway):
+    """Replaces the process-wide gateway (harnesses)."""
+    global _gateway
+    with _gateway_lock:
+        _gateway = gateway
@@ -0,0 +1,115 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Normalized branch frames persisted as uncompressed Arrow IPC files and reopened
+# memory-mapped: every Streamlit process on the host maps the same page-cache
+# pages instead of holding a private copy, and a branch already loaded by
+# another process opens in milliseconds:
+#   <ARROW_CACHE_DIR>/<branch>/<revision hash>/{items,sales}.arrow
+# Numeric / datetime columns without nulls and all text columns (as pyarrow
+# backed strings) stay zero-copy; only the row index is materialized.
+# Set ARROW_CACHE_DIR to a directory shared by the processes (e.g. /dev/shm/kpi).
+ARROW_CACHE_DIR = os.getenv("ARROW_CACHE_DIR")
+ENABLED = bool(ARROW_CACHE_DIR)
+
+DATASETS = ("items", "sales")  # sales last: it carries the metadata and marks the revision complete
+METADATA_KEY = b"kpi_dataset"
+
+
+def _revision_dir(branch, revision, root=None):
+    digest = hashlib.sha1(revision.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(root or ARROW_CACHE_DIR, branch, digest)
+
+
+def _string_dtype():
+    """pyarrow-backed str dtype (the pandas 3 default) - wraps Arrow buffers without copying."""
+    try:
+        return pd.StringDtype("pyarrow", na_value=np.nan)
+    except (TypeError, ImportError):
+        return None
+
+
+def _read(path):
+    import pyarrow as pa
+
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    string_dtype = _string_dtype()
+
+    def types_mapper(arrow_type):
+        if string_dtype is not None and (pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type)):
+            return string_dtype
+        return None
+
+    # split_blocks: one block per column, so columns are not consolidated (copied)
+    df = table.to_pandas(split_blocks=True, types_mapper=types_mapper)
+    return df, table.schema.metadata or {}
+
+
+def _write(path, df, metadata=None):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    if metadata:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def load(branch, revision, root=None):
+    """
+    Memory-mapped frames of a stored revision.
+
+    Returns:
+        (sales_df, items_df, loaded_files) or None if the revision is not stored.
+    """
+    folder = _revision_dir(branch, revision, root)
+    paths = {name: os.path.join(folder, f"{name}.arrow") for name in DATASETS}
+    if not all(os.path.exists(path) for path in paths.values()):
+        return None
+    try:
+        items_df, _ = _read(paths["items"])
+        sales_df, metadata = _read(paths["sales"])
+        info = json.loads(metadata.get(METADATA_KEY, b"{}"))
+    except Exception as e:
+        logger.warning(f"Unreadable Arrow dataset {folder}: {e}")
+        return None
+    if info.get("revision") != revision:
+        return None
+    return sales_df, items_df, info.get("loaded_files", [])
+
+
+def save(branch, revision, sales_df, items_df, loaded_files, root=None):
+    """
+    Stores a freshly loaded revision (replacing the branch's older ones) and returns
+    its memory-mapped frames (sales_df, items_df), so this process drops its private copy.
+    """
+    folder = _revision_dir(branch, revision, root)
+    os.makedirs(folder, exist_ok=True)
+    metadata = {METADATA_KEY: json.dumps({"revision": revision, "loaded_files": loaded_files}).encode("utf-8")}
+    _write(os.path.join(folder, "items.arrow"), items_df)
+    _write(os.path.join(folder, "sales.arrow"), sales_df, metadata)
+
+    # Older revisions: processes still mapping them keep their pages until they unmap
+    branch_dir = os.path.dirname(folder)
+    for name in os.listdir(branch_dir):
+        if os.path.join(branch_dir, name) != folder:
+            shutil.rmtree(os.path.join(branch_dir, name), ignore_errors=True)
+
+    stored = load(branch, revision, root)
+    if stored is None:
+        return sales_df, items_df
+    logger.info(f"Stored {branch} as memory-mapped Arrow ({folder})")
+    return stored[0], stored[1]
+
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+# Market-basket co-occurrence over SALES, built once per dataset revision from
+# the factorized SalesKernel codes. The transaction x product incidence matrix
+# is kept in coordinate form (one entry per distinct (transaction, product)
+# with a positive quantity). Its product with itself (pair counts, A.T @ A) is
+# computed by expanding every basket into its product pairs with numpy, so
+# there is no per-transaction Python loop.
+# Baskets larger than MAX_BASKET (bulk / inventory transactions) are left out
+# of the pairs: they add k^2 pairs each and say little about what sells together.
+MAX_BASKET = 50
+# Pairs seen in fewer transactions are not reported (lift of a single basket is noise)
+MIN_PAIR_COUNT = 2
+
+
+class BasketIndex:
+    """
+    Product pair co-occurrence of one SALES frame.
+    Pairs are stored in both directions, grouped by product and ranked by
+    shared transactions, then lift.
+    """
+
+    def __init__(self, kernel):
+        self.product_keys = kernel.product_keys
+        n_products = len(self.product_keys)
+
+        # Incidence entries, sorted by transaction then product
+        valid = (kernel.txn_codes >= 0) & (kernel.product_codes >= 0) & (kernel.qty > 0)
+        keys = np.unique(kernel.txn_codes[valid].astype(np.int64) * n_products + kernel.product_codes[valid])
+        txn, product = keys // n_products, keys % n_products
+
+        _, starts, sizes = np.unique(txn, return_index=True, return_counts=True)
+        self.n_transactions = len(starts)
+        self.product_txns = np.bincount(product, minlength=n_products)
+
+        first, second = _basket_pairs(starts, sizes)
+        pair_keys, counts = np.unique(product[first] * n_products + product[second], return_counts=True)
+        keep = counts >= MIN_PAIR_COUNT
+        a, b, counts = pair_keys[keep] // n_products, pair_keys[keep] % n_products, counts[keep]
+
+        # Both directions, then group by product: [offsets[p], offsets[p + 1]) are p's companions
+        a, b = np.concatenate([a, b]), np.concatenate([b, a])
+        counts = np.concatenate([counts, counts])
+        lift = counts * self.n_transactions / (self.product_txns[a] * self.product_txns[b])
+        order = np.lexsort((-lift, -counts, a))
+        self.companion = b[order]
+        self.counts = counts[order]
+        self.lift = lift[order]
+        self.offsets = np.searchsorted(a[order], np.arange(n_products + 1))
+
+        self._positions = {key: i for i, key in enumerate(self.product_keys)}
+
+    def products(self):
+        """Products with at least one companion, most transactions first."""
+        has_pairs = np.flatnonzero(np.diff(self.offsets) > 0)
+        ranked = has_pairs[np.argsort(-self.product_txns[has_pairs], kind="stable")]
+        return self.product_keys[ranked].tolist()
+
+    def transactions(self, product):
+        """Transactions containing `product` (with a positive quantity)."""
+        pos = self._positions.get(product)
+        return 0 if pos is None else int(self.product_txns[pos])
+
+    def companions(self, product, top=10):
+        """
+        Products bought together with `product` (empty frame if none):
+        shared transactions, share of the product's transactions and lift.
+        """
+        pos = self._positions.get(product)
+        if pos is None:
+            return _empty()
+        start, end = self.offsets[pos], min(self.offsets[pos + 1], self.offsets[pos] + top)
+        if start == end:
+            return _empty()
+        counts = self.counts[start:end]
+        return pd.DataFrame({
+            "מוצר נלווה": self.product_keys[self.companion[start:end]],
+            "עסקאות משותפות": counts,
+            "% מעסקאות המוצר": counts / self.product_txns[pos] * 100,
+            "תמיכה %": counts / self.n_transactions * 100,
+            "Lift": self.lift[start:end],
+        })
+
+    @property
+    def nbytes(self):
+        arrays = (self.product_txns, self.companion, self.counts, self.lift, self.offsets)
+        return int(sum(a.nbytes for a in arrays))
+
+
+def _basket_pairs(starts, sizes):
+    """
+    Incidence positions (first, second) of every product pair inside a basket,
+    each unordered pair once (first < second).
+    """
+    keep = (sizes >= 2) & (sizes <= MAX_BASKET)
+    starts, sizes = starts[keep], sizes[keep]
+
+    # Every entry p of a basket [s, s + k) pairs with the entries after it
+    entries = np.repeat(starts, sizes) + _ranges(sizes)
+    basket_end = np.repeat(starts + sizes, sizes)
+    partners = basket_end - entries - 1
+
+    first = np.repeat(entries, partners)
+    second = first + 1 + _ranges(partners)
+    return first, second
+
+
+def _ranges(lengths):
+    """Concatenated aranges: [3, 2] -> [0, 1, 2, 0, 1]."""
+    total = int(lengths.sum())
+    return np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+
+def _empty():
+    return pd.DataFrame(columns=["מוצר נלווה", "עסקאות משותפות", "% מעסקאות המוצר", "תמיכה %", "Lift"])
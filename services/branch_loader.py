@@ -0,0 +1,219 @@
+import logging
+
+import streamlit as st
+
+from services import arrow_store, dataset_registry, delta_ingest, folder_metadata, partitions
+from services.file_formats import FORMAT_PREFERENCE, candidate_names, detect_format, to_parquet_bytes
+from services.load_sales import load_and_normalize_sales
+from services.load_items import load_and_normalize_items
+
+logger = logging.getLogger(__name__)
+
+LOADERS = {
+    "sales": load_and_normalize_sales,
+    "items": load_and_normalize_items
+}
+
+# Datasets re-uploaded as "previous file + new rows" (see services/delta_ingest)
+DELTA_DATASETS = {"sales"}
+# Datasets whose parsed batches are reported while loading (see services/progressive)
+PROGRESSIVE_DATASETS = {"sales"}
+
+
+def pick_file(files, dataset):
+    """
+    Picks the fastest format available for a dataset.
+    A faster file is only used if it is not older than any slower one,
+    so a stale sidecar never hides a newly uploaded workbook.
+    """
+    by_fmt = {}
+    for f in files:
+        fmt = detect_format(f['name'])
+        if fmt and f['name'] == f"{dataset}.{fmt}":
+            by_fmt[fmt] = f
+
+    available = [fmt for fmt in FORMAT_PREFERENCE if fmt in by_fmt]
+    for i, fmt in enumerate(available):
+        modified = by_fmt[fmt].get('modifiedTime', '')
+        slower = [by_fmt[s].get('modifiedTime', '') for s in available[i + 1:]]
+        if all(modified >= other for other in slower):
+            return by_fmt[fmt]
+    return None
+
+
+def delta_key(source, folder_id, dataset):
+    """Identity of a branch file across reloads (see services/delta_ingest)."""
+    return (getattr(source, "cache_key", id(source)), folder_id, dataset)
+
+
+def load_dataset(source, folder_id, dataset, files, publish_sidecar=False, progress=None, on_batch=None):
+    """
+    Downloads and normalizes one dataset ('sales' / 'items') from a branch folder.
+    Optionally publishes a normalized Parquet sidecar after parsing a slower format.
+    `progress(dataset, fraction)` reports the download progress.
+    `on_batch(dataset, rows, rows_done, rows_total)` receives parsed batches of the
+    PROGRESSIVE_DATASETS while a single file is parsed (not for daily partitions).
+
+    Returns:
+        (DataFrame or None, loaded file name or None, [names of daily files that failed])
+    """
+    file = pick_file(files, dataset)
+
+    # Daily files (sales_2026-10-01.xlsx ...) unless the cumulative file is newer
+    parts = partitions.partition_files(files, dataset, pick_file) if dataset in partitions.PARTITIONED_DATASETS else []
+    if parts and (not file or partitions.newest(parts) >= file.get('modifiedTime', '')):
+        on_part = (lambda fraction: progress(dataset, fraction)) if progress else None
+        df, failed = partitions.load_partitioned(source, folder_id, dataset, parts, LOADERS[dataset], on_part)
+        if failed:
+            logger.warning(f"Could not load {len(failed)} daily {dataset} file(s) of folder {folder_id}: {failed}")
+            st.warning(f"לא ניתן לטעון {len(failed)} קבצים יומיים: {', '.join(failed)}")
+        loaded = [(day, f) for day, f in parts if f['name'] not in failed]
+        return df, partitions.describe(dataset, loaded) if df is not None else None, failed
+
+    if not file:
+        logger.warning(f"No {dataset} file in folder {folder_id}")
+        st.warning(f"קובץ '{dataset}' לא נמצא בתיקייה.")
+        return None, None, []
+
+    fmt = detect_format(file['name'])
+    try:
+        on_chunk = (lambda fraction: progress(dataset, fraction)) if progress else None
+        file_content = source.download(file, progress=on_chunk)
+    except Exception as e:
+        logger.error(f"Error downloading {file['name']}: {e}")
+        st.error(f"שגיאה בהורדת הקובץ: {e}")
+        return None, None, []
+    kwargs = {}
+    if dataset in DELTA_DATASETS:
+        kwargs['delta_key'] = delta_key(source, folder_id, dataset)
+    if on_batch and dataset in PROGRESSIVE_DATASETS:
+        kwargs['on_batch'] = lambda rows, done, total: on_batch(dataset, rows, done, total)
+    df = LOADERS[dataset](file_content, fmt, **kwargs)
+
+    if df is not None and publish_sidecar and fmt != "parquet":
+        sidecar_name = f"{dataset}.parquet"
+        existing = next((f for f in files if f['name'] == sidecar_name), None)
+        try:
+            source.publish(folder_id, sidecar_name, to_parquet_bytes(df), existing)
+            logger.info(f"Published sidecar {sidecar_name} for folder {folder_id}")
+        except Exception as e:
+            # Sidecars are an optimization; never fail the load because of them
+            logger.warning(f"Failed to publish sidecar {sidecar_name}: {e}")
+
+    return df, file['name'], []
+
+
+def sidecar_names(files):
+    """
+    Names of the Parquet sidecars among a folder's files: a .parquet next to a
+    slower file of the same name (sales.parquet beside sales.xlsx). A Parquet file
+    without such a source is itself the branch's source.
+    """
+    stems = {f['name'][:-len(fmt) - 1] for f in files
+             if (fmt := detect_format(f['name'])) and fmt != "parquet"}
+    return {f['name'] for f in files
+            if detect_format(f['name']) == "parquet" and f['name'][:-len(".parquet")] in stems}
+
+
+def folder_revision(files):
+    """
+    Revision id of a branch folder: changes whenever any source file changes.
+    Sidecars are excluded, so publishing one does not bump the revision.
+    """
+    sidecars = sidecar_names(files)
+    return "|".join(sorted(f"{f['name']}@{f.get('modifiedTime', '')}" for f in files if f['name'] not in sidecars))
+
+
+def branch_file_names():
+    """Every file name a branch folder's sales/items may be stored under."""
+    return candidate_names("sales") + candidate_names("items")
+
+
+def list_branch_files(source, folder_id, max_age=None):
+    """
+    All candidate sales/items files of a branch folder, daily partition files included
+    (cached, see services/folder_metadata).
+    """
+    return folder_metadata.folder_files(source, folder_id, branch_file_names(), max_age, partitions.name_prefixes())
+
+
+def list_many_branches(source, folder_ids, max_age=None):
+    """list_branch_files for many folders at once, in batched metadata queries."""
+    return folder_metadata.resolve(source, folder_ids, branch_file_names(), max_age, partitions.name_prefixes())
+
+
+def load_branch(source, folder_id, publish_sidecars=False, files=None, progress=None, on_batch=None):
+    """
+    Loads both datasets of a branch folder, listing the folder once
+    (or reusing `files` from list_branch_files).
+
+    Returns:
+        (df_sales, df_items, [loaded file names], revision)
+        Daily files that failed to load are left out of the revision, so the
+        next refresh of the folder (same listing) loads again and retries them.
+    """
+    if files is None:
+        files = list_branch_files(source, folder_id)
+
+    df_sales, sales_name, sales_failed = load_dataset(source, folder_id, "sales", files, publish_sidecars, progress, on_batch)
+    df_items, items_name, items_failed = load_dataset(source, folder_id, "items", files, publish_sidecars, progress, on_batch)
+
+    loaded = [name for name in (sales_name, items_name) if name]
+    failed = set(sales_failed + items_failed)
+    return df_sales, df_items, loaded, folder_revision([f for f in files if f['name'] not in failed])
+
+
+def share_frames(branch, revision, df_sales, df_items, loaded_files):
+    """
+    Stores a fresh load in the Arrow store (if enabled) and returns its memory-mapped
+    frames, so processes on the host share one copy; else returns the frames as given.
+    """
+    if not arrow_store.ENABLED:
+        return df_sales, df_items
+    try:
+        return arrow_store.save(branch, revision, df_sales, df_items, loaded_files)
+    except Exception as e:
+        # The in-memory frames still work; sharing is an optimization
+        logger.warning(f"Failed to store {branch} as Arrow: {e}")
+        return df_sales, df_items
+
+
+def load_branch_cached(source, branch, folder_id, publish_sidecars=False, on_loaded=None, files=None,
+                       progress=None, on_batch=None):
+    """
+    Serves a branch from the process-wide dataset registry when its folder revision
+    is already registered (or from the Arrow store when another process loaded it);
+    otherwise loads it and publishes it as the latest revision.
+    `on_loaded(branch, revision, df_sales, df_items)` runs after a fresh load.
+
+    Returns:
+        (df_sales, df_items, [loaded file names], revision)
+    """
+    if files is None:
+        files = list_branch_files(source, folder_id)
+    revision = folder_revision(files)
+
+    cached = dataset_registry.get(branch, revision)
+    if cached:
+        return cached['sales_df'], cached['items_df'], cached['loaded_files'], revision
+
+    # Loaded by another process on this host: just map it
+    stored = arrow_store.load(branch, revision) if arrow_store.ENABLED else None
+    if stored is not None:
+        df_sales, df_items, loaded = stored
+        dataset_registry.publish(branch, revision, df_sales, df_items, loaded)
+        return df_sales, df_items, loaded, revision
+
+    df_sales, df_items, loaded, revision = load_branch(source, folder_id, publish_sidecars, files, progress, on_batch)
+    if df_sales is not None and df_items is not None:
+        df_sales, df_items = share_frames(branch, revision, df_sales, df_items, loaded)
+        delta_ingest.rebind(delta_key(source, folder_id, "sales"), df_sales)
+        dataset_registry.publish(branch, revision, df_sales, df_items, loaded)
+        memory = dataset_registry.process_memory()
+        logger.info(
+            f"Loaded {branch}: process rss={memory['rss'] / 1e6:.0f} MB pss={memory['pss'] / 1e6:.0f} MB "
+            f"shared={memory['shared'] / 1e6:.0f} MB"
+        )
+        if on_loaded:
+            on_loaded(branch, revision, df_sales, df_items)
+    return df_sales, df_items, loaded, revision
@@ -0,0 +1,269 @@
+import os
+import sys
+import threading
+import time
+import logging
+import weakref
+from collections import OrderedDict
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Process-wide registry of normalized branch datasets, keyed by (branch, revision).
+# Sessions hold a DatasetLease (a reference to shared read-only frames) instead
+# of their own copies. Unreferenced datasets are evicted LRU-first once the
+# total size exceeds the memory budget.
+MEMORY_BUDGET_BYTES = int(float(os.getenv("DATASET_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024)
+
+# Shared frames must never be mutated in place; with copy-on-write any
+# session-side modification gets its own copy (always on from pandas 3).
+try:
+    pd.set_option("mode.copy_on_write", True)
+except (KeyError, ValueError, pd.errors.OptionError):
+    pass
+
+_lock = threading.RLock()
+_entries = {}   # (branch, revision) -> entry dict
+_latest = {}    # branch -> newest published revision
+_evict_listeners = []  # called with each evicted entry (under _lock)
+
+
+def frame_nbytes(df):
+    """Deep memory size of a DataFrame (0 for None)."""
+    if df is None:
+        return 0
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def object_nbytes(obj):
+    """Best-effort size of a derived object: DataFrames deep, else its `nbytes` attribute."""
+    if isinstance(obj, pd.DataFrame):
+        return frame_nbytes(obj)
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True, index=True))
+    return int(getattr(obj, "nbytes", 0) or 0)
+
+
+class DatasetLease:
+    """
+    A session's reference to a shared dataset. Released explicitly when the
+    session switches revision, or automatically when the session is dropped.
+    """
+
+    def __init__(self, entry):
+        self.branch = entry['branch']
+        self.revision = entry['revision']
+        self.sales_df = entry['sales_df']
+        self.items_df = entry['items_df']
+        self.loaded_files = entry['loaded_files']
+        self._entry = entry
+        self._finalizer = weakref.finalize(self, _release, (self.branch, self.revision))
+
+    def release(self):
+        self._finalizer()
+
+    def derived(self, name, build, group=None, keep=None):
+        """
+        Per-revision derived object (index, table...), built once by `build()`
+        and shared by every session holding this revision.
+        Objects of the same `group` (e.g. one table for different params) are
+        kept for the `keep` most recently used names only.
+        """
+        entry = self._entry
+        with entry['derived_lock']:
+            if name not in entry['derived']:
+                obj = build()
+                entry['derived'][name] = obj
+                with _lock:
+                    entry['nbytes'] += object_nbytes(obj)
+            if group is not None:
+                names = entry['derived_groups'].setdefault(group, OrderedDict())
+                names[name] = None
+                names.move_to_end(name)
+                while len(names) > keep:
+                    stale, _ = names.popitem(last=False)
+                    obj = entry['derived'].pop(stale)
+                    with _lock:
+                        entry['nbytes'] -= object_nbytes(obj)
+            return entry['derived'][name]
+
+    @property
+    def released(self):
+        return not self._finalizer.alive
+
+
+def _release(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry:
+            entry['refcount'] = max(entry['refcount'] - 1, 0)
+            entry['last_used'] = time.monotonic()
+        _evict()
+
+
+def publish(branch, revision, sales_df, items_df, loaded_files):
+    """Adds a dataset revision (no-op if present) and marks it as the branch's latest."""
+    key = (branch, revision)
+    with _lock:
+        if key not in _entries:
+            _entries[key] = {
+                "branch": branch,
+                "revision": revision,
+                "sales_df": sales_df,
+                "items_df": items_df,
+                "loaded_files": loaded_files,
+                "nbytes": frame_nbytes(sales_df) + frame_nbytes(items_df),
+                "refcount": 0,
+                "last_used": time.monotonic(),
+                "derived": {},
+                "derived_groups": {},
+                "derived_lock": threading.RLock()
+            }
+        _latest[branch] = revision
+        # Never evict what was just published (it is about to be used)
+        _evict(protect=key)
+
+
+def get(branch, revision=None):
+    """Entry for (branch, revision) - or the branch's latest revision - or None."""
+    with _lock:
+        revision = revision or _latest.get(branch)
+        entry = _entries.get((branch, revision))
+        if entry:
+            entry['last_used'] = time.monotonic()
+        return entry
+
+
+def latest_revision(branch):
+    with _lock:
+        return _latest.get(branch)
+
+
+def acquire(branch, revision=None):
+    """Lease on (branch, revision) - or the latest revision - or None if not registered."""
+    with _lock:
+        entry = get(branch, revision)
+        if entry is None:
+            return None
+        entry['refcount'] += 1
+        return DatasetLease(entry)
+
+
+def acquire_or_publish(branch, revision, sales_df, items_df, loaded_files):
+    """Leases the registered dataset, publishing the given frames first if needed."""
+    with _lock:
+        lease = acquire(branch, revision)
+        if lease is None:
+            publish(branch, revision, sales_df, items_df, loaded_files)
+            lease = acquire(branch, revision)
+        return lease
+
+
+def add_evict_listener(listener):
+    """Registers listener(entry), called (under the registry lock) for every entry dropped."""
+    with _lock:
+        _evict_listeners.append(listener)
+
+
+def _dropped(entry):
+    for listener in _evict_listeners:
+        listener(entry)
+
+
+def _evict(protect=None):
+    """
+    Drops unreferenced superseded revisions, then unreferenced datasets
+    (least recently used first) while over the memory budget.
+    Caller holds _lock.
+    """
+    for key, entry in list(_entries.items()):
+        if entry['refcount'] == 0 and _latest.get(key[0]) != key[1]:
+            del _entries[key]
+            _dropped(entry)
+
+    total = sum(e['nbytes'] for e in _entries.values())
+    if total <= MEMORY_BUDGET_BYTES:
+        return
+
+    idle = sorted(
+        (e for e in _entries.values()
+         if e['refcount'] == 0 and (e['branch'], e['revision']) != protect),
+        key=lambda e: e['last_used']
+    )
+    for entry in idle:
+        if total <= MEMORY_BUDGET_BYTES:
+            break
+        key = (entry['branch'], entry['revision'])
+        del _entries[key]
+        if _latest.get(key[0]) == key[1]:
+            del _latest[key[0]]
+        total -= entry['nbytes']
+        _dropped(entry)
+        logger.info(f"Evicted dataset {key[0]} ({entry['nbytes'] / 1e6:.1f} MB) - memory budget")
+
+    if total > MEMORY_BUDGET_BYTES:
+        logger.warning(
+            f"Datasets in use ({total / 1e6:.1f} MB) exceed the memory budget "
+            f"({MEMORY_BUDGET_BYTES / 1e6:.1f} MB)"
+        )
+
+
+def free_bytes():
+    """Room left in the memory budget before anything would be evicted."""
+    with _lock:
+        return MEMORY_BUDGET_BYTES - sum(e['nbytes'] for e in _entries.values())
+
+
+def process_memory():
+    """
+    This process's memory in bytes: rss, pss (shared pages split between the processes
+    mapping them), shared and private. Linux only; elsewhere just the peak rss.
+    """
+    fields = {"Rss": "rss", "Pss": "pss", "Shared_Clean": "shared", "Shared_Dirty": "shared",
+              "Private_Clean": "private", "Private_Dirty": "private"}
+    memory = {"rss": 0, "pss": 0, "shared": 0, "private": 0}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    memory[fields[name]] += int(value.split()[0]) * 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memory["rss"] = peak if sys.platform == "darwin" else peak * 1024
+    return memory
+
+
+def entries():
+    """Snapshot of the registered entries (the dicts themselves; do not mutate)."""
+    with _lock:
+        return list(_entries.values())
+
+
+def stats():
+    """
+    Registry totals, per-dataset sizes / reference counts, the delta ingestion states
+    beyond the registered frames (services/delta_ingest) and this process's memory.
+    """
+    from services import delta_ingest
+    with _lock:
+        entries = [
+            {
+                "branch": e['branch'],
+                "revision": e['revision'],
+                "nbytes": e['nbytes'],
+                "refcount": e['refcount'],
+                "latest": _latest.get(e['branch']) == e['revision']
+            }
+            for e in _entries.values()
+        ]
+        sales_frames = [e['sales_df'] for e in _entries.values()]
+    return {
+        "total_bytes": sum(e['nbytes'] for e in entries),
+        "budget_bytes": MEMORY_BUDGET_BYTES,
+        "datasets": entries,
+        "delta_state_bytes": delta_ingest.state_nbytes(sales_frames),
+        "process": process_memory()
+    }
@@ -0,0 +1,277 @@
+import os
+import io
+import sys
+import gzip
+import hashlib
+import logging
+import threading
+import zipfile
+from collections import OrderedDict
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+from services import dataset_registry, excel_reader
+from services.file_formats import read_columns, read_raw_columns
+
+logger = logging.getLogger(__name__)
+
+# Daily exports are the previous file plus appended rows. For every file key
+# (source, folder, dataset) we remember how many rows were ingested and the
+# length + SHA-256 of the bytes they came from (CSV text; for XLSX the
+# <sheetData> XML and the shared strings table). On reload, if the new bytes
+# start with exactly those bytes, only the bytes after them are parsed and the
+# rows appended to the previous normalized frame. Anything else (edited or
+# removed rows, a rewritten workbook, other formats) is a full parse.
+ENABLED = os.getenv("DELTA_INGEST", "1") == "1"
+# Remembered states kept (least recently ingested dropped first); a state is also
+# dropped when the dataset registry evicts the frame it holds
+DELTA_STATE_BYTES = int(float(os.getenv("DELTA_STATE_MB", "256")) * 1024 * 1024)
+
+_lock = threading.Lock()
+_states = OrderedDict()  # key -> IngestState
+
+
+class IngestState:
+    """What was ingested last time for one file key."""
+
+    def __init__(self, signature, rows, regions, df, shared=None, previous=None):
+        self.signature = signature  # (fmt, columns, kinds): a different layout never matches
+        self.rows = rows            # raw data rows, including rows later dropped by `clean`
+        self.regions = regions      # {region name: (byte length, sha256 hex)}
+        self.df = df                # normalized frame (shared, never mutated)
+        self.shared = shared        # XLSX shared strings resolved so far (None until needed)
+        # Sizes of the frame and the shared strings; after `previous` only what was appended is measured
+        if previous is None:
+            self.frame_bytes = dataset_registry.frame_nbytes(df)
+            self.strings_bytes = sum(map(sys.getsizeof, shared or ()))
+        else:
+            self.frame_bytes = previous.frame_bytes + dataset_registry.frame_nbytes(df.iloc[len(previous.df):])
+            self.strings_bytes = previous.strings_bytes + sum(map(sys.getsizeof, (shared or [])[len(previous.shared or ()):]))
+
+    @property
+    def nbytes(self):
+        return self.frame_bytes + self.strings_bytes
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _read_bytes(file_content):
+    if isinstance(file_content, (bytes, bytearray)):
+        return bytes(file_content)
+    file_content.seek(0)
+    data = file_content.read()
+    file_content.seek(0)
+    return data
+
+
+class _CsvFile:
+    """Decompressed CSV text; the whole file is one region."""
+
+    def __init__(self, file_content, fmt):
+        data = _read_bytes(file_content)
+        if fmt == "csv.gz":
+            data = gzip.decompress(data)
+        if not data.endswith(b"\n"):
+            # An unterminated last line could still grow; only whole lines can be a prefix
+            raise ValueError("last line is not terminated")
+        self.header = data[:data.index(b"\n") + 1]
+        self.regions = {"data": data}
+
+    def read_tail(self, previous, columns):
+        """(raw row positions, raw values) of the lines after the previous prefix."""
+        tail = self.regions["data"][previous.regions["data"][0]:]
+        if not tail:
+            return [], {}
+        raw = read_raw_columns(io.BytesIO(self.header + tail), columns, "csv")
+        count = len(next(iter(raw.values())))
+        return list(range(previous.rows, previous.rows + count)), raw
+
+
+class _XlsxFile:
+    """First sheet of a workbook: the <sheetData> rows and the shared strings are separate regions."""
+
+    def __init__(self, file_content, fmt):
+        self.file_content = file_content
+        sheet, shared = excel_reader.read_sheet_xml(file_content)
+        rows_start = sheet.index(b"<sheetData>") + len(b"<sheetData>")
+        # Opening <worksheet ...> tag with its namespace declarations, to wrap fragments in
+        self.sheet_open = sheet[:sheet.index(b">", sheet.index(b"<worksheet")) + 1]
+        self.regions = {"rows": sheet[rows_start:sheet.rindex(b"</sheetData>")]}
+        if shared:
+            sst_start = shared.index(b">", shared.index(b"<sst")) + 1
+            self.sst_open = shared[:sst_start]
+            self.regions["sst"] = shared[sst_start:shared.rindex(b"</sst>")]
+
+    def _shared_strings(self, previous):
+        """Shared strings of the new file, parsing only the ones added since `previous`."""
+        sst = self.regions.get("sst", b"")
+        if previous.shared is not None and "sst" in previous.regions:
+            known, start = previous.shared, previous.regions["sst"][0]
+        else:
+            known, start = [], 0
+        if start == len(sst):
+            return known
+        return known + excel_reader.parse_shared_strings(self.sst_open + sst[start:] + b"</sst>")
+
+    def read_tail(self, previous, columns):
+        """(raw row positions, raw values) of the rows after the previous prefix."""
+        tail = self.regions["rows"][previous.regions["rows"][0]:]
+        self.shared = self._shared_strings(previous)
+        if not tail.strip():
+            return [], {}
+
+        header = excel_reader.sniff_header(self.file_content) or []
+        positions = {internal: header.index(raw) for raw, internal in columns.items()}
+        xml = self.sheet_open + b"<sheetData>" + tail + b"</sheetData></worksheet>"
+        row_numbers, raw = excel_reader.parse_sheet_rows(xml, positions, self.shared)
+        # Row 1 is the header, so sheet row r is data row r - 2
+        rows = [number - 2 for number in row_numbers]
+        if rows and (rows[0] < previous.rows or any(b <= a for a, b in zip(rows, rows[1:]))):
+            raise ValueError("appended rows are out of order")
+        return rows, raw
+
+
+FILE_TYPES = {
+    "csv": _CsvFile,
+    "csv.gz": _CsvFile,
+    "xlsx": _XlsxFile,
+}
+
+
+def _extends(previous, regions):
+    """True if every region of the new file starts with the bytes ingested last time."""
+    for name, (length, digest) in previous.regions.items():
+        data = regions.get(name)
+        if data is None or len(data) < length or _digest(memoryview(data)[:length]) != digest:
+            return False
+    return True
+
+
+def get_state(key):
+    with _lock:
+        return _states.get(key)
+
+
+def rebind(key, df):
+    """Points the remembered frame of `key` at an equal frame (e.g. its memory-mapped copy)."""
+    with _lock:
+        state = _states.get(key)
+        if state is not None and len(state.df) == len(df):
+            state.df = df
+
+
+def _forget_evicted(entry):
+    """Dataset registry eviction: the states holding its sales frame go with it."""
+    with _lock:
+        for key in [key for key, state in _states.items() if state.df is entry['sales_df']]:
+            del _states[key]
+            logger.info(f"Delta ingest {key}: state dropped with its evicted dataset")
+
+
+dataset_registry.add_evict_listener(_forget_evicted)
+
+
+def state_nbytes(registered=()):
+    """
+    Bytes held by the remembered states; frames in `registered` (e.g. the dataset
+    registry's sales frames, which the states usually share) are not counted.
+    """
+    skip = {id(df) for df in registered}
+    with _lock:
+        return sum(s.strings_bytes + (0 if id(s.df) in skip else s.frame_bytes) for s in _states.values())
+
+
+def _store(key, state):
+    """Remembers a state, dropping the least recently ingested ones over DELTA_STATE_BYTES. Caller holds _lock."""
+    _states[key] = state
+    _states.move_to_end(key)
+    total = sum(s.nbytes for s in _states.values())
+    while total > DELTA_STATE_BYTES and len(_states) > 1:
+        _, evicted = _states.popitem(last=False)
+        total -= evicted.nbytes
+
+
+def _append(previous, file, columns, kinds, clean):
+    """(frame, total raw rows) with the new rows appended, or None if a full parse is needed."""
+    rows, raw = file.read_tail(previous, columns)
+    if not rows:
+        return previous.df, previous.rows
+
+    tail = excel_reader.convert_columns(raw, kinds)
+    tail.index = pd.Index(rows)
+    tail = clean(tail)
+
+    df = previous.df
+    if not tail.empty:
+        if list(df.columns) != list(tail.columns):
+            return None
+        for col in df.columns:
+            if df[col].dtype == tail[col].dtype:
+                continue
+            if isinstance(df[col].dtype, pd.StringDtype) and tail[col].dtype == object:
+                # Memory-mapped frames (services/arrow_store) hold text as str
+                tail[col] = tail[col].astype(df[col].dtype)
+            elif df[col].dtype == "float64" and tail[col].dtype == "int64":
+                # A count column with blanks so far stays float64 in a full parse too
+                tail[col] = tail[col].astype("float64")
+            else:
+                # A type change (e.g. numeric ids so far, text ids in the new rows) needs a full parse
+                return None
+        df = pd.concat([df, tail])
+    return df, rows[-1] + 1
+
+
+def ingest(key, file_content, fmt, columns, kinds, clean, on_batch=None, batch_rows=None):
+    """
+    Normalized frame of a raw file, reusing the previous ingestion of `key` when the
+    file only gained rows at the end.
+
+    Args:
+        key: Identity of the file across reloads (e.g. (source, folder_id, dataset))
+        columns / kinds: As for file_formats.read_columns
+        clean: Row-wise cleanup applied to converted rows (must not depend on other rows)
+        on_batch / batch_rows: Progressive loading of a full parse (see excel_reader.convert_columns)
+
+    Returns:
+        DataFrame, indexed by raw row position exactly like a full parse.
+    """
+    signature = (fmt, tuple(columns.items()), tuple(sorted(kinds.items())))
+
+    file = None
+    file_type = FILE_TYPES.get(fmt)
+    if file_type is not None:
+        try:
+            file = file_type(file_content, fmt)
+        except (ValueError, KeyError, zipfile.BadZipFile, OSError) as e:
+            logger.info(f"Delta ingest {key}: not tracked ({e})")
+
+    result = appended_to = None
+    previous = get_state(key)
+    if file is not None and previous is not None and previous.signature == signature:
+        if _extends(previous, file.regions):
+            try:
+                result = _append(previous, file, columns, kinds, clean)
+            except (ValueError, KeyError, IndexError, ET.ParseError) as e:
+                logger.info(f"Delta ingest {key}: tail not appendable ({e}), full parse")
+            if result is not None:
+                appended_to = previous
+                logger.info(f"Delta ingest {key}: {result[1] - previous.rows} new row(s) after {previous.rows}")
+        else:
+            logger.info(f"Delta ingest {key}: prefix changed, full parse")
+
+    if result is None:
+        df = read_columns(file_content, columns, kinds, fmt, on_batch, batch_rows)
+        # One converted row per raw row: the raw row count is taken before `clean` drops any
+        result = clean(df), len(df)
+
+    df, rows = result
+    with _lock:
+        if file is None:
+            _states.pop(key, None)
+        else:
+            regions = {name: (len(data), _digest(data)) for name, data in file.regions.items()}
+            _store(key, IngestState(signature, rows, regions, df, getattr(file, "shared", None), appended_to))
+    return df
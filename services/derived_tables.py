@@ -0,0 +1,151 @@
+from collections import namedtuple
+
+from services import kpi_tab2, kpi_tab3, snapshot_archive, ticket_sketch, what_if
+from services.agg_kernel import ItemsKernel, SalesKernel
+from services.kpi_tab1 import kpis_from_actual
+
+# A derived table: names of its inputs (base frames, params or other tables)
+# and the function computing it from them, in that order.
+TableSpec = namedtuple("TableSpec", ["deps", "build"])
+
+# Base inputs of every graph; anything else in `deps` that is not a table is a param
+BASE_INPUTS = ("sales_df", "items_df")
+
+# Param values (e.g. targets) a param-dependent table stays memoized for, per revision
+PARAM_VARIANTS = 4
+
+
+def _seller_index(items_df):
+    from services.seller_index import SellerIndex
+    return SellerIndex(items_df)
+
+
+def _search_index(df, column):
+    from services.search_index import SearchIndex
+    return SearchIndex(df[column] if not df.empty else [])
+
+
+def _basket_index(kernel):
+    from services.basket import BasketIndex
+    return None if kernel is None else BasketIndex(kernel)
+
+
+def _general_seller(items_df):
+    from services.ai_assistant import general_seller_totals
+    return general_seller_totals(items_df)
+
+
+# In-memory graph (pandas over the shared frames)
+TABLES = {
+    # Factorized keys shared by every aggregation below (services/agg_kernel)
+    "sales_kernel": TableSpec(("sales_df",), lambda sales_df: None if sales_df.empty else SalesKernel(sales_df)),
+    # Over items_view, so the store graph pivots its own summary rows
+    "items_kernel": TableSpec(("items_view",), lambda items: None if items.empty else ItemsKernel(items)),
+    # Net sales to date and weekday pace, independent of the target (services/what_if)
+    "pace_base": TableSpec(("sales_df", "sales_kernel"), what_if.build_base),
+    # Only the target arithmetic reruns when the target changes (same result as calculate_kpis)
+    "kpis": TableSpec(
+        ("pace_base", "target"),
+        lambda base, target: None if base is None else kpis_from_actual(base.period_end, base.actual_to_date, target)
+    ),
+    "sellers": TableSpec(("sales_df", "items_df", "sales_kernel", "items_kernel"), kpi_tab2.get_seller_table),
+    "top_qty": TableSpec(("sales_df", "sales_kernel"), kpi_tab2.get_top_products_qty),
+    "top_amt": TableSpec(("sales_df", "sales_kernel"), kpi_tab2.get_top_products_amount),
+    "items_view": TableSpec(("items_df",), lambda items_df: items_df),
+    "seller_index": TableSpec(("items_df",), _seller_index),
+    # Substring search (services/search_index); positions map to the rows of the searched table
+    "seller_search": TableSpec(("sellers",), lambda sellers: _search_index(sellers, "שם מוכר")),
+    "product_totals": TableSpec(("sales_df", "sales_kernel"), kpi_tab2.get_product_totals),
+    "product_search": TableSpec(("product_totals",), lambda totals: _search_index(totals, "תיאור מוצר")),
+    "general_seller": TableSpec(("items_view",), _general_seller),
+    # Product pairs bought together (services/basket)
+    "basket": TableSpec(("sales_kernel",), _basket_index),
+    # Ticket-size sketches of the branch and each seller, and their median / p90 (services/ticket_sketch)
+    "ticket_sketches": TableSpec(("sales_kernel",), ticket_sketch.build),
+    "ticket_percentiles": TableSpec(
+        ("ticket_sketches",), lambda sketches: None if sketches is None else ticket_sketch.seller_percentiles(sketches)
+    ),
+    # Data month (YYYY-MM) and comparisons against archived months (services/snapshot_archive)
+    "month": TableSpec(("sales_df",), lambda sales_df: None if sales_df.empty else sales_df['date'].max().strftime("%Y-%m")),
+    "kpi_comparisons": TableSpec(("branch", "kpis"), snapshot_archive.kpi_comparisons),
+    "category_pivot": TableSpec(
+        ("items_view", "items_kernel"),
+        lambda items, kernel: kpi_tab3.build_category_pivot(items, metric="units", kernel=kernel)
+    ),
+}
+
+
+def _store_tables():
+    """Same tables answered by the SQLite store (services/sqlite_store)."""
+    from services import sqlite_store
+    return {
+        **TABLES,
+        "kpis": TableSpec(
+            ("branch", "period", "target"),
+            lambda branch, period, target: sqlite_store.query_kpis(branch, target, period)
+        ),
+        "sellers": TableSpec(("branch", "period"), sqlite_store.query_seller_table),
+        "top_qty": TableSpec(
+            ("branch", "period"), lambda branch, period: sqlite_store.query_top_products(branch, "qty", period)
+        ),
+        "top_amt": TableSpec(
+            ("branch", "period"), lambda branch, period: sqlite_store.query_top_products(branch, "amount", period)
+        ),
+        "items_view": TableSpec(("branch", "period"), sqlite_store.query_items_summary),
+    }
+
+
+# What each page renders up front. Anything else is only computed if the page asks for it.
+PAGE_TABLES = {
+    "status": ("kpis", "kpi_comparisons"),
+    "team": ("sellers", "seller_search", "top_qty", "top_amt", "month", "ticket_sketches", "ticket_percentiles"),
+    "mix": ("items_view", "seller_index", "month"),
+    "ai": ("kpis", "sellers", "top_qty", "top_amt", "items_view", "general_seller"),
+    "admin": (),
+}
+
+
+class DerivedTables:
+    """
+    Lazy view of the derived tables of one dataset revision.
+    A table is computed on first access (with its dependencies) and memoized on
+    the dataset lease, so it is shared by every session on that revision.
+    Tables depending on params (e.g. target) are memoized for the PARAM_VARIANTS
+    most recently used param values.
+    """
+
+    def __init__(self, lease, params=None, use_store=False):
+        self.lease = lease
+        self.inputs = {"sales_df": lease.sales_df, "items_df": lease.items_df, **(params or {})}
+        self.specs = _store_tables() if use_store else TABLES
+        self.mode = "store" if use_store else "memory"
+
+    def _params_of(self, name):
+        """Param inputs (not base frames, not tables) in the dependency closure of a table."""
+        params = set()
+        for dep in self.specs[name].deps:
+            if dep in self.specs:
+                params |= self._params_of(dep)
+            elif dep not in BASE_INPUTS:
+                params.add(dep)
+        return params
+
+    def get(self, name):
+        if name not in self.specs:
+            return self.inputs[name]
+        spec = self.specs[name]
+        params = tuple(sorted((p, self.inputs[p]) for p in self._params_of(name)))
+        key = ("table", self.mode, name, params)
+
+        def build():
+            return spec.build(*[self.get(dep) for dep in spec.deps])
+
+        if not params:
+            return self.lease.derived(key, build)
+        return self.lease.derived(key, build, group=("table", self.mode, name), keep=PARAM_VARIANTS)
+
+    __getitem__ = get
+
+    def page(self, page_key):
+        """Tables a page declared in PAGE_TABLES."""
+        return {name: self.get(name) for name in PAGE_TABLES[page_key]}
@@ -0,0 +1,201 @@
+import datetime
+import io
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Media downloads are streamed in chunks (HTTP Range requests) into a single buffer.
+# A chunk failing with a transient error is retried from the last byte received.
+DOWNLOAD_CHUNK_BYTES = int(float(os.getenv("DRIVE_CHUNK_MB", "8")) * 1024 * 1024)
+DOWNLOAD_RETRIES = int(os.getenv("DRIVE_DOWNLOAD_RETRIES", "5"))
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Folders per batched files().list query ('a' in parents or 'b' in parents ...)
+FOLDERS_PER_QUERY = int(os.getenv("DRIVE_FOLDERS_PER_QUERY", "25"))
+
+
+class DriveSource:
+    """
+    Branch folders on Google Drive.
+    Files are dicts as returned by files().list: {"id", "name", "modifiedTime"}.
+    """
+
+    # Metadata cache namespace (services/folder_metadata); folder ids are global on Drive
+    cache_key = "drive"
+
+    def __init__(self, service):
+        self.service = service
+
+    def list_files(self, folder_id, names, prefixes=()):
+        """
+        All non-trashed files in the folder whose name is one of `names` or starts
+        with one of `prefixes` (one query).
+        """
+        return self.list_folders([folder_id], names, prefixes).get(folder_id, [])
+
+    def list_folders(self, folder_ids, names, prefixes=()):
+        """
+        Same as list_files for many folders, batching up to FOLDERS_PER_QUERY
+        folders per query. Returns {folder_id: [files]}.
+        """
+        # 'contains' on name is a prefix match; the results are re-checked below
+        names_q = " or ".join([f"name = '{name}'" for name in names] +
+                              [f"name contains '{prefix}'" for prefix in prefixes])
+        by_folder = {folder_id: [] for folder_id in folder_ids}
+
+        for i in range(0, len(folder_ids), FOLDERS_PER_QUERY):
+            batch = folder_ids[i:i + FOLDERS_PER_QUERY]
+            parents_q = " or ".join(f"'{folder_id}' in parents" for folder_id in batch)
+            query = f"({names_q}) and ({parents_q}) and trashed = false"
+            page_token = None
+            while True:
+                results = self.service.files().list(
+                    q=query,
+                    fields="nextPageToken, files(id, name, modifiedTime, parents)",
+                    pageSize=1000,
+                    pageToken=page_token
+                ).execute()
+                for file in results.get('files', []):
+                    if file['name'] not in names and not file['name'].startswith(tuple(prefixes)):
+                        continue
+                    for parent in file.pop('parents', []):
+                        if parent in by_folder:
+                            by_folder[parent].append(file)
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+        return by_folder
+
+    def download(self, file, progress=None):
+        """
+        Returns a BytesIO with the file content, downloaded chunk by chunk straight
+        into it (no intermediate bytes copy). `progress(fraction)` is called per chunk.
+        """
+        from googleapiclient.http import MediaIoBaseDownload
+
+        request = self.service.files().get_media(fileId=file['id'])
+        file_content = io.BytesIO()
+        downloader = MediaIoBaseDownload(file_content, request, chunksize=DOWNLOAD_CHUNK_BYTES)
+
+        failures = 0
+        done = False
+        while not done:
+            try:
+                status, done = downloader.next_chunk(num_retries=DOWNLOAD_RETRIES)
+            except Exception as e:
+                # The downloader keeps its byte offset, so the next call resumes there
+                failures += 1
+                if failures > DOWNLOAD_RETRIES or not _is_transient(e):
+                    raise
+                logger.warning(f"Download of {file.get('name')} interrupted ({e}), resuming (attempt {failures})")
+                time.sleep(min(2 ** failures, 30))
+                continue
+            failures = 0
+            if progress and status and status.total_size:
+                progress(status.progress())
+
+        file_content.seek(0)
+        return file_content
+
+    def start_change_token(self):
+        """Page token for the Drive change feed, starting from now."""
+        return self.service.changes().getStartPageToken().execute()['startPageToken']
+
+    def changed_folders(self, page_token):
+        """
+        Follows changes.list from `page_token`.
+
+        Returns:
+            (set of parent folder ids touched, next page token).
+            The folder set is None if a change could not be mapped to a folder
+            (e.g. a removed file), meaning "check every folder".
+        """
+        folders = set()
+        while True:
+            resp = self.service.changes().list(
+                pageToken=page_token,
+                spaces="drive",
+                fields="nextPageToken, newStartPageToken, changes(fileId, removed, file(name, parents))"
+            ).execute()
+            for change in resp.get('changes', []):
+                parents = (change.get('file') or {}).get('parents')
+                if change.get('removed') or not parents:
+                    folders = None
+                elif folders is not None:
+                    folders.update(parents)
+            if 'newStartPageToken' in resp:
+                return folders, resp['newStartPageToken']
+            page_token = resp['nextPageToken']
+
+    def publish(self, folder_id, name, data, existing=None):
+        """Creates (or overwrites `existing`) a file in the folder. Needs a writable Drive scope."""
+        from googleapiclient.http import MediaIoBaseUpload
+        media = MediaIoBaseUpload(io.BytesIO(data), mimetype="application/octet-stream")
+        if existing:
+            self.service.files().update(fileId=existing['id'], media_body=media).execute()
+        else:
+            self.service.files().create(
+                body={"name": name, "parents": [folder_id]},
+                media_body=media,
+                fields="id"
+            ).execute()
+
+
+class LocalSource:
+    """
+    Local directory standing in for Drive: <root>/<folder_id>/<file name>.
+    Same interface as DriveSource, used for offline runs and harnesses.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.cache_key = ("local", os.path.abspath(root))
+
+    def list_folders(self, folder_ids, names, prefixes=()):
+        return {folder_id: self.list_files(folder_id, names, prefixes) for folder_id in folder_ids}
+
+    def list_files(self, folder_id, names, prefixes=()):
+        folder = os.path.join(self.root, folder_id)
+        if prefixes and os.path.isdir(folder):
+            names = list(names) + sorted(
+                name for name in os.listdir(folder) if name.startswith(tuple(prefixes)) and name not in names
+            )
+        files = []
+        for name in names:
+            path = os.path.join(folder, name)
+            if os.path.isfile(path):
+                files.append({"id": path, "name": name, "modifiedTime": _rfc3339(os.path.getmtime(path))})
+        return files
+
+    def download(self, file, progress=None):
+        with open(file['id'], "rb") as f:
+            file_content = io.BytesIO(f.read())
+        if progress:
+            progress(1.0)
+        return file_content
+
+    def publish(self, folder_id, name, data, existing=None):
+        folder = os.path.join(self.root, folder_id)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, name)
+        # Write then rename so readers never see a half-written file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+def _is_transient(error):
+    """Network failures and retryable HTTP statuses (rate limits, 5xx)."""
+    from googleapiclient.errors import HttpError
+    if isinstance(error, HttpError):
+        return error.resp.status in TRANSIENT_STATUS
+    return isinstance(error, (OSError, TimeoutError))
+
+
+def _rfc3339(timestamp):
+    """Drive-style modifiedTime ('2026-10-01T08:00:00.000Z'), comparable as a string."""
+    dt = datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
@@ -0,0 +1,574 @@
+import datetime
+import html
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+from python_calamine import CalamineWorkbook
+
+# Excel stores dates as days since 1899-12-30 (the 1900 leap-year bug baked in)
+EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+
+# Column kinds understood by read_columns:
+#   "id"    - numeric ids become int64 (float64 with NaN for blank cells), anything else
+#             becomes text (like pandas inference)
+#   "str"   - free text, empty cells become None
+#   "float" - numeric, unparseable cells become NaN
+#   "count" - numeric; int64 when every cell is an integer (like pandas inference), else float64
+#   "date"  - Excel dates, serial numbers or date strings -> datetime64
+COLUMN_KINDS = ("id", "str", "float", "count", "date")
+
+# SpreadsheetML namespaces (used by the header sniffer)
+NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+def open_sheet(file_content):
+    """
+    Opens the first sheet of an Excel workbook (path, bytes buffer or file object).
+    Cells are not converted to Python objects until they are read.
+    """
+    if hasattr(file_content, "seek"):
+        file_content.seek(0)
+    workbook = CalamineWorkbook.from_object(file_content)
+    return workbook.get_sheet_by_index(0)
+
+
+def sniff_header(file_content):
+    """
+    Reads the header row straight from the XLSX zip, streaming the sheet XML
+    only up to the end of the first row (the full sheet is never parsed).
+    Returns None if the file is not a plain XLSX, so callers can fall back
+    to read_header.
+    """
+    try:
+        if hasattr(file_content, "seek"):
+            file_content.seek(0)
+        with zipfile.ZipFile(file_content) as zf:
+            sheet_path = _first_sheet_path(zf)
+            with zf.open(sheet_path) as f:
+                cells = _first_row_cells(f)
+
+            shared_ids = [int(value) for kind, value in cells.values() if kind == "s"]
+            shared = _shared_strings(zf, max(shared_ids)) if shared_ids else []
+    except (zipfile.BadZipFile, KeyError, ValueError, ET.ParseError):
+        return None
+    finally:
+        if hasattr(file_content, "seek"):
+            file_content.seek(0)
+
+    if not cells:
+        return []
+
+    header = [""] * (max(cells) + 1)
+    for col, (kind, value) in cells.items():
+        header[col] = shared[int(value)] if kind == "s" else value
+    return [str(col).strip() for col in header]
+
+
+def _first_sheet_path(zf):
+    """Zip path of the first sheet in workbook order."""
+    workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+    first = workbook.find(f"{NS_MAIN}sheets/{NS_MAIN}sheet")
+    rel_id = first.get(f"{NS_REL}id")
+
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    for rel in rels.iter(f"{NS_PKG_REL}Relationship"):
+        if rel.get("Id") == rel_id:
+            target = rel.get("Target")
+            if target.startswith("/"):
+                return target.lstrip("/")
+            return posixpath.normpath(posixpath.join("xl", target))
+    raise KeyError(rel_id)
+
+
+def _column_index(ref):
+    """'A1' -> 0, 'AB1' -> 27"""
+    letters = re.match(r"[A-Z]+", ref).group(0)
+    idx = 0
+    for ch in letters:
+        idx = idx * 26 + (ord(ch) - 64)
+    return idx - 1
+
+
+def _first_row_cells(f):
+    """{column index: (cell type, raw text)} for the first <row> of a sheet stream."""
+    cells = {}
+    next_col = 0
+    for event, elem in ET.iterparse(f, events=("end",)):
+        if elem.tag == f"{NS_MAIN}c":
+            ref = elem.get("r")
+            col = _column_index(ref) if ref else next_col
+            next_col = col + 1
+            kind = elem.get("t", "n")
+            if kind == "inlineStr":
+                text = "".join(t.text or "" for t in elem.iter(f"{NS_MAIN}t"))
+            else:
+                v = elem.find(f"{NS_MAIN}v")
+                text = v.text if v is not None and v.text is not None else ""
+            if not (kind == "s" and text == ""):
+                cells[col] = (kind, text)
+        elif elem.tag == f"{NS_MAIN}row":
+            break
+    return cells
+
+
+def _shared_strings(zf, max_index):
+    """Shared strings 0..max_index, streamed (header strings are stored first)."""
+    strings = []
+    with zf.open("xl/sharedStrings.xml") as f:
+        for event, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag == f"{NS_MAIN}si":
+                strings.append("".join(t.text or "" for t in elem.iter(f"{NS_MAIN}t")))
+                elem.clear()
+                if len(strings) > max_index:
+                    break
+    if len(strings) <= max_index:
+        raise KeyError(max_index)
+    return strings
+
+
+def read_header(sheet):
+    """Returns the header row only, without touching the data rows."""
+    rows = sheet.to_python(nrows=1)
+    if not rows:
+        return []
+    return [str(col).strip() for col in rows[0]]
+
+
+def peek_header(file_content):
+    """
+    Header row for validation before any parsing.
+    Uses sniff_header and falls back to opening the sheet (e.g. for .xls).
+    """
+    header = sniff_header(file_content)
+    if header is None:
+        header = read_header(open_sheet(file_content))
+    return header
+
+
+def find_alias(header, aliases):
+    """Returns the first alias present in the header, or None."""
+    for alias in aliases:
+        if alias in header:
+            return alias
+    return None
+
+
+def read_columns(file_content, columns, kinds):
+    """
+    Parses only the requested columns of the first sheet.
+
+    Args:
+        file_content: Path, bytes buffer or file object
+        columns: {raw Excel name: internal name} - raw names must exist in the header
+        kinds: {internal name: one of COLUMN_KINDS}
+
+    Returns:
+        DataFrame with the internal column names, in the order of `columns`.
+    """
+    return convert_batches(iter_raw_columns(file_content, columns), kinds)
+
+
+def read_raw_columns(file_content, columns):
+    """
+    Raw cell values of the requested columns, without type conversion.
+
+    Returns:
+        {internal name: [cell values]} in the order of `columns` (header row excluded).
+    """
+    return merge_batches(iter_raw_columns(file_content, columns))
+
+
+def iter_raw_columns(file_content, columns, batch_rows=None):
+    """
+    Raw cell values of the requested columns, `batch_rows` rows at a time (all at once
+    by default), as soon as they are read.
+
+    XLSX sheets are scanned for the requested columns only (see _scan_sheet), and each
+    batch is yielded as soon as its rows are scanned. Other workbooks (.xls, unusual XML
+    layouts, or most of the columns requested) are opened with calamine, which loads the
+    whole sheet before the first row can be read; its rows are then batched.
+
+    Yields:
+        ({internal name: [cell values]}, total data rows)
+    """
+    batches = _scan_sheet(file_content, columns, batch_rows)
+    if batches is None:
+        batches = _stream_sheet(file_content, columns, batch_rows)
+    yield from batches
+
+
+def merge_batches(batches):
+    """One {internal name: [values]} of the batches yielded by iter_raw_columns."""
+    merged = None
+    for raw, _ in batches:
+        if merged is None:
+            merged = {internal: list(values) for internal, values in raw.items()}
+        else:
+            for internal, values in raw.items():
+                merged[internal].extend(values)
+    return merged or {}
+
+
+def slice_batches(raw, batch_rows=None):
+    """Batches of already-read raw values, shaped like iter_raw_columns."""
+    length = len(next(iter(raw.values()))) if raw else 0
+    if not batch_rows or length <= batch_rows:
+        yield raw, length
+        return
+    for start in range(0, length, batch_rows):
+        yield {internal: values[start:start + batch_rows] for internal, values in raw.items()}, length
+
+
+def _stream_sheet(file_content, columns, batch_rows=None):
+    """iter_raw_columns through calamine (the whole sheet is loaded, rows are converted lazily)."""
+    sheet = open_sheet(file_content)
+    rows = sheet.iter_rows()
+    first = next(rows, None)
+    header = [str(col).strip() for col in first] if first is not None else []
+    positions = {internal: header.index(raw) for raw, internal in columns.items()}
+    total = sheet.end[0] if sheet.end else 0
+    batch_rows = batch_rows or max(total, 1)
+
+    batch = {internal: [] for internal in positions}
+    done = 0
+    for row in rows:
+        for internal, pos in positions.items():
+            batch[internal].append(row[pos] if pos < len(row) else "")
+        done += 1
+        if done % batch_rows == 0:
+            yield batch, total
+            batch = {internal: [] for internal in positions}
+    if done % batch_rows or done == 0:
+        yield batch, total
+
+
+# Cells of a sheet XML: <c r="B12" s="1" t="s"><v>3</v></c> or <c r="B12" s="1"/>.
+# Cells in that usual attribute order with a lone <v> are decoded from the match groups;
+# anything else (inline strings, formulas, other attributes) goes through _scanned_value.
+_CELL = rb'<c r="(%s)(\d+)"(?: s="\d+")?(?: t="(\w+)")?(?:/>|><v>([^<]*)</v></c>|(\s[^>]*)?>(.*?)</c>)'
+_KIND = re.compile(rb'\bt="(\w+)"')
+_VALUE = re.compile(rb'<v(?:\s[^>]*)?>([^<]*)</v>')
+_INLINE_TEXT = re.compile(rb'<t(?:\s[^>]*)?>([^<]*)</t>')
+_PHONETIC = re.compile(rb'<rPh\b.*?</rPh>', re.S)
+_CELL_ROW = re.compile(rb'<c r="[A-Z]+(\d+)"')
+
+# A projected scan decodes fewer cells than calamine converts only when most columns are skipped
+SCAN_MAX_COLUMN_SHARE = 0.4
+
+
+def _column_letters(index):
+    """0 -> 'A', 27 -> 'AB'"""
+    letters = ""
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+
+def _scan_sheet(file_content, columns, batch_rows=None):
+    """
+    iter_raw_columns for a plain XLSX without building the whole sheet: a regular
+    expression picks the cells of the requested columns out of the sheet XML, and
+    only those are decoded (values shaped like parse_sheet_rows: numbers as float,
+    date cells as serial numbers). Returns None when the workbook does not fit this
+    fast path, or when most columns are requested anyway (calamine is faster then).
+    """
+    header = sniff_header(file_content)
+    if header is None or len(columns) > SCAN_MAX_COLUMN_SHARE * len(header):
+        return None
+    try:
+        sheet, shared_xml = read_sheet_xml(file_content)
+    except (zipfile.BadZipFile, KeyError, ValueError, ET.ParseError):
+        return None
+    # Every cell must carry its reference first (<c r="A1" ...>), in the default namespace
+    n_cells = sheet.count(b"<c ") + sheet.count(b"<c>")
+    if b"<sheetData" not in sheet or sheet.count(b'<c r="') != n_cells:
+        return None
+
+    positions = {internal: header.index(raw) for raw, internal in columns.items()}
+    letters = {_column_letters(pos).encode(): internal for internal, pos in positions.items()}
+    cell = re.compile(_CELL % b"|".join(letters), re.S)
+
+    # Data rows run to the last cell holding a value in any column (as calamine reads them)
+    last_value = max(sheet.rfind(b"<v>"), sheet.rfind(b"<v "), sheet.rfind(b"<is>"))
+    last_cell = _CELL_ROW.match(sheet, sheet.rfind(b'<c r="', 0, last_value)) if last_value >= 0 else None
+    total = max(int(last_cell.group(1)) - 1, 0) if last_cell else 0
+    shared = parse_shared_strings(shared_xml) if shared_xml else []
+
+    return _scan_batches(sheet, cell, letters, shared, total, batch_rows or max(total, 1))
+
+
+def _scan_batches(sheet, cell, letters, shared, total, batch_rows):
+    def empty_batch(start):
+        return {internal: [""] * min(batch_rows, total - start) for internal in letters.values()}
+
+    start = 0
+    batch = empty_batch(start)
+    # finditer, not findall: a batch is yielded as soon as its rows are scanned
+    for match in cell.finditer(sheet):
+        col, row, kind, value, attrs, inner = match.groups(b"")
+        index = int(row) - 2
+        if index < 0:
+            continue  # header row
+        if index >= total:
+            break
+        while index >= start + batch_rows:
+            yield batch, total
+            start += batch_rows
+            batch = empty_batch(start)
+
+        if value:
+            if kind == b"s":
+                cell_value = shared[int(value)]
+            elif not kind or kind == b"n":
+                cell_value = float(value)
+            else:
+                cell_value = _scanned_value(b' t="%s"' % kind, b"<v>%s</v>" % value, shared)
+        elif inner:
+            cell_value = _scanned_value(attrs + (b' t="%s"' % kind if kind else b""), inner, shared)
+        else:
+            continue
+        batch[letters[col]][index - start] = cell_value
+
+    while True:
+        yield batch, total
+        start += batch_rows
+        if start >= total:
+            return
+        batch = empty_batch(start)
+
+
+def _scanned_value(attrs, inner, shared):
+    """Raw value of a scanned cell, the same as _cell_value of its element."""
+    kind = _KIND.search(attrs)
+    kind = kind.group(1) if kind else b"n"
+    if kind == b"inlineStr":
+        if b"<rPh" in inner:
+            inner = _PHONETIC.sub(b"", inner)
+        text = b"".join(_INLINE_TEXT.findall(inner))
+        return html.unescape(text.decode("utf-8")) if b"&" in text else text.decode("utf-8")
+    value = _VALUE.search(inner)
+    text = value.group(1) if value else b""
+    if text == b"" or kind == b"e":
+        return ""
+    if kind == b"s":
+        return shared[int(text)]
+    if kind == b"b":
+        return text == b"1"
+    if kind in (b"str", b"d"):
+        return html.unescape(text.decode("utf-8"))
+    return float(text)
+
+
+def convert_columns(raw, kinds, on_batch=None, batch_rows=None):
+    """
+    Typed frame of raw column values (see read_raw_columns).
+
+    With `on_batch`, rows are converted `batch_rows` at a time and every typed batch
+    is passed to on_batch(batch, rows done, total rows) as soon as it is ready
+    (progressive loading). The result is the same as converting in one go.
+    """
+    return convert_batches(slice_batches(raw, batch_rows if on_batch else None), kinds, on_batch)
+
+
+def convert_batches(batches, kinds, on_batch=None):
+    """
+    Typed frame of raw batches (see iter_raw_columns), converted as they arrive.
+    Every typed batch goes to on_batch(batch, rows done, total rows); the result is the
+    same as converting all rows in one go.
+    """
+    frames = []
+    id_values = {}
+    start = 0
+    for raw, total in batches:
+        length = len(next(iter(raw.values()))) if raw else 0
+        data = {
+            internal: convert_column(values, kinds.get(internal, "str"))
+            for internal, values in raw.items()
+        }
+        batch = pd.DataFrame(data).set_axis(pd.RangeIndex(start, start + length))
+        start += length
+        frames.append(batch)
+        for internal, values in raw.items():
+            if kinds.get(internal, "str") == "id":
+                id_values.setdefault(internal, []).append(values)
+        if on_batch is not None:
+            on_batch(batch, start, total)
+
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+
+    df = pd.concat(frames)
+    # "id" columns are numeric only if every non-blank cell is an integer (int64 and
+    # float64 batches concatenate as float64); otherwise text throughout
+    for internal, parts in id_values.items():
+        dtypes = {frame[internal].dtype for frame in frames}
+        if len(dtypes) > 1 and not all(pd.api.types.is_numeric_dtype(dtype) for dtype in dtypes):
+            values = [value for part in parts for value in part]
+            df[internal] = as_text(pd.Series(values, dtype=object)).set_axis(df.index)
+    return df
+
+
+def read_sheet_xml(file_content):
+    """Raw XML of the first sheet and of the shared strings table (b"" if the workbook has none)."""
+    if hasattr(file_content, "seek"):
+        file_content.seek(0)
+    try:
+        with zipfile.ZipFile(file_content) as zf:
+            sheet = zf.read(_first_sheet_path(zf))
+            try:
+                shared = zf.read("xl/sharedStrings.xml")
+            except KeyError:
+                shared = b""
+    finally:
+        if hasattr(file_content, "seek"):
+            file_content.seek(0)
+    return sheet, shared
+
+
+def _text(elem):
+    """Text of a string item / inline string (plain <t> or rich-text runs, phonetic runs excluded)."""
+    parts = elem.findall(f"{NS_MAIN}t") or elem.findall(f"{NS_MAIN}r/{NS_MAIN}t")
+    return "".join(t.text or "" for t in parts)
+
+
+def parse_shared_strings(xml):
+    """Strings of an <sst> document (or of a wrapped fragment of one), in order."""
+    return [_text(si) for si in ET.fromstring(xml).iter(f"{NS_MAIN}si")]
+
+
+def _cell_value(cell, shared):
+    """Raw value of a <c> element, shaped like the values read_raw_columns gets from the sheet."""
+    kind = cell.get("t", "n")
+    if kind == "inlineStr":
+        is_elem = cell.find(f"{NS_MAIN}is")
+        return _text(is_elem) if is_elem is not None else ""
+    v = cell.find(f"{NS_MAIN}v")
+    text = v.text if v is not None and v.text is not None else ""
+    if text == "" or kind == "e":
+        return ""
+    if kind == "s":
+        return shared[int(text)]
+    if kind == "b":
+        return text == "1"
+    if kind in ("str", "d"):
+        return text
+    # Numbers (date cells stay serial numbers; convert_column handles both)
+    return float(text)
+
+
+def parse_sheet_rows(xml, positions, shared):
+    """
+    Projected raw values of the <row> elements in a sheet XML document (or a wrapped
+    fragment of one).
+
+    Args:
+        positions: {internal name: column index}
+        shared: Shared strings list
+
+    Returns:
+        ([sheet row numbers], {internal name: [values]})
+    """
+    row_numbers = []
+    data = {internal: [] for internal in positions}
+    by_col = {pos: internal for internal, pos in positions.items()}
+
+    next_row = 1
+    for row in ET.fromstring(xml).iter(f"{NS_MAIN}row"):
+        number = int(row.get("r") or next_row)
+        next_row = number + 1
+
+        values = {}
+        next_col = 0
+        for cell in row.iter(f"{NS_MAIN}c"):
+            ref = cell.get("r")
+            col = _column_index(ref) if ref else next_col
+            next_col = col + 1
+            if col in by_col:
+                values[by_col[col]] = _cell_value(cell, shared)
+
+        row_numbers.append(number)
+        for internal in positions:
+            data[internal].append(values.get(internal, ""))
+    return row_numbers, data
+
+
+def convert_column(values, kind):
+    """Converts raw cell values (list) to a typed Series."""
+    s = pd.Series(values, dtype=object)
+
+    if kind == "float":
+        return pd.to_numeric(s.replace("", np.nan), errors="coerce").astype("float64")
+
+    if kind == "date":
+        return excel_to_datetime(s)
+
+    if kind == "id":
+        # Blank cells are missing ids, not text: they never turn a numeric column into text
+        s = s.replace("", np.nan)
+        present = s.notna()
+        numeric = pd.to_numeric(s, errors="coerce").astype("float64")
+        if len(s) and numeric[present].notna().all() and (numeric[present] % 1 == 0).all():
+            return numeric.astype("int64") if present.all() else numeric
+        return as_text(s)
+
+    if kind == "count":
+        numeric = pd.to_numeric(s.replace("", np.nan), errors="coerce").astype("float64")
+        if len(numeric) and numeric.notna().all() and (numeric % 1 == 0).all():
+            return numeric.astype("int64")
+        return numeric
+
+    # "str"
+    return as_text(s)
+
+
+def as_text(s):
+    """
+    Cell values as str (integral numbers without a trailing '.0'), empty cells as None.
+    Keeps text columns single-typed so they can be written to Parquet.
+    """
+    def fmt(v):
+        if v is None or (isinstance(v, str) and v == ""):
+            return None
+        if isinstance(v, float):
+            if np.isnan(v):
+                return None
+            if v.is_integer():
+                return str(int(v))
+        return str(v)
+
+    return s.map(fmt).astype(object)
+
+
+def excel_to_datetime(s):
+    """
+    Converts a column of Excel date cells to datetime64.
+    Numeric cells are treated as Excel serial dates and converted directly,
+    date cells pass through, and anything else falls back to pd.to_datetime.
+    """
+    is_serial = s.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool))
+    is_date = s.map(lambda v: isinstance(v, datetime.date))
+
+    out = pd.Series(pd.NaT, index=s.index, dtype="datetime64[ns]")
+
+    if is_serial.any():
+        serials = s[is_serial].astype("float64")
+        out[is_serial] = EXCEL_EPOCH + pd.to_timedelta(serials, unit="D")
+
+    if is_date.any():
+        out[is_date] = pd.to_datetime(s[is_date].tolist(), errors="coerce")
+
+    rest = ~(is_serial | is_date)
+    if rest.any():
+        out[rest] = pd.to_datetime(s[rest].replace("", None), errors="coerce", format="mixed")
+
+    return out
@@ -0,0 +1,105 @@
+import io
+
+import pandas as pd
+
+from services import excel_reader
+
+# Fastest first. A normalized Parquet sidecar skips Excel parsing entirely.
+FORMAT_PREFERENCE = ["parquet", "csv.gz", "csv", "xlsx", "xls"]
+
+
+def detect_format(filename):
+    """'sales.csv.gz' -> 'csv.gz'. Returns None for unsupported files."""
+    name = filename.lower()
+    # Longest suffix first so 'csv.gz' wins over 'gz'/'csv'
+    for fmt in sorted(FORMAT_PREFERENCE, key=len, reverse=True):
+        if name.endswith("." + fmt):
+            return fmt
+    return None
+
+
+def candidate_names(dataset):
+    """All file names a dataset may be stored under, fastest format first."""
+    return [f"{dataset}.{fmt}" for fmt in FORMAT_PREFERENCE]
+
+
+def _rewind(file_content):
+    if hasattr(file_content, "seek"):
+        file_content.seek(0)
+    return file_content
+
+
+def _csv_compression(fmt):
+    return "gzip" if fmt == "csv.gz" else None
+
+
+def peek_header(file_content, fmt="xlsx"):
+    """Header (column names) of a file, without parsing its rows."""
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        header = pq.read_schema(_rewind(file_content)).names
+        _rewind(file_content)
+        return [str(col).strip() for col in header]
+
+    if fmt in ("csv", "csv.gz"):
+        df = pd.read_csv(_rewind(file_content), nrows=0, compression=_csv_compression(fmt))
+        _rewind(file_content)
+        return [str(col).strip() for col in df.columns]
+
+    return excel_reader.peek_header(file_content)
+
+
+def read_columns(file_content, columns, kinds, fmt="xlsx", on_batch=None, batch_rows=None):
+    """
+    Parses only the requested columns (see excel_reader.read_columns).
+    CSV/Parquet go through the same typed conversion as Excel cells.
+    on_batch / batch_rows: progressive loading (see excel_reader.convert_columns).
+    Excel batches are converted while the sheet is still being read
+    (excel_reader.iter_raw_columns); CSV/Parquet are read first, then batched.
+    """
+    if fmt not in ("parquet", "csv", "csv.gz"):
+        batches = excel_reader.iter_raw_columns(file_content, columns, batch_rows if on_batch else None)
+        return excel_reader.convert_batches(batches, kinds, on_batch)
+    raw = read_raw_columns(file_content, columns, fmt)
+    return excel_reader.convert_columns(raw, kinds, on_batch, batch_rows)
+
+
+def read_raw_columns(file_content, columns, fmt="xlsx"):
+    """Raw values of the requested columns, before typed conversion: {internal name: [values]}."""
+    if fmt == "parquet":
+        # Raw names may carry stray spaces; project on the names as stored
+        import pyarrow.parquet as pq
+        stored = {str(col).strip(): col for col in pq.read_schema(_rewind(file_content)).names}
+        raw = pd.read_parquet(_rewind(file_content), columns=[stored[c] for c in columns])
+        raw.columns = [str(col).strip() for col in raw.columns]
+    elif fmt in ("csv", "csv.gz"):
+        raw = pd.read_csv(
+            _rewind(file_content),
+            usecols=lambda col: str(col).strip() in columns,
+            dtype=str,
+            keep_default_na=False,
+            compression=_csv_compression(fmt)
+        )
+        raw.columns = [str(col).strip() for col in raw.columns]
+    else:
+        return excel_reader.read_raw_columns(file_content, columns)
+
+    return {internal: raw[raw_name].tolist() for raw_name, internal in columns.items()}
+
+
+def is_normalized(header, normalized_columns):
+    """True if the file is a normalized sidecar (already has the internal column names)."""
+    return set(normalized_columns).issubset(header)
+
+
+def read_normalized(file_content, header, normalized_columns):
+    """Reads a normalized Parquet sidecar as-is (in its stored column order)."""
+    columns = [col for col in header if col in normalized_columns]
+    return pd.read_parquet(_rewind(file_content), columns=columns)
+
+
+def to_parquet_bytes(df):
+    """Serializes a normalized frame for publishing as a sidecar."""
+    buf = io.BytesIO()
+    df.to_parquet(buf, index=False)
+    return buf.getvalue()
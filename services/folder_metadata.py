@@ -0,0 +1,55 @@
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Process-wide cache of branch folder listings: folder -> candidate files
+# (id, name, modifiedTime). Misses for many folders are resolved together in
+# batched queries, so a multi-branch job lists 24 folders in one round trip.
+METADATA_TTL = float(os.getenv("DRIVE_METADATA_TTL", "60"))
+
+_lock = threading.Lock()
+_listings = {}  # (source cache key, folder_id, names, prefixes) -> (fetched_at, [files])
+
+
+def _key(source, folder_id, names, prefixes):
+    # Listings are filtered by the source, so the filter is part of the key
+    return (getattr(source, "cache_key", id(source)), folder_id, tuple(sorted(names)), tuple(sorted(prefixes)))
+
+
+def resolve(source, folder_ids, names, max_age=None, prefixes=()):
+    """
+    Candidate files of many folders: {folder_id: [files]}, by exact name or name prefix.
+    Listings younger than `max_age` seconds (default METADATA_TTL) come from the
+    cache; the rest are fetched in as few queries as the source allows.
+    Pass max_age=0 to force a fresh listing.
+    """
+    max_age = METADATA_TTL if max_age is None else max_age
+    now = time.monotonic()
+
+    result, missing = {}, []
+    with _lock:
+        for folder_id in dict.fromkeys(folder_ids):
+            cached = _listings.get(_key(source, folder_id, names, prefixes))
+            if cached and now - cached[0] < max_age:
+                result[folder_id] = cached[1]
+            else:
+                missing.append(folder_id)
+
+    if missing:
+        fetched = source.list_folders(missing, names, prefixes)
+        with _lock:
+            for folder_id in missing:
+                files = fetched.get(folder_id, [])
+                _listings[_key(source, folder_id, names, prefixes)] = (now, files)
+                result[folder_id] = files
+        logger.info(f"Resolved {len(missing)} folder listing(s), {len(result) - len(missing)} from cache")
+
+    return result
+
+
+def folder_files(source, folder_id, names, max_age=None, prefixes=()):
+    """Candidate files of one folder (see resolve)."""
+    return resolve(source, [folder_id], names, max_age, prefixes)[folder_id]
@@ -3,13 +3,16 @@ import datetime
 import calendar
 import numpy as np
 
-def calculate_kpis(df, target=0):
+from services.agg_kernel import SalesKernel
+
+def calculate_kpis(df, target=0, kernel=None):
     """
     Calculates monthly KPIs based on normalized sales dataframe.
     
     Args:
         df: DataFrame with 'date', 'transaction_id', 'line_amount'
         target: Monthly target amount (float)
+        kernel: optional SalesKernel (services/agg_kernel) already built for df
         
     Returns:
         Dictionary containing calculated KPIs and period info.
@@ -17,8 +20,25 @@ def calculate_kpis(df, target=0):
     if df is None or df.empty:
         return None
 
-    # 1. Period Logic
-    period_end = df['date'].max()
+    kernel = kernel or SalesKernel(df)
+
+    # 1. Period end (latest sale)
+    period_end = kernel.period_end
+
+    # 2. Transaction Netting Logic
+    # Sum per transaction_id to handle returns (negative rows in same txn);
+    # only positive transactions count as sales (standard retail logic)
+    actual_to_date = kernel.net_sales()
+
+    return kpis_from_actual(period_end, actual_to_date, target)
+
+
+def kpis_from_actual(period_end, actual_to_date, target=0):
+    """
+    Derives the KPI dict from the period end date and net sales to date.
+    Shared by calculate_kpis and the SQL store.
+    """
+    # Period Logic
     year = period_end.year
     month = period_end.month
     
@@ -33,16 +53,7 @@ def calculate_kpis(df, target=0):
     # Remaining days
     remaining_days = days_in_month - period_end.day
 
-    # 2. Transaction Netting Logic
-    # Group by transaction_id to handle returns (negative rows in same txn)
-    txn_totals = df.groupby('transaction_id')['line_amount'].sum()
-    
-    # Only positive transactions count as sales (standard retail logic)
-    positive_txns = txn_totals[txn_totals > 0]
-    
-    actual_to_date = positive_txns.sum()
-
-    # 3. KPI Calculations
+    # KPI Calculations
     avg_daily_performance = actual_to_date / max(elapsed_days, 1)
 
     # Required daily to hit target
@@ -1,54 +1,55 @@
 import pandas as pd
-import numpy as np
 
-def get_seller_table(sales_df, items_df):
+from services.agg_kernel import ItemsKernel, SalesKernel, safe_divide
+
+def is_excluded_category(cat):
+    """Categories that do not count as complement products: "הנעלה", "ביגוד", "הנה", "מתכל"."""
+    cat = str(cat).strip().replace('"', '').replace("'", "")
+    if cat == "הנעלה" or cat == "ביגוד":
+        return True
+    if "הנה" in cat: # Catches הנה"ח etc
+        return True
+    if "מתכל" in cat:
+        return True
+    return False
+
+def get_seller_table(sales_df, items_df, sales_kernel=None, items_kernel=None):
     """
     Builds the seller performance table.
+    Kernels (services/agg_kernel) already built for the frames can be passed in.
     """
     if sales_df is None or sales_df.empty:
         return pd.DataFrame()
 
-    # --- 1. Valid Transactions per Seller (from SALES) ---
-    # Group by [transaction_id, seller_id] -> sum(line_amount)
-    # Filter net_amount > 0
-    txn_groups = sales_df.groupby(['transaction_id', 'seller_id'])['line_amount'].sum()
-    valid_txns = txn_groups[txn_groups > 0].reset_index()
-    
-    # Count valid transactions per seller
-    seller_txns_count = valid_txns.groupby('seller_id').size().rename('transactions')
-    
-    # Sum valid transaction amounts per seller (Net Sales)
-    seller_sales_amount = valid_txns.groupby('seller_id')['line_amount'].sum().rename('sales')
+    sales_kernel = sales_kernel or SalesKernel(sales_df)
 
+    # --- 1. Valid Transactions per Seller (from SALES) ---
+    # Net per [transaction_id, seller_id], keep net_amount > 0,
+    # then count and sum those per seller (Net Sales)
     # --- 2. Seller Units (Average Items Denominator) ---
     # Sum positive qty only
-    pos_qty_df = sales_df[sales_df['qty'] > 0]
-    seller_units = pos_qty_df.groupby('seller_id')['qty'].sum().rename('total_units')
-    
+    # (the seller names map comes from the first sale of each seller)
+    seller_names, seller_sales_amount, seller_txns_count, seller_units = sales_kernel.seller_series()
+
     # --- 3. Complement Numerator (from ITEMS) ---
     # Exclude categories: "הנעלה", "ביגוד", "הנה", "מתכל"
     if items_df is not None and not items_df.empty:
-        def is_excluded(cat):
-            cat = str(cat).strip().replace('"', '').replace("'", "")
-            if cat == "הנעלה" or cat == "ביגוד":
-                return True
-            if "הנה" in cat: # Catches הנה"ח etc
-                return True
-            if "מתכל" in cat:
-                return True
-            return False
-
-        # Filter items
-        valid_items_mask = ~items_df['category_param12'].apply(is_excluded)
-        complement_df = items_df[valid_items_mask]
-        seller_complement_units = complement_df.groupby('seller_id')['units'].sum().rename('complement_units')
+        items_kernel = items_kernel or ItemsKernel(items_df)
+        seller_complement_units = items_kernel.complement_units()
     else:
         seller_complement_units = pd.Series(dtype=float)
 
     # --- 4. Merge Everything ---
-    # We use sales_df to get unique seller names mapping
-    seller_names = sales_df[['seller_id', 'seller_name']].drop_duplicates('seller_id').set_index('seller_id')['seller_name']
-    
+    return assemble_seller_table(
+        seller_names, seller_sales_amount, seller_txns_count, seller_units, seller_complement_units
+    )
+
+
+def assemble_seller_table(seller_names, seller_sales_amount, seller_txns_count, seller_units, seller_complement_units):
+    """
+    Joins per-seller series (indexed by seller_id) into the display table.
+    Shared by get_seller_table and the SQL store.
+    """
     # Base is sellers who have sales
     df = pd.DataFrame(index=seller_sales_amount.index)
     df = df.join(seller_names).join(seller_sales_amount).join(seller_txns_count).join(seller_units).join(seller_complement_units)
@@ -61,9 +62,9 @@ def get_seller_table(sales_df, items_df):
 
     # Calculate Averages and Ratios
     # Avoid division by zero
-    df['avg_transaction'] = df.apply(lambda x: x['sales'] / x['transactions'] if x['transactions'] > 0 else 0, axis=1)
-    df['avg_items'] = df.apply(lambda x: x['total_units'] / x['transactions'] if x['transactions'] > 0 else 0, axis=1)
-    df['complement_ratio'] = df.apply(lambda x: x['complement_units'] / x['transactions'] if x['transactions'] > 0 else 0, axis=1)
+    df['avg_transaction'] = safe_divide(df['sales'], df['transactions'])
+    df['avg_items'] = safe_divide(df['total_units'], df['transactions'])
+    df['complement_ratio'] = safe_divide(df['complement_units'], df['transactions'])
 
     # Format and Select Columns
     # Need to match strict output columns:
@@ -87,18 +88,15 @@ def get_seller_table(sales_df, items_df):
     ]]
 
 
-def get_top_products_qty(sales_df):
+def get_top_products_qty(sales_df, kernel=None):
     """
     Top 5 products by Quantity (qty > 0).
     """
     if sales_df is None or sales_df.empty:
         return pd.DataFrame()
         
-    # Filter positive quantity
-    df = sales_df[sales_df['qty'] > 0]
-    
-    # Group
-    grouped = df.groupby('product_desc')['qty'].sum().reset_index()
+    # Group (positive quantity only)
+    grouped = (kernel or SalesKernel(sales_df)).product_totals("qty")
     
     # Top 5
     top5 = grouped.sort_values('qty', ascending=False).head(5)
@@ -109,7 +107,7 @@ def get_top_products_qty(sales_df):
     return top5
 
 
-def get_top_products_amount(sales_df):
+def get_top_products_amount(sales_df, kernel=None):
     """
     Top 5 products by Amount (sum line_amount).
     """
@@ -118,7 +116,7 @@ def get_top_products_amount(sales_df):
         
     # Group (use all lines, netting happens naturally by summation here or usually just sum amount)
     # Prompt says: "amount_sum = sum(line_amount)"
-    grouped = sales_df.groupby('product_desc')['line_amount'].sum().reset_index()
+    grouped = (kernel or SalesKernel(sales_df)).product_totals("amount")
     
     # Top 5
     top5 = grouped.sort_values('line_amount', ascending=False).head(5)
@@ -127,3 +125,19 @@ def get_top_products_amount(sales_df):
     top5 = top5.rename(columns={"product_desc": "תיאור מוצר", "line_amount": "סכום"})
     
     return top5
+
+
+def get_product_totals(sales_df, kernel=None):
+    """
+    Units (qty > 0, as in the top 5 lists) and amount per product, for the product lookup.
+    One row per product, in product key order.
+    """
+    if sales_df is None or sales_df.empty:
+        return pd.DataFrame(columns=["תיאור מוצר", "כמות", "סכום"])
+
+    kernel = kernel or SalesKernel(sales_df)
+    totals = kernel.product_totals("amount").merge(kernel.product_totals("qty"), on='product_desc', how='left')
+    totals['qty'] = totals['qty'].fillna(0)
+
+    totals = totals.rename(columns={"product_desc": "תיאור מוצר", "qty": "כמות", "line_amount": "סכום"})
+    return totals[["תיאור מוצר", "כמות", "סכום"]]
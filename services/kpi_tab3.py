@@ -1,5 +1,6 @@
 import pandas as pd
-import numpy as np
+
+from services.agg_kernel import ItemsKernel
 
 # Whitelist Categories (Exact)
 WHITELIST_CATEGORIES = [
@@ -28,28 +29,20 @@ def filter_whitelist(df):
     df['clean_cat'] = df['category_param12'].apply(clean_category)
     return df[df['clean_cat'].isin(WHITELIST_CATEGORIES)]
 
-def build_category_pivot(items_df, metric="units"):
+def build_category_pivot(items_df, metric="units", kernel=None):
     """
     Builds a pivot table: Row=Seller, Col=Category, Val=Sum(Metric).
     Adds 'Total' column and sorts.
+    kernel: optional ItemsKernel (services/agg_kernel) already built for items_df.
     """
     if items_df is None or items_df.empty:
         return pd.DataFrame()
 
-    # Filter
-    df = filter_whitelist(items_df)
-    if df.empty:
-        return pd.DataFrame()
-
-    # Pivot
+    # Filter + Pivot (whitelisted categories only)
     # metric should be 'units' or 'revenue'
-    pivot = df.pivot_table(
-        index='seller_name', 
-        columns='clean_cat', 
-        values=metric, 
-        aggfunc='sum', 
-        fill_value=0
-    )
+    pivot = (kernel or ItemsKernel(items_df)).category_matrix(WHITELIST_CATEGORIES, metric)
+    if pivot.empty:
+        return pd.DataFrame()
 
     # Ensure all whitelist columns exist (even if 0)
     for cat in WHITELIST_CATEGORIES:
@@ -72,19 +65,27 @@ def build_category_pivot(items_df, metric="units"):
 
     return pivot
 
-def build_category_distribution(items_df, metric="units", seller_name=None):
+def build_category_distribution(items_df, metric="units", seller_name=None, seller_index=None):
     """
     Aggregates data for Pie Chart.
+    With a SellerIndex (services/seller_index) the whitelist is already applied
+    and a single seller's rows are a slice, so nothing is re-filtered.
     """
     if items_df is None or items_df.empty:
         return pd.DataFrame()
 
-    # Filter Whitelist
-    df = filter_whitelist(items_df)
-    
-    # Filter by Seller if specific one selected (and not 'All')
-    if seller_name and seller_name != "הכל":
-        df = df[df['seller_name'] == seller_name]
+    if seller_index is not None:
+        if seller_name and seller_name != "הכל":
+            df = seller_index.rows(seller_name)
+        else:
+            df = seller_index.frame
+    else:
+        # Filter Whitelist
+        df = filter_whitelist(items_df)
+        
+        # Filter by Seller if specific one selected (and not 'All')
+        if seller_name and seller_name != "הכל":
+            df = df[df['seller_name'] == seller_name]
     
     if df.empty:
         return pd.DataFrame(columns=['category', 'value'])
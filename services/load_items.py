@@ -1,6 +1,13 @@
-import pandas as pd
+import logging
+
+import numpy as np
 import streamlit as st
 
+from services.excel_reader import find_alias
+from services.file_formats import peek_header, read_columns, is_normalized, read_normalized
+
+logger = logging.getLogger(__name__)
+
 # Hebrew to Internal Column Mapping for Items
 COLUMN_MAP = {
     "תאור פרמטר 12 למוצר": "category_param12",
@@ -16,48 +23,52 @@ SELLER_ID_ALIASES = ["מוכרן", "מספר מוכרן", "קוד מוכרן"]
 # Revenue/Transactions are optional (fill with 0 if missing).
 REQUIRED_COLUMNS = ["category_param12", "units", "seller_name"] 
 
-def load_and_normalize_items(file_content):
+# Explicit parse types per internal column (see excel_reader.COLUMN_KINDS)
+COLUMN_KINDS = {
+    "category_param12": "str",
+    "units": "count",
+    "seller_name": "str",
+    "revenue": "float",
+    "transactions": "count",
+    "seller_id": "id"
+}
+
+def load_and_normalize_items(file_content, fmt="xlsx"):
     """
-    Loads items data from a bytes buffer (Excel), normalizes column names.
+    Loads items data from a bytes buffer (Excel, CSV or Parquet - see file_formats), normalizes column names.
+    Only the header row is read before validation; after that only the
+    mapped columns are parsed.
     """
     try:
-        df = pd.read_excel(file_content, engine='calamine')
+        header = peek_header(file_content, fmt)
+
+        # Normalized Parquet sidecar: already renamed, typed and cleaned
+        if fmt == "parquet" and is_normalized(header, COLUMN_KINDS):
+            return read_normalized(file_content, header, COLUMN_KINDS)
         
         # 1. Normalize Seller ID
-        found_seller_id_col = None
-        for alias in SELLER_ID_ALIASES:
-            if alias in df.columns:
-                found_seller_id_col = alias
-                break
-        
-        if found_seller_id_col:
-            df = df.rename(columns={found_seller_id_col: "seller_id"})
-        else:
+        found_seller_id_col = find_alias(header, SELLER_ID_ALIASES)
+        if not found_seller_id_col:
+            # Logged as well: st.* calls are dropped outside a script run (e.g. the prefetch thread)
+            logger.error(f"ITEMS file has no seller id column (looked for {SELLER_ID_ALIASES})")
             st.error(f"שגיאה: עמודת מס' מוכרן חסרה בקובץ ITEMS (חיפשנו: {SELLER_ID_ALIASES})")
             return None
 
-        # 2. Check Missing Columns (Required Only)
-        # We check locally against the mapped names if we were to map them...
-        # But pandas rename doesn't fail if key missing, it just stays same.
-        # So we check raw names.
-        
-        # Invert map to check raw names
-        RAW_REQUIRED = []
-        for internal in REQUIRED_COLUMNS:
-            # find raw key for internal
-            for raw, inter in COLUMN_MAP.items():
-                if inter == internal:
-                    RAW_REQUIRED.append(raw)
-                    break 
-
-        missing_cols = [col for col in RAW_REQUIRED if col not in df.columns]
+        # 2. Check Missing Columns (Required Only) against the raw header names
+        raw_by_internal = {inter: raw for raw, inter in COLUMN_MAP.items()}
+        RAW_REQUIRED = [raw_by_internal[internal] for internal in REQUIRED_COLUMNS]
+
+        missing_cols = [col for col in RAW_REQUIRED if col not in header]
         if missing_cols:
             error_msg = f"שגיאה: העמודות הבאות חסרות בקובץ ITEMS: {', '.join(missing_cols)}"
+            logger.error(f"ITEMS file is missing columns: {missing_cols}")
             st.error(error_msg)
             return None
 
-        # 3. Rename
-        df = df.rename(columns=COLUMN_MAP)
+        # 3. Parse only the mapped columns that exist (already renamed and typed)
+        columns = {raw: inter for raw, inter in COLUMN_MAP.items() if raw in header}
+        columns[found_seller_id_col] = "seller_id"
+        df = read_columns(file_content, columns, COLUMN_KINDS, fmt)
 
         # 4. Fill Missing Optional Columns
         if "revenue" not in df.columns:
@@ -66,13 +77,15 @@ def load_and_normalize_items(file_content):
             df["transactions"] = 0
 
         # 5. Cleanup
-        df['units'] = pd.to_numeric(df['units'], errors='coerce').fillna(0)
-        df['revenue'] = pd.to_numeric(df['revenue'], errors='coerce').fillna(0)
-        # Ensure category is string
-        df['category_param12'] = df['category_param12'].astype(str)
+        df['units'] = df['units'].fillna(0)
+        df['revenue'] = df['revenue'].fillna(0)
+        # Ensure category is string (empty cells as NaN first, like read_excel gave them)
+        category = df['category_param12']
+        df['category_param12'] = category.where(category.notna(), np.nan).astype(str)
 
         return df
 
     except Exception as e:
+        logger.error(f"Error loading ITEMS file: {e}")
         st.error(f"שגיאה בטעינת קובץ פריטים: {e}")
         return None
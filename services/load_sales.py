@@ -1,6 +1,13 @@
-import pandas as pd
+import logging
+
 import streamlit as st
 
+from services import delta_ingest, progressive
+from services.excel_reader import find_alias
+from services.file_formats import peek_header, read_columns, is_normalized, read_normalized
+
+logger = logging.getLogger(__name__)
+
 # Hebrew to Internal Column Mapping
 # Using a list of potential names for flexibility if needed, 
 # but sticking to strict mapping where possible.
@@ -19,49 +26,80 @@ SELLER_ID_ALIASEs = ["מוכרן", "מספר מוכרן"]
 REQUIRED_COLUMNS = list(COLUMN_MAP.keys()) 
 # Note: We will manually check for one of the seller_id aliases
 
-def load_and_normalize_sales(file_content):
+# Explicit parse types per internal column (see excel_reader.COLUMN_KINDS)
+COLUMN_KINDS = {
+    "transaction_id": "id",
+    "date": "date",
+    "line_amount": "float",
+    "qty": "count",
+    "seller_id": "id",
+    "seller_name": "str",
+    "product_desc": "str"
+}
+
+def clean_sales(df):
+    """Row-wise cleanup of parsed sales rows (safe to apply to appended rows alone)."""
+    df['line_amount'] = df['line_amount'].fillna(0)
+    df['qty'] = df['qty'].fillna(0)
+    
+    # Drop rows with invalid dates (optional, but protects math)
+    # and rows without a transaction / seller id (blank cells, see excel_reader "id")
+    df = df.dropna(subset=['date', 'transaction_id', 'seller_id'])
+
+    # Numeric ids read as float64 only because of those blanks are integers again
+    for col in ('transaction_id', 'seller_id'):
+        if df[col].dtype == "float64":
+            df[col] = df[col].astype("int64")
+    return df
+
+def load_and_normalize_sales(file_content, fmt="xlsx", delta_key=None, on_batch=None):
     """
-    Loads sales data from a bytes buffer (Excel), normalizes column names,
+    Loads sales data from a bytes buffer (Excel, CSV or Parquet - see file_formats), normalizes column names,
     and performs basic type conversion.
+    Only the header row is read before validation; after that only the
+    mapped columns are parsed.
+    With `delta_key`, a file that only gained rows since it was last loaded under
+    that key is ingested incrementally (see services/delta_ingest).
+    `on_batch(rows, rows_done, rows_total)` receives the cleaned rows of every
+    parsed batch while a full parse is running (see services/progressive).
     """
     try:
-        # Load using Calamine engine for better compatibility
-        df = pd.read_excel(file_content, engine='calamine')
+        header = peek_header(file_content, fmt)
+
+        # Normalized Parquet sidecar: already renamed, typed and cleaned
+        if fmt == "parquet" and is_normalized(header, COLUMN_KINDS):
+            return read_normalized(file_content, header, COLUMN_KINDS)
         
         # 1. Normalize Seller ID column
         # Find which alias exists
-        found_seller_id_col = None
-        for alias in SELLER_ID_ALIASEs:
-            if alias in df.columns:
-                found_seller_id_col = alias
-                break
-        
-        if found_seller_id_col:
-            df = df.rename(columns={found_seller_id_col: "seller_id"})
-        else:
+        found_seller_id_col = find_alias(header, SELLER_ID_ALIASEs)
+        if not found_seller_id_col:
+            # Logged as well: st.* calls are dropped outside a script run (e.g. the prefetch thread)
+            logger.error(f"SALES file has no seller id column (looked for {SELLER_ID_ALIASEs})")
             st.error(f"שגיאה: עמודת מס' מוכרן חסרה (חיפשנו: {SELLER_ID_ALIASEs})")
             return None
 
         # 2. Check for other required columns
-        missing_cols = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+        missing_cols = [col for col in REQUIRED_COLUMNS if col not in header]
         if missing_cols:
             error_msg = f"שגיאה: העמודות הבאות חסרות בקובץ SALES: {', '.join(missing_cols)}"
+            logger.error(f"SALES file is missing columns: {missing_cols}")
             st.error(error_msg)
             return None
 
-        # 3. Rename remaining columns
-        df = df.rename(columns=COLUMN_MAP)
-
-        # 4. Type conversion
-        df['date'] = pd.to_datetime(df['date'], errors='coerce')
-        df['line_amount'] = pd.to_numeric(df['line_amount'], errors='coerce').fillna(0)
-        df['qty'] = pd.to_numeric(df['qty'], errors='coerce').fillna(0)
-        
-        # Drop rows with invalid dates (optional, but protects math)
-        df = df.dropna(subset=['date'])
+        # 3. Parse only the mapped columns (already renamed and typed)
+        columns = {**COLUMN_MAP, found_seller_id_col: "seller_id"}
+        # Shallow copy: cleaning a batch for the preview leaves the batch itself untouched
+        on_rows = (lambda batch, done, total: on_batch(clean_sales(batch.copy(deep=False)), done, total)) if on_batch else None
+        if delta_key is not None and delta_ingest.ENABLED:
+            return delta_ingest.ingest(delta_key, file_content, fmt, columns, COLUMN_KINDS, clean_sales,
+                                       on_rows, progressive.BATCH_ROWS)
+        df = read_columns(file_content, columns, COLUMN_KINDS, fmt, on_rows, progressive.BATCH_ROWS)
 
-        return df
+        # 4. Type cleanup
+        return clean_sales(df)
 
     except Exception as e:
+        logger.error(f"Error loading SALES file: {e}")
         st.error(f"שגיאה בטעינת קובץ מכירות: {e}")
         return None
@@ -0,0 +1,227 @@
+import os
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from services import dataset_registry, delta_ingest, partitions
+
+logger = logging.getLogger(__name__)
+
+# Who holds the memory of this process. Shared branch datasets and their
+# derived tables are measured from the dataset registry on demand (report):
+# deep DataFrame sizes walk every string, so never on the hot path. Each session
+# reports what it keeps privately in st.session_state (AI responses, flags...)
+# from its reruns (record_session); only sizes are kept, so a session
+# that is gone releases its dataset lease as usual.
+# Sessions that have not run for SESSION_TTL seconds are considered gone.
+SESSION_TTL = int(os.getenv("MEMORY_SESSION_TTL", "3600"))
+# A session's state is measured at most once per SESSION_SAMPLE_SECONDS; reruns in between only mark it live
+SESSION_SAMPLE_SECONDS = float(os.getenv("MEMORY_SESSION_SAMPLE_SECONDS", "30"))
+# tracemalloc frames kept per allocation (more = slower, more precise tracebacks)
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "1"))
+
+# session_state keys holding AI responses (ui/tab4)
+AI_KEY_PREFIX = "ai_"
+
+_lock = threading.Lock()
+_sessions = {}  # session id -> {"branch", "usage": session_usage(), "seen"}
+_snapshot = None  # last tracemalloc snapshot, the baseline of the next one
+
+
+def deep_size(obj, _seen=None):
+    """
+    Approximate bytes held by an object: DataFrames / Series / arrays deep,
+    containers recursively, objects with `nbytes` (indexes, kernels) by it.
+    Shared datasets (DatasetLease) count as 0 here; they are accounted per dataset.
+    """
+    if obj is None or isinstance(obj, dataset_registry.DatasetLease):
+        return 0
+    _seen = set() if _seen is None else _seen
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return dataset_registry.object_nbytes(obj)
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(deep_size(k, _seen) + deep_size(v, _seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(deep_size(v, _seen) for v in obj)
+    if isinstance(obj, (str, bytes, int, float, bool)):
+        return sys.getsizeof(obj)
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, (int, np.integer)):
+        return int(nbytes)
+    return sys.getsizeof(obj)
+
+
+def record_session(session_id, branch, state):
+    """Records the private state sizes of a session (its session_state), throttled per session."""
+    now = time.monotonic()
+    with _lock:
+        info = _sessions.get(session_id)
+        if info is not None and info["branch"] == branch and now - info["measured"] < SESSION_SAMPLE_SECONDS:
+            info["seen"] = now
+            return
+    usage = session_usage(state)
+    with _lock:
+        _sessions[session_id] = {"branch": branch, "usage": usage, "seen": now, "measured": now}
+
+
+def _live_sessions():
+    now = time.monotonic()
+    with _lock:
+        for session_id in [s for s, info in _sessions.items() if now - info["seen"] > SESSION_TTL]:
+            del _sessions[session_id]
+        return dict(_sessions)
+
+
+def session_usage(state):
+    """{"ai_bytes", "other_bytes", "keys": {key: bytes}} of one session's private state."""
+    keys = {}
+    for key in list(state.keys()):
+        try:
+            keys[str(key)] = deep_size(state[key])
+        except (KeyError, AttributeError):
+            continue
+    ai = sum(size for key, size in keys.items() if key.startswith(AI_KEY_PREFIX))
+    return {"ai_bytes": ai, "other_bytes": sum(keys.values()) - ai, "keys": keys}
+
+
+def _derived_name(key):
+    """Readable name of a derived object key (DerivedTables keys are ("table", mode, name, params))."""
+    if isinstance(key, tuple) and len(key) >= 3 and key[0] == "table":
+        params = ", ".join(f"{p}={v}" for p, v in key[3]) if len(key) > 3 and key[3] else ""
+        return f"{key[2]} ({params})" if params else str(key[2])
+    return str(key)
+
+
+def dataset_usage():
+    """Per dataset revision: frame sizes, each derived table's size and the sessions using it."""
+    datasets = []
+    for entry in dataset_registry.entries():
+        # Tables that are the base frames themselves (e.g. items_view) are not counted twice
+        seen = {id(entry['sales_df']), id(entry['items_df'])}
+        # list() copies the dict in one step; tables built meanwhile show up next time
+        derived = {_derived_name(name): deep_size(obj, seen) for name, obj in list(entry['derived'].items())}
+        datasets.append({
+            "branch": entry['branch'],
+            "revision": entry['revision'],
+            "refcount": entry['refcount'],
+            "sales_bytes": dataset_registry.frame_nbytes(entry['sales_df']),
+            "items_bytes": dataset_registry.frame_nbytes(entry['items_df']),
+            "derived_bytes": sum(derived.values()),
+            "derived": derived,
+        })
+    return datasets
+
+
+def report():
+    """
+    Memory accounting of the process: its memory (rss/pss/shared/private), every
+    registered dataset, every live session and the totals per branch.
+    """
+    datasets = dataset_usage()
+    sessions = []
+    for session_id, info in _live_sessions().items():
+        sessions.append({"session": session_id, "branch": info["branch"], **info["usage"]})
+
+    branches = {}
+    for d in datasets:
+        b = branches.setdefault(d['branch'], {"dataset_bytes": 0, "derived_bytes": 0, "session_bytes": 0, "sessions": 0})
+        b["dataset_bytes"] += d['sales_bytes'] + d['items_bytes']
+        b["derived_bytes"] += d['derived_bytes']
+    for s in sessions:
+        b = branches.setdefault(s['branch'], {"dataset_bytes": 0, "derived_bytes": 0, "session_bytes": 0, "sessions": 0})
+        b["session_bytes"] += s['ai_bytes'] + s['other_bytes']
+        b["sessions"] += 1
+    for b in branches.values():
+        b["total_bytes"] = b["dataset_bytes"] + b["derived_bytes"] + b["session_bytes"]
+
+    return {
+        "process": dataset_registry.process_memory(),
+        "datasets": datasets,
+        "sessions": sessions,
+        "branches": dict(sorted(branches.items(), key=lambda kv: -kv[1]["total_bytes"])),
+        "totals": {
+            "dataset_bytes": sum(d['sales_bytes'] + d['items_bytes'] for d in datasets),
+            "derived_bytes": sum(d['derived_bytes'] for d in datasets),
+            "ai_bytes": sum(s['ai_bytes'] for s in sessions),
+            "session_bytes": sum(s['ai_bytes'] + s['other_bytes'] for s in sessions),
+            "sessions": len(sessions),
+            "partition_cache_bytes": partitions.cache_nbytes(),
+            # Beyond the registered sales frames the states usually share
+            "delta_state_bytes": delta_ingest.state_nbytes(e['sales_df'] for e in dataset_registry.entries()),
+        },
+    }
+
+
+def log_report(rep=None):
+    """Logs the totals and the largest branches; returns the report."""
+    rep = rep or report()
+    mb = lambda n: f"{n / 1e6:.1f} MB"
+    totals, process = rep["totals"], rep["process"]
+    top = ", ".join(f"{branch} {mb(b['total_bytes'])}" for branch, b in list(rep["branches"].items())[:3])
+    logger.info(
+        f"Memory: rss={mb(process['rss'])} pss={mb(process['pss'])} | datasets={mb(totals['dataset_bytes'])} "
+        f"derived={mb(totals['derived_bytes'])} sessions={totals['sessions']} ({mb(totals['session_bytes'])}, "
+        f"AI {mb(totals['ai_bytes'])}) | top: {top or '-'}"
+    )
+    return rep
+
+
+# --- tracemalloc (on demand) ---
+
+def tracing():
+    return tracemalloc.is_tracing()
+
+
+def start_tracing(frames=None):
+    """Starts tracing allocations (only allocations made from now on are seen)."""
+    global _snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames or TRACEMALLOC_FRAMES)
+        _snapshot = None
+        logger.info("tracemalloc started")
+
+
+def stop_tracing():
+    global _snapshot
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        logger.info("tracemalloc stopped")
+    _snapshot = None
+
+
+def take_snapshot(limit=15):
+    """
+    Top allocation sites by size (and growth since the previous snapshot), or None
+    when not tracing: {"traced_bytes", "peak_bytes", "top": [{"site", "bytes", "count", "growth"}]}.
+    """
+    global _snapshot
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*"),
+    ))
+    if _snapshot is not None:
+        stats = snapshot.compare_to(_snapshot, "lineno")
+        top = [{"site": str(s.traceback[0]), "bytes": s.size, "count": s.count, "growth": s.size_diff}
+               for s in stats[:limit]]
+    else:
+        top = [{"site": str(s.traceback[0]), "bytes": s.size, "count": s.count, "growth": None}
+               for s in snapshot.statistics("lineno")[:limit]]
+    _snapshot = snapshot
+
+    traced, peak = tracemalloc.get_traced_memory()
+    for site in top[:5]:
+        logger.info(f"tracemalloc {site['site']}: {site['bytes'] / 1e6:.1f} MB in {site['count']} blocks")
+    return {"traced_bytes": traced, "peak_bytes": peak, "top": top}
@@ -0,0 +1,193 @@
+import os
+import re
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from services.dataset_registry import frame_nbytes
+from services.excel_reader import as_text
+from services.file_formats import detect_format
+
+logger = logging.getLogger(__name__)
+
+# Branches that export one file per day (sales_2026-10-01.xlsx ...) instead of
+# one cumulative workbook. Partition files of a dataset are downloaded and
+# parsed in parallel, concatenated in date order and de-duplicated: a line
+# (transaction_id + hash of the line) already seen in an earlier day's file is
+# dropped, so re-exported or overlapping days count once. Parsed partitions are
+# cached per file revision (name + modifiedTime), so a refresh only fetches the
+# days that are new or changed.
+PARTITIONED_DATASETS = ("sales",)
+PARTITION_WORKERS = int(os.getenv("PARTITION_WORKERS", "4"))
+# Parsed partitions kept for the next refresh (least recently used dropped first)
+PARTITION_CACHE_BYTES = int(float(os.getenv("PARTITION_CACHE_MB", "256")) * 1024 * 1024)
+
+_NAME = re.compile(r"^(?P<dataset>[a-z]+)_(?P<day>\d{4}-\d{2}-\d{2})\.")
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # (source cache key, folder_id, name, modifiedTime) -> DataFrame
+
+
+def name_prefixes():
+    """Name prefixes a branch folder listing must include for partition files."""
+    return [f"{dataset}_" for dataset in PARTITIONED_DATASETS]
+
+
+def partition_day(name, dataset):
+    """'sales_2026-10-01.xlsx' -> '2026-10-01' for dataset 'sales' (None if not a partition)."""
+    match = _NAME.match(name)
+    if not match or match.group("dataset") != dataset or not detect_format(name):
+        return None
+    if name != f"{dataset}_{match.group('day')}.{detect_format(name)}":
+        return None
+    return match.group("day")
+
+
+def partition_files(files, dataset, pick_file):
+    """
+    One file per day for a partitioned dataset, in date order: [(day, file)].
+    `pick_file(files, stem)` chooses among the formats of a day (branch_loader.pick_file).
+    """
+    days = sorted({day for day in (partition_day(f['name'], dataset) for f in files) if day})
+    picked = [(day, pick_file(files, f"{dataset}_{day}")) for day in days]
+    return [(day, file) for day, file in picked if file]
+
+
+def _cache_key(source, folder_id, file):
+    return (getattr(source, "cache_key", id(source)), folder_id, file['name'], file.get('modifiedTime', ''))
+
+
+def _cached(key):
+    with _lock:
+        df = _cache.get(key)
+        if df is not None:
+            _cache.move_to_end(key)
+        return df
+
+
+def _store(key, df):
+    with _lock:
+        _cache[key] = df
+        _cache.move_to_end(key)
+        total = sum(frame_nbytes(d) for d in _cache.values())
+        while total > PARTITION_CACHE_BYTES and len(_cache) > 1:
+            _, evicted = _cache.popitem(last=False)
+            total -= frame_nbytes(evicted)
+
+
+def cache_nbytes():
+    """Size of the parsed partitions kept for the next refresh."""
+    with _lock:
+        return sum(frame_nbytes(df) for df in _cache.values())
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+
+
+def _unify_dtypes(frames):
+    """
+    Per-day frames with one dtype per column. Each day is parsed on its own, so an
+    "id" column can be int64 on one day and text on another (and a count int64 or
+    float64): mixed numeric columns become float64, numeric mixed with text becomes
+    text throughout (see excel_reader "id"). Lines then hash the same on every day.
+    """
+    frames = list(frames)
+    for column in dict.fromkeys(c for df in frames for c in df.columns):
+        dtypes = {df[column].dtype for df in frames if column in df}
+        if len(dtypes) < 2:
+            continue
+        numeric = [pd.api.types.is_numeric_dtype(dtype) for dtype in dtypes]
+        if all(numeric):
+            frames = [df.assign(**{column: df[column].astype("float64")}) if column in df else df for df in frames]
+        elif any(numeric):
+            frames = [df.assign(**{column: as_text(df[column])}) if column in df else df for df in frames]
+    return frames
+
+
+def deduplicate(frames):
+    """
+    Concatenates per-day frames (date order), dropping lines already present in an
+    earlier frame. Identical lines within one file are all kept (a line's key is
+    transaction_id + line hash + its occurrence number within the file).
+    """
+    keyed = []
+    for df in _unify_dtypes(frames):
+        line_hash = pd.util.hash_pandas_object(df, index=False)
+        occurrence = line_hash.groupby(line_hash).cumcount()
+        keyed.append(df.assign(_line_hash=line_hash.to_numpy(), _occurrence=occurrence.to_numpy()))
+
+    combined = pd.concat(keyed, ignore_index=True)
+    duplicated = combined.duplicated(subset=['transaction_id', '_line_hash', '_occurrence'])
+    if duplicated.any():
+        logger.info(f"Dropped {int(duplicated.sum())} line(s) repeated across daily files")
+    return combined.loc[~duplicated].drop(columns=['_line_hash', '_occurrence']).reset_index(drop=True)
+
+
+def load_partitioned(source, folder_id, dataset, parts, load, progress=None):
+    """
+    Loads the daily files of a dataset: cached partitions are reused, the rest are
+    downloaded and parsed in parallel with `load(file_content, fmt)`.
+
+    Args:
+        parts: [(day, file)] from partition_files
+        progress: Optional progress(fraction) over the partitions
+
+    Returns:
+        (DataFrame or None, [names of the partitions that failed])
+    """
+    frames = {}
+    missing = []
+    for day, file in parts:
+        df = _cached(_cache_key(source, folder_id, file))
+        if df is not None:
+            frames[day] = df
+        else:
+            missing.append((day, file))
+
+    def fetch(file):
+        file_content = source.download(file)
+        return load(file_content, detect_format(file['name']))
+
+    failed = []
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(PARTITION_WORKERS, 1), thread_name_prefix="partition") as pool:
+            futures = [(day, file, pool.submit(fetch, file)) for day, file in missing]
+            for done, (day, file, future) in enumerate(futures, start=1):
+                try:
+                    df = future.result()
+                except Exception as e:
+                    logger.error(f"Error loading partition {file['name']}: {e}")
+                    df = None
+                if df is None:
+                    # The loader logged why (its st.* messages are dropped in worker threads)
+                    logger.error(f"Partition {file['name']} of folder {folder_id} not loaded")
+                    failed.append(file['name'])
+                else:
+                    frames[day] = df
+                    _store(_cache_key(source, folder_id, file), df)
+                if progress:
+                    progress(done / len(missing))
+        logger.info(f"Loaded {len(missing) - len(failed)} new partition(s) of {dataset}, "
+                    f"{len(parts) - len(missing)} from cache")
+
+    ordered = [frames[day] for day, _ in parts if day in frames]
+    if not ordered:
+        return None, failed
+    return deduplicate(ordered), failed
+
+
+def describe(dataset, parts):
+    """Display name of a partitioned load: 'sales_2026-10-01..2026-10-19 (19 files)'."""
+    if len(parts) == 1:
+        return parts[0][1]['name']
+    return f"{dataset}_{parts[0][0]}..{parts[-1][0]} ({len(parts)} קבצים)"
+
+
+def newest(parts):
+    """Latest modifiedTime among the partition files."""
+    return max((file.get('modifiedTime', '') for _, file in parts), default='')
@@ -0,0 +1,120 @@
+import logging
+import threading
+
+from services import dataset_registry
+from services.branch_loader import folder_revision, list_many_branches, load_branch_cached
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher(threading.Thread):
+    """
+    Background worker that keeps every branch warm in the dataset registry,
+    so the first login of the day does not wait for download and parse.
+
+    Change detection:
+      - Drive change feed (changes.list page token) when the source supports it
+      - otherwise polls each folder's file revisions (name + modifiedTime)
+
+    A revision is prefetched once: if the registry evicts it later (memory budget),
+    it is not loaded again until the folder changes. A branch is only prefetched
+    while the budget has room for it (its size as last loaded), so warming never
+    evicts other datasets.
+    """
+
+    def __init__(self, source, branch_map, interval=300, publish_sidecars=False, on_loaded=None):
+        super().__init__(name="branch-prefetcher", daemon=True)
+        self.source = source
+        self.branch_map = dict(branch_map)
+        self.interval = interval
+        self.publish_sidecars = publish_sidecars
+        self.on_loaded = on_loaded
+        self._stop_event = threading.Event()
+        self._page_token = None
+        self._prefetched = {}  # branch -> (folder revision, dataset bytes) of the last full load
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        use_changes = hasattr(self.source, "changed_folders")
+        if use_changes:
+            try:
+                self._page_token = self.source.start_change_token()
+            except Exception as e:
+                logger.warning(f"Drive change feed unavailable, polling instead: {e}")
+                use_changes = False
+
+        # Warm everything once, then only what changed
+        self.refresh_all()
+        while not self._stop_event.wait(self.interval):
+            try:
+                if use_changes:
+                    self.refresh_changed()
+                else:
+                    self.refresh_all()
+            except Exception as e:
+                logger.error(f"Prefetch cycle failed: {e}")
+
+    def refresh_changed(self):
+        """Refreshes only branches whose folder appears in the change feed."""
+        folders, self._page_token = self.source.changed_folders(self._page_token)
+        if folders is None:
+            self.refresh_all()
+            return
+        self.refresh_many([branch for branch, folder_id in self.branch_map.items() if folder_id in folders])
+
+    def refresh_all(self):
+        self.refresh_many(list(self.branch_map))
+
+    def refresh_many(self, branches):
+        """Lists the branches' folders in one batched (fresh) lookup, then refreshes each."""
+        if not branches:
+            return
+        try:
+            listings = list_many_branches(self.source, [self.branch_map[b] for b in branches], max_age=0)
+        except Exception as e:
+            logger.error(f"Prefetch listing failed: {e}")
+            return
+        for branch in branches:
+            if self._stop_event.is_set():
+                return
+            self.refresh_branch(branch, listings[self.branch_map[branch]])
+
+    def refresh_branch(self, branch, files):
+        """
+        Loads a branch into the registry if its folder revision changed.
+        Returns True if a fresh load happened.
+        """
+        folder_id = self.branch_map[branch]
+        try:
+            if not files:
+                return False
+            revision = folder_revision(files)
+            last_revision, last_nbytes = self._prefetched.get(branch, (None, 0))
+            if revision in (last_revision, dataset_registry.latest_revision(branch)):
+                return False
+            # The branch's current revision (if idle) is superseded by the new one
+            current = dataset_registry.get(branch)
+            room = dataset_registry.free_bytes() + (current['nbytes'] if current and not current['refcount'] else 0)
+            if room < max(last_nbytes, 1):
+                logger.info(f"Prefetch of branch {branch} skipped: no room in the dataset memory budget")
+                return False
+            df_sales, df_items, _, loaded_revision = load_branch_cached(
+                self.source, branch, folder_id,
+                publish_sidecars=self.publish_sidecars, on_loaded=self.on_loaded, files=files
+            )
+            # The loaders log why a dataset failed; a partial load is not published
+            if df_sales is None or df_items is None:
+                missing = [name for name, df in (("sales", df_sales), ("items", df_items)) if df is None]
+                logger.error(f"Prefetch failed for branch {branch}: {', '.join(missing)} not loaded")
+                return False
+            entry = dataset_registry.get(branch, loaded_revision)
+            # A partial load (failed daily files) has another revision and is retried next cycle
+            if loaded_revision == revision:
+                self._prefetched[branch] = (revision, entry['nbytes'] if entry else 0)
+            logger.info(f"Prefetched branch {branch}")
+            return True
+        except Exception as e:
+            logger.error(f"Prefetch failed for branch {branch}: {e}")
+            return False
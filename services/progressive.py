@@ -0,0 +1,56 @@
+import os
+
+import pandas as pd
+
+from services.kpi_tab1 import kpis_from_actual
+
+# Progressive loading: while a SALES file is fully parsed, its rows are
+# converted BATCH_ROWS at a time (excel_reader.convert_batches) and each
+# batch is folded into running per-transaction totals. The status cards can
+# then show the KPIs of the rows read so far instead of a spinner. Netting is
+# exact across batches (a return in a later batch nets its transaction), so
+# the last batch gives the same numbers as calculate_kpis on the whole frame.
+# Batches stream while the file is read for XLSX sheets scanned column-wise
+# (excel_reader.iter_raw_columns); for workbooks read through calamine and for
+# CSV/Parquet they start once the file has been read. Only the status cards are
+# previewed: the seller table and mix need ITEMS and render with the full page.
+BATCH_ROWS = int(os.getenv("PROGRESSIVE_BATCH_ROWS", "20000"))
+
+
+class PartialKpis:
+    """Running net sales per transaction and latest sale date over the batches seen."""
+
+    def __init__(self):
+        self.txn_net = pd.Series(dtype=float)
+        self.period_end = None
+        self.rows_done = 0
+        self.rows_total = 0
+
+    def add(self, batch, rows_done, rows_total):
+        """Folds one cleaned batch of SALES rows in (see load_sales.load_and_normalize_sales)."""
+        self.rows_done, self.rows_total = rows_done, rows_total
+        if batch.empty:
+            return
+        # As text: a batch may parse ids as int64 while the whole column ends up text
+        # (excel_reader.convert_columns); str of an integer id is its text form
+        keys = batch['transaction_id'].map(str, na_action='ignore')
+        totals = batch['line_amount'].groupby(keys).sum()
+        self.txn_net = self.txn_net.add(totals, fill_value=0) if len(self.txn_net) else totals.astype(float)
+        batch_end = batch['date'].max()
+        if self.period_end is None or batch_end > self.period_end:
+            self.period_end = batch_end
+
+    @property
+    def fraction(self):
+        return self.rows_done / self.rows_total if self.rows_total else 0.0
+
+    @property
+    def complete(self):
+        return self.rows_total > 0 and self.rows_done >= self.rows_total
+
+    def kpis(self, target=0):
+        """KPI dict (as calculate_kpis) of the rows seen so far, or None before the first dated row."""
+        if self.period_end is None:
+            return None
+        actual_to_date = self.txn_net[self.txn_net > 0].sum()
+        return kpis_from_actual(self.period_end, actual_to_date, target)
@@ -0,0 +1,206 @@
+import os
+import csv
+import shutil
+import zipfile
+import datetime
+import tempfile
+
+import pandas as pd
+
+from services.kpi_tab1 import calculate_kpis
+from services import kpi_tab2, kpi_tab3
+
+# Report tables: key -> sheet / CSV name. Every row carries its branch,
+# so one file covers a single branch or the whole region.
+REPORTS = {
+    "kpis": "KPI",
+    "sellers": "מוכרים",
+    "mix": "תמהיל",
+}
+BRANCH_COLUMN = "סניף"
+
+KPI_LABELS = {
+    "period_end_date": "תאריך עדכון",
+    "target": "יעד חודשי",
+    "actual_to_date": "מכירות עד היום",
+    "avg_daily": "ממוצע יומי בפועל",
+    "required_daily": "ממוצע יומי נדרש",
+    "projected_amount": "תחזית סיום חודש",
+    "projected_percent": "צפי סיום %",
+    "days_in_month": "ימים בחודש",
+    "elapsed_days": "ימים שעברו",
+}
+
+EXPORT_FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "application/zip",
+}
+
+
+def kpi_frame(kpis):
+    """KPI dict as a one-row frame with the Tab 1 labels."""
+    if not kpis:
+        return pd.DataFrame()
+    row = {label: kpis.get(key) for key, label in KPI_LABELS.items()}
+    return pd.DataFrame([row])
+
+
+def mix_frame(pivot):
+    """Category pivot with the seller name as a regular column."""
+    if pivot is None or pivot.empty:
+        return pd.DataFrame()
+    frame = pivot.reset_index()
+    frame = frame.rename(columns={frame.columns[0]: "שם מוכר"})
+    frame.columns = [str(col) for col in frame.columns]
+    return frame
+
+
+def branch_reports(kpis, df_sellers, pivot):
+    """Report tables of one branch from its computed views."""
+    return {
+        "kpis": kpi_frame(kpis),
+        "sellers": df_sellers if df_sellers is not None else pd.DataFrame(),
+        "mix": mix_frame(pivot),
+    }
+
+
+def compute_branch_reports(sales_df, items_df, target=0):
+    """Report tables of one branch from its normalized frames."""
+    return branch_reports(
+        calculate_kpis(sales_df, target=target),
+        kpi_tab2.get_seller_table(sales_df, items_df),
+        kpi_tab3.build_category_pivot(items_df, metric="units"),
+    )
+
+
+def _cell(value):
+    """Plain Python value for writers (no numpy scalars / NaN / pandas timestamps)."""
+    if value is None:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def _rows(branch, df):
+    for row in df.itertuples(index=False, name=None):
+        yield [branch] + [_cell(v) for v in row]
+
+
+class _SheetWriters:
+    """One appendable output per report; the header is written when a table first has columns."""
+
+    def __init__(self, open_sheet):
+        self._open_sheet = open_sheet
+        self._sheets = {}
+
+    def append(self, key, branch, df):
+        if df is None or df.empty:
+            return
+        sheet = self._sheets.get(key)
+        if sheet is None:
+            sheet = self._sheets[key] = self._open_sheet(key)
+            sheet.append([BRANCH_COLUMN] + [str(col) for col in df.columns])
+        for row in _rows(branch, df):
+            sheet.append(row)
+
+
+def write_xlsx(out, reports_by_branch):
+    """
+    Streams (branch, reports) pairs into one workbook (openpyxl write-only mode):
+    rows go to per-sheet temp files as they arrive, so only the current branch is in memory.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    writers = _SheetWriters(lambda key: workbook.create_sheet(REPORTS[key]))
+    for branch, reports in reports_by_branch:
+        for key in REPORTS:
+            writers.append(key, branch, reports.get(key))
+    if not workbook.worksheets:
+        workbook.create_sheet(REPORTS["kpis"]).append([BRANCH_COLUMN])
+    workbook.save(out)
+
+
+class _CsvSheet:
+    def __init__(self, path):
+        self.file = open(path, "w", newline="", encoding="utf-8-sig")
+        self.writer = csv.writer(self.file)
+
+    def append(self, row):
+        self.writer.writerow(row)
+
+
+def write_csv_zip(out, reports_by_branch):
+    """
+    Streams (branch, reports) pairs into one CSV per report (UTF-8 with BOM for Excel),
+    written incrementally to temp files and then packed into a zip.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="kpi_export_")
+    sheets = {}
+    try:
+        def open_sheet(key):
+            sheets[key] = _CsvSheet(os.path.join(tmp_dir, f"{key}.csv"))
+            return sheets[key]
+
+        writers = _SheetWriters(open_sheet)
+        for branch, reports in reports_by_branch:
+            for key in REPORTS:
+                writers.append(key, branch, reports.get(key))
+        for sheet in sheets.values():
+            sheet.file.close()
+
+        with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for key in REPORTS:
+                if key in sheets:
+                    archive.write(os.path.join(tmp_dir, f"{key}.csv"), f"{REPORTS[key]}.csv")
+    finally:
+        for sheet in sheets.values():
+            sheet.file.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def write_export(out, reports_by_branch, fmt="xlsx"):
+    """Writes an export in `fmt` ('xlsx' / 'csv') to a path or binary file object."""
+    if fmt == "xlsx":
+        write_xlsx(out, reports_by_branch)
+    elif fmt == "csv":
+        write_csv_zip(out, reports_by_branch)
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+
+def export_file_name(scope, fmt="xlsx"):
+    """'kpi_S23_2026-10-19.xlsx' / 'kpi_all_2026-10-19.zip'"""
+    extension = "xlsx" if fmt == "xlsx" else "zip"
+    return f"kpi_{scope}_{datetime.date.today().isoformat()}.{extension}"
+
+
+def export_bytes(reports_by_branch, fmt="xlsx"):
+    """
+    Export as bytes for a download button. Only the finished (compressed) file is
+    held in memory; it is built in a temp file that stays in memory only while small.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as out:
+        write_export(out, reports_by_branch, fmt)
+        out.seek(0)
+        return out.read()
+
+
+def iter_source_reports(source, branch_map, target=0, publish_sidecars=False):
+    """
+    (branch, reports) for every branch of a Drive/local source, loading one branch
+    at a time (folder listings resolved in one batch, see services/folder_metadata).
+    """
+    from services.branch_loader import list_many_branches, load_branch
+
+    listings = list_many_branches(source, list(branch_map.values()))
+    for branch, folder_id in branch_map.items():
+        df_sales, df_items, _, _ = load_branch(source, folder_id, publish_sidecars, listings[folder_id])
+        if df_sales is None or df_items is None:
+            continue
+        yield branch, compute_branch_reports(df_sales, df_items, target)
@@ -0,0 +1,75 @@
+import re
+import unicodedata
+from collections import defaultdict
+from functools import reduce
+
+import numpy as np
+
+# Substring search over short display strings (seller names, product
+# descriptions), built once per dataset revision. Strings are normalized so
+# the way a name was typed in the ERP does not matter, then indexed by
+# character trigrams: a query is narrowed to the strings containing all of its
+# trigrams and only those are checked with a substring test.
+NGRAM = 3
+
+# Niqqud / cantillation marks and bidi control characters
+_MARKS = re.compile("[\u0591-\u05C7\u200E\u200F\u202A-\u202E]")
+# Geresh / gershayim and the quote characters typed in their place
+_QUOTES = re.compile("[\u05F3\u05F4'\"`\u2018\u2019\u201C\u201D\u201E]")
+_SPACES = re.compile(r"\s+")
+# Final letters -> regular forms, so a prefix of a word matches inside longer words
+_FINALS = str.maketrans("ךםןףץ", "כמנפצ")
+
+
+def normalize(text):
+    """
+    Search form of a string: NFKC, case-folded, without niqqud, geresh / gershayim
+    or quotes, final letters as regular letters and single spaces.
+    'סה"כ' / 'סה״כ' / 'סהכ' all become 'סהכ'.
+    """
+    if text is None or (isinstance(text, float) and text != text):
+        return ""
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    text = _QUOTES.sub("", _MARKS.sub("", text))
+    return _SPACES.sub(" ", text.translate(_FINALS)).strip()
+
+
+class SearchIndex:
+    """
+    Trigram index over a list of strings. search() returns positions in that list,
+    so callers map matches back to their own rows.
+    """
+
+    def __init__(self, values):
+        self.normalized = [normalize(v) for v in values]
+
+        postings = defaultdict(list)
+        for i, text in enumerate(self.normalized):
+            for gram in {text[j:j + NGRAM] for j in range(len(text) - NGRAM + 1)}:
+                postings[gram].append(i)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.normalized)
+
+    def search(self, query):
+        """Ascending positions of the strings containing `query` (all positions for an empty query)."""
+        query = normalize(query)
+        if not query:
+            return np.arange(len(self.normalized))
+
+        if len(query) < NGRAM:
+            candidates = range(len(self.normalized))
+        else:
+            grams = {query[j:j + NGRAM] for j in range(len(query) - NGRAM + 1)}
+            lists = [self.postings.get(gram) for gram in grams]
+            if any(ids is None for ids in lists):
+                return np.array([], dtype=np.int64)
+            # Shortest posting lists first keeps the intersections small
+            candidates = reduce(np.intersect1d, sorted(lists, key=len))
+
+        return np.array([i for i in candidates if query in self.normalized[i]], dtype=np.int64)
+
+    @property
+    def nbytes(self):
+        return sum(ids.nbytes for ids in self.postings.values()) + sum(len(t) for t in self.normalized)
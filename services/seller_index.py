@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from services import kpi_tab3
+
+
+class SellerIndex:
+    """
+    Per-seller row index over the whitelisted ITEMS frame, built once per dataset.
+    Rows are sorted by seller so each seller is a contiguous slice [start, end),
+    and a per-seller view touches only that seller's rows.
+    """
+
+    def __init__(self, items_df):
+        whitelisted = kpi_tab3.filter_whitelist(items_df)
+        if whitelisted.empty:
+            self.frame = whitelisted
+            self.offsets = {}
+            self.sellers = []
+            return
+
+        # Stable sort keeps the original row order within each seller
+        self.frame = whitelisted.sort_values('seller_name', kind='stable', na_position='last')
+        names = self.frame['seller_name'].to_numpy()
+        valid = pd.notna(names)
+
+        unique, starts = np.unique(names[valid].astype(str), return_index=True)
+        ends = np.append(starts[1:], valid.sum())
+        self.offsets = {str(name): (int(s), int(e)) for name, s, e in zip(unique, starts, ends)}
+
+        # Selector options: every seller in ITEMS, not only whitelisted ones
+        all_names = items_df['seller_name'].dropna().unique()
+        self.sellers = sorted(all_names.tolist())
+
+    def rows(self, seller_name):
+        """Whitelisted rows of one seller (empty frame if unknown)."""
+        start, end = self.offsets.get(seller_name, (0, 0))
+        return self.frame.iloc[start:end]
+
+    @property
+    def nbytes(self):
+        return int(self.frame.memory_usage(deep=True, index=True).sum())
@@ -0,0 +1,261 @@
+import os
+import datetime
+import functools
+import logging
+
+import pandas as pd
+
+from services.agg_kernel import ItemsKernel, SalesKernel
+from services.kpi_tab1 import calculate_kpis
+from services import kpi_tab2, kpi_tab3, ticket_sketch
+
+logger = logging.getLogger(__name__)
+
+# Compact per-branch monthly aggregates, kept after a month rolls over so
+# MoM / YoY comparisons never need old workbooks:
+#   <SNAPSHOT_DIR>/<branch>/<YYYY-MM>/{kpis,sellers,mix,daily,tickets}.parquet
+# The current month's snapshot is rewritten on every new revision.
+# `tickets` holds the ticket-size sketches of the branch and its sellers
+# (services/ticket_sketch), so percentiles over many branches merge snapshots.
+# Opt-in: nothing is written or read unless SNAPSHOT_DIR is set (e.g. a mounted volume).
+SNAPSHOT_TABLES = ("daily", "sellers", "mix", "tickets", "kpis")  # kpis last: it marks the snapshot complete
+
+BASELINES = {
+    "mom": "חודש קודם",
+    "yoy": "שנה קודמת",
+}
+
+# Seller ratios comparable between a partial and a full month
+SELLER_RATIO_COLUMNS = ["ממוצע עסקה", "ממוצע פריטים לעסקה", "יחס מוצר משלים לעסקה"]
+TOTAL_ROW = 'סה"כ'
+
+
+def get_snapshot_dir():
+    """Archive root, or None when the archive is disabled."""
+    return os.getenv("SNAPSHOT_DIR") or None
+
+
+def _path(branch, period, table, root=None):
+    root = root or get_snapshot_dir()
+    return os.path.join(root, branch, period, f"{table}.parquet") if root else None
+
+
+def baseline_period(period, baseline):
+    """'2026-03' -> '2026-02' (mom) / '2025-03' (yoy)."""
+    year, month = int(period[:4]), int(period[5:7])
+    if baseline == "yoy":
+        return f"{year - 1:04d}-{month:02d}"
+    if month == 1:
+        return f"{year - 1:04d}-12"
+    return f"{year:04d}-{month - 1:02d}"
+
+
+def daily_totals(sales_df):
+    """Net sales and positive transactions per day (a transaction counts on its last date)."""
+    txns = sales_df.groupby('transaction_id').agg(net=('line_amount', 'sum'), date=('date', 'max'))
+    txns = txns[txns['net'] > 0]
+    daily = txns.groupby(txns['date'].dt.normalize()).agg(sales=('net', 'sum'), transactions=('net', 'size'))
+    daily.index.name = 'date'
+    return daily.reset_index()
+
+
+def build_snapshot(revision, sales_df, items_df):
+    """Aggregates of one branch-month: {'kpis', 'sellers', 'mix', 'daily', 'tickets'} frames."""
+    sales_kernel = SalesKernel(sales_df)
+    items_kernel = ItemsKernel(items_df) if items_df is not None and not items_df.empty else None
+
+    kpis = calculate_kpis(sales_df, kernel=sales_kernel)
+    daily = daily_totals(sales_df)
+    pivot = kpi_tab3.build_category_pivot(items_df, metric="units", kernel=items_kernel)
+
+    kpi_row = pd.DataFrame([{
+        "revision": revision,
+        "period_end_date": kpis["period_end_date"],
+        "actual_to_date": float(kpis["actual_to_date"]),
+        "transactions": int(daily['transactions'].sum()),
+        "elapsed_days": int(kpis["elapsed_days"]),
+        "days_in_month": int(kpis["days_in_month"]),
+        "saved_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }])
+    mix = pd.DataFrame()
+    if not pivot.empty:
+        mix = pivot.reset_index()
+        mix = mix.rename(columns={mix.columns[0]: 'seller_name'})
+        mix.columns = [str(col) for col in mix.columns]
+
+    sketches = ticket_sketch.BranchSketches(sales_kernel)
+    tickets = ticket_sketch.to_frame({TOTAL_ROW: sketches.branch, **sketches.by_seller_name()})
+
+    return {
+        "daily": daily,
+        "sellers": kpi_tab2.get_seller_table(sales_df, items_df, sales_kernel, items_kernel).reset_index(drop=True),
+        "mix": mix,
+        "tickets": tickets,
+        "kpis": kpi_row,
+    }
+
+
+def saved_revision(branch, period, root=None):
+    path = _path(branch, period, "kpis", root)
+    if path is None or not os.path.exists(path):
+        return None
+    return _read(path, os.path.getmtime(path))['revision'].iloc[0]
+
+
+def save_snapshot(branch, revision, sales_df, items_df, root=None):
+    """
+    Archives the month of a freshly loaded branch dataset (skipped if this revision
+    is already archived). Returns the period (YYYY-MM), or None if there is no sales
+    data or no archive directory.
+    """
+    if sales_df is None or sales_df.empty or not (root or get_snapshot_dir()):
+        return None
+    period = sales_df['date'].max().strftime("%Y-%m")
+    if saved_revision(branch, period, root) == revision:
+        return period
+
+    # Only the snapshot month; older rows in the files belong to archived months
+    month_sales = sales_df[sales_df['date'].dt.strftime("%Y-%m") == period]
+    snapshot = build_snapshot(revision, month_sales, items_df)
+
+    folder = os.path.dirname(_path(branch, period, "kpis", root))
+    os.makedirs(folder, exist_ok=True)
+    for table in SNAPSHOT_TABLES:
+        path = _path(branch, period, table, root)
+        tmp_path = path + ".tmp"
+        snapshot[table].to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    logger.info(f"Archived snapshot {branch} {period} ({revision})")
+    return period
+
+
+@functools.lru_cache(maxsize=256)
+def _read(path, mtime):
+    # mtime is part of the key so a rewritten snapshot is re-read
+    return pd.read_parquet(path)
+
+
+def load_snapshot(branch, period, table, root=None):
+    """One table of an archived branch-month, or None."""
+    path = _path(branch, period, table, root)
+    if path is None or not os.path.exists(path):
+        return None
+    return _read(path, os.path.getmtime(path))
+
+
+def list_snapshots(branch, root=None):
+    """Archived months of a branch, newest first."""
+    root = root or get_snapshot_dir()
+    folder = os.path.join(root, branch) if root else None
+    if folder is None or not os.path.isdir(folder):
+        return []
+    return sorted(
+        (p for p in os.listdir(folder) if os.path.exists(_path(branch, p, "kpis", root))),
+        reverse=True
+    )
+
+
+def list_branches(root=None):
+    """Branches with at least one archived month."""
+    folder = root or get_snapshot_dir()
+    if folder is None or not os.path.isdir(folder):
+        return []
+    return sorted(b for b in os.listdir(folder) if list_snapshots(b, root))
+
+
+def region_ticket_sketch(period, branches=None, root=None):
+    """
+    Ticket-size sketch of a month over many branches (all archived ones by default),
+    merged from their snapshot sketches. Returns (sketch, branches merged).
+    """
+    merged, found = ticket_sketch.TicketSketch(), []
+    for branch in (list_branches(root) if branches is None else branches):
+        tickets = load_snapshot(branch, period, "tickets", root)
+        if tickets is None or tickets.empty:
+            continue
+        sketch = ticket_sketch.from_frame(tickets[tickets['name'] == TOTAL_ROW]).get(TOTAL_ROW)
+        if sketch is not None:
+            merged = merged.merge(sketch)
+            found.append(branch)
+    return merged, found
+
+
+# --- Comparisons (read snapshots only) ---
+
+def _pct_change(current, previous):
+    return (current - previous) / previous * 100 if previous else None
+
+
+def kpi_comparisons(branch, kpis, root=None):
+    """
+    Sales to date vs the same point (day of month) of the baseline months.
+
+    Returns:
+        {baseline: {"period", "to_date", "full_month", "delta_pct"}} for baselines with a snapshot.
+    """
+    if not kpis:
+        return {}
+    period_end = kpis["period_end_date"]
+    period = period_end.strftime("%Y-%m")
+
+    comparisons = {}
+    for baseline in BASELINES:
+        previous = baseline_period(period, baseline)
+        daily = load_snapshot(branch, previous, "daily", root)
+        if daily is None or daily.empty:
+            continue
+        to_date = daily.loc[daily['date'].dt.day <= period_end.day, 'sales'].sum()
+        comparisons[baseline] = {
+            "period": previous,
+            "to_date": float(to_date),
+            "full_month": float(daily['sales'].sum()),
+            "delta_pct": _pct_change(float(kpis["actual_to_date"]), float(to_date)),
+        }
+    return comparisons
+
+
+def seller_deltas(branch, period, df_sellers, baseline="mom", root=None):
+    """
+    Per-seller change of the ratio columns vs the baseline month
+    ("Δ <column>", NaN for sellers without history). None if there is no snapshot.
+    """
+    if df_sellers is None or df_sellers.empty or not period:
+        return None
+    previous = load_snapshot(branch, baseline_period(period, baseline), "sellers", root)
+    if previous is None or previous.empty:
+        return None
+
+    previous = previous.drop_duplicates("שם מוכר").set_index("שם מוכר")[SELLER_RATIO_COLUMNS]
+    current = df_sellers.set_index("שם מוכר")[SELLER_RATIO_COLUMNS]
+    deltas = current - previous.reindex(current.index)
+    deltas.columns = [f"Δ {col}" for col in SELLER_RATIO_COLUMNS]
+    return deltas.reset_index()
+
+
+def category_share_deltas(branch, period, df_dist, seller_name=None, baseline="mom", root=None):
+    """
+    Category share (% of units) vs the baseline month, for the branch or one seller.
+    Returns {category: delta in percentage points}, or None if there is no snapshot.
+    """
+    if df_dist is None or df_dist.empty or not period:
+        return None
+    mix = load_snapshot(branch, baseline_period(period, baseline), "mix", root)
+    if mix is None or mix.empty:
+        return None
+
+    row_name = seller_name if seller_name and seller_name != "הכל" else TOTAL_ROW
+    rows = mix[mix['seller_name'] == row_name]
+    if rows.empty:
+        return None
+    categories = [c for c in kpi_tab3.WHITELIST_CATEGORIES if c in mix.columns]
+    previous = rows.iloc[0][categories].astype(float)
+    previous_total = previous.sum()
+    if not previous_total:
+        return None
+
+    current_total = df_dist['value'].sum()
+    deltas = {}
+    for category, value in zip(df_dist['category'], df_dist['value']):
+        current_share = value / current_total * 100 if current_total else 0
+        deltas[category] = current_share - previous.get(category, 0) / previous_total * 100
+    return deltas
@@ -0,0 +1,349 @@
+import os
+import sqlite3
+import datetime
+import threading
+import contextlib
+
+import pandas as pd
+
+from services.kpi_tab1 import kpis_from_actual
+from services.kpi_tab2 import assemble_seller_table, is_excluded_category
+from services import kpi_tab3
+
+# Embedded analytical store (stdlib sqlite3) holding the normalized SALES/ITEMS
+# of every branch. Point KPI_STORE_PATH at a mounted volume to survive restarts.
+DEFAULT_STORE_PATH = os.path.join("data", "kpi_store.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS revisions (
+    branch TEXT NOT NULL,
+    revision TEXT NOT NULL,
+    period TEXT NOT NULL,
+    ingested_at TEXT NOT NULL,
+    sales_rows INTEGER NOT NULL,
+    items_rows INTEGER NOT NULL,
+    PRIMARY KEY (branch, revision)
+);
+
+CREATE TABLE IF NOT EXISTS sales (
+    branch TEXT NOT NULL,
+    revision TEXT NOT NULL,
+    date TEXT NOT NULL,
+    transaction_id TEXT,
+    seller_id TEXT,
+    seller_name TEXT,
+    product_desc TEXT,
+    qty REAL NOT NULL,
+    line_amount REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sales_branch_date ON sales (branch, date);
+CREATE INDEX IF NOT EXISTS idx_sales_branch_seller ON sales (branch, seller_id);
+CREATE INDEX IF NOT EXISTS idx_sales_branch_txn ON sales (branch, transaction_id);
+
+-- ITEMS is a per-month aggregate without dates; rows are tagged with the sales period (YYYY-MM)
+CREATE TABLE IF NOT EXISTS items (
+    branch TEXT NOT NULL,
+    revision TEXT NOT NULL,
+    period TEXT NOT NULL,
+    seller_id TEXT,
+    seller_name TEXT,
+    category_param12 TEXT,
+    units REAL NOT NULL,
+    revenue REAL NOT NULL,
+    transactions REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_items_branch_period ON items (branch, period);
+"""
+
+
+def get_store_path():
+    return os.getenv("KPI_STORE_PATH", DEFAULT_STORE_PATH)
+
+
+# One connection per store path for the whole process (created with the schema
+# on first use), used by one thread at a time
+_lock = threading.Lock()
+_connections = {}  # store path -> (connection, its lock)
+
+
+def _connection(path):
+    with _lock:
+        if path not in _connections:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Streamlit script threads are short-lived: the connection is shared, guarded by its lock
+            conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            _connections[path] = (conn, threading.Lock())
+        return _connections[path]
+
+
+@contextlib.contextmanager
+def connect(path=None):
+    """
+    The process's connection to the store, held exclusively for the block;
+    committed on success and rolled back on error.
+    WAL lets other processes read while a branch is being ingested.
+    """
+    conn, lock = _connection(path or get_store_path())
+    with lock:
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def _text(v):
+    if v is None or (isinstance(v, float) and pd.isna(v)):
+        return None
+    return str(v)
+
+
+def _month_bounds(period):
+    """'2026-01' -> ('2026-01-01', '2026-01-31')"""
+    start = datetime.date.fromisoformat(f"{period}-01")
+    next_month = (start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return start.isoformat(), (next_month - datetime.timedelta(days=1)).isoformat()
+
+
+def has_revision(branch, revision, path=None):
+    with connect(path) as conn:
+        row = conn.execute(
+            "SELECT 1 FROM revisions WHERE branch = ? AND revision = ?", (branch, revision)
+        ).fetchone()
+    return row is not None
+
+
+def ingest(branch, revision, sales_df, items_df, path=None):
+    """
+    Stores a branch's normalized frames under a revision (idempotent per revision).
+    The new files are authoritative for the dates they cover: older rows of the
+    branch in that date range (and ITEMS of that month) are replaced, earlier
+    months are kept as history.
+
+    Returns:
+        The period (YYYY-MM) the data was stored under, or None if there is no sales data.
+    """
+    if sales_df is None or sales_df.empty:
+        return None
+
+    # Every login / revision switch stores its dataset: answer from the store before building rows
+    if has_revision(branch, revision, path):
+        return sales_df['date'].max().strftime("%Y-%m")
+
+    dates = sales_df['date'].dt.strftime("%Y-%m-%d")
+    date_from, date_to = dates.min(), dates.max()
+    period = date_to[:7]
+
+    sales_rows = list(zip(
+        [branch] * len(sales_df),
+        [revision] * len(sales_df),
+        dates,
+        map(_text, sales_df['transaction_id']),
+        map(_text, sales_df['seller_id']),
+        map(_text, sales_df['seller_name']),
+        map(_text, sales_df['product_desc']),
+        sales_df['qty'].astype(float),
+        sales_df['line_amount'].astype(float)
+    ))
+
+    items_rows = []
+    if items_df is not None and not items_df.empty:
+        items_rows = list(zip(
+            [branch] * len(items_df),
+            [revision] * len(items_df),
+            [period] * len(items_df),
+            map(_text, items_df['seller_id']),
+            map(_text, items_df['seller_name']),
+            map(_text, items_df['category_param12']),
+            items_df['units'].astype(float),
+            items_df['revenue'].astype(float),
+            pd.to_numeric(items_df['transactions'], errors='coerce').fillna(0).astype(float)
+        ))
+
+    with connect(path) as conn:
+        if conn.execute(
+            "SELECT 1 FROM revisions WHERE branch = ? AND revision = ?", (branch, revision)
+        ).fetchone():
+            return period
+
+        conn.execute(
+            "DELETE FROM sales WHERE branch = ? AND date BETWEEN ? AND ?", (branch, date_from, date_to)
+        )
+        conn.execute("DELETE FROM items WHERE branch = ? AND period = ?", (branch, period))
+        conn.executemany("INSERT INTO sales VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", sales_rows)
+        conn.executemany("INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", items_rows)
+        conn.execute(
+            "INSERT INTO revisions VALUES (?, ?, ?, ?, ?, ?)",
+            (branch, revision, period, datetime.datetime.now().isoformat(timespec="seconds"),
+             len(sales_rows), len(items_rows))
+        )
+    return period
+
+
+def latest_period(branch, path=None):
+    """Most recent month (YYYY-MM) with sales for the branch, or None."""
+    with connect(path) as conn:
+        row = conn.execute("SELECT MAX(date) FROM sales WHERE branch = ?", (branch,)).fetchone()
+    return row[0][:7] if row and row[0] else None
+
+
+def list_periods(branch, path=None):
+    """All months with sales for the branch, newest first."""
+    with connect(path) as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT substr(date, 1, 7) AS period FROM sales WHERE branch = ? ORDER BY period DESC",
+            (branch,)
+        ).fetchall()
+    return [r[0] for r in rows]
+
+
+# --- Queries (same semantics as the in-memory kpi_tab* functions) ---
+
+def query_kpis(branch, target=0, period=None, path=None):
+    """calculate_kpis for one branch and month, via SQL."""
+    period = period or latest_period(branch, path)
+    if not period:
+        return None
+    date_from, date_to = _month_bounds(period)
+
+    with connect(path) as conn:
+        period_end, actual = conn.execute("""
+            SELECT MAX(max_date), COALESCE(SUM(CASE WHEN net > 0 THEN net END), 0)
+            FROM (
+                SELECT transaction_id, SUM(line_amount) AS net, MAX(date) AS max_date
+                FROM sales
+                WHERE branch = ? AND date BETWEEN ? AND ?
+                GROUP BY transaction_id
+            )
+        """, (branch, date_from, date_to)).fetchone()
+
+    if period_end is None:
+        return None
+    return kpis_from_actual(pd.Timestamp(period_end), actual, target)
+
+
+def query_branch_totals(period, path=None):
+    """Net sales to date per branch for a month (cross-branch comparison)."""
+    date_from, date_to = _month_bounds(period)
+    with connect(path) as conn:
+        df = pd.read_sql_query("""
+            SELECT branch, SUM(CASE WHEN net > 0 THEN net ELSE 0 END) AS actual_to_date,
+                   COUNT(CASE WHEN net > 0 THEN 1 END) AS transactions, MAX(max_date) AS period_end
+            FROM (
+                SELECT branch, transaction_id, SUM(line_amount) AS net, MAX(date) AS max_date
+                FROM sales
+                WHERE date BETWEEN ? AND ?
+                GROUP BY branch, transaction_id
+            )
+            GROUP BY branch
+            ORDER BY actual_to_date DESC
+        """, conn, params=(date_from, date_to))
+    return df
+
+
+def query_seller_table(branch, period=None, path=None):
+    """get_seller_table for one branch and month, via SQL."""
+    period = period or latest_period(branch, path)
+    if not period:
+        return pd.DataFrame()
+    date_from, date_to = _month_bounds(period)
+
+    with connect(path) as conn:
+        txns = pd.read_sql_query("""
+            SELECT seller_id, COUNT(*) AS transactions, SUM(net) AS sales
+            FROM (
+                SELECT transaction_id, seller_id, SUM(line_amount) AS net
+                FROM sales
+                WHERE branch = ? AND date BETWEEN ? AND ?
+                GROUP BY transaction_id, seller_id
+            )
+            WHERE net > 0
+            GROUP BY seller_id
+        """, conn, params=(branch, date_from, date_to)).set_index('seller_id')
+
+        units = pd.read_sql_query("""
+            SELECT seller_id, SUM(qty) AS total_units
+            FROM sales
+            WHERE branch = ? AND date BETWEEN ? AND ? AND qty > 0
+            GROUP BY seller_id
+        """, conn, params=(branch, date_from, date_to)).set_index('seller_id')
+
+        # First name seen per seller (matches drop_duplicates on the in-memory frame)
+        names = pd.read_sql_query("""
+            SELECT seller_id, seller_name
+            FROM sales
+            WHERE rowid IN (
+                SELECT MIN(rowid) FROM sales
+                WHERE branch = ? AND date BETWEEN ? AND ?
+                GROUP BY seller_id
+            )
+        """, conn, params=(branch, date_from, date_to)).set_index('seller_id')
+
+        categories = pd.read_sql_query("""
+            SELECT seller_id, category_param12, SUM(units) AS units
+            FROM items
+            WHERE branch = ? AND period = ?
+            GROUP BY seller_id, category_param12
+        """, conn, params=(branch, period))
+
+    if txns.empty:
+        return pd.DataFrame()
+
+    complement = categories[~categories['category_param12'].apply(is_excluded_category)]
+    seller_complement_units = complement.groupby('seller_id')['units'].sum().rename('complement_units')
+
+    return assemble_seller_table(
+        names['seller_name'], txns['sales'], txns['transactions'], units['total_units'], seller_complement_units
+    )
+
+
+def query_top_products(branch, by="qty", period=None, limit=5, path=None):
+    """get_top_products_qty / get_top_products_amount for one branch and month, via SQL."""
+    period = period or latest_period(branch, path)
+    if not period:
+        return pd.DataFrame()
+    date_from, date_to = _month_bounds(period)
+
+    if by == "qty":
+        sql = """
+            SELECT product_desc AS "תיאור מוצר", SUM(qty) AS "כמות"
+            FROM sales
+            WHERE branch = ? AND date BETWEEN ? AND ? AND qty > 0
+            GROUP BY product_desc ORDER BY 2 DESC LIMIT ?
+        """
+    else:
+        sql = """
+            SELECT product_desc AS "תיאור מוצר", SUM(line_amount) AS "סכום"
+            FROM sales
+            WHERE branch = ? AND date BETWEEN ? AND ?
+            GROUP BY product_desc ORDER BY 2 DESC LIMIT ?
+        """
+    with connect(path) as conn:
+        return pd.read_sql_query(sql, conn, params=(branch, date_from, date_to, limit))
+
+
+def query_items_summary(branch, period=None, path=None):
+    """
+    ITEMS for one branch and month, pre-grouped by seller and category.
+    Drop-in for items_df in the mix views (build_category_pivot / distribution).
+    """
+    period = period or latest_period(branch, path)
+    if not period:
+        return pd.DataFrame()
+    with connect(path) as conn:
+        return pd.read_sql_query("""
+            SELECT seller_id, seller_name, category_param12,
+                   SUM(units) AS units, SUM(revenue) AS revenue, SUM(transactions) AS transactions
+            FROM items
+            WHERE branch = ? AND period = ?
+            GROUP BY seller_id, seller_name, category_param12
+        """, conn, params=(branch, period))
+
+
+def query_category_pivot(branch, metric="units", period=None, path=None):
+    """build_category_pivot for one branch and month, aggregated in SQL first."""
+    return kpi_tab3.build_category_pivot(query_items_summary(branch, period, path), metric=metric)
@@ -0,0 +1,152 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from services.agg_kernel import group_sum
+
+# Mergeable distribution sketches of ticket sizes (net transaction totals).
+# Every sketch uses the same fixed log-spaced bins, so sketches of sellers,
+# branches or months merge by adding their counts, and a median / p90 of any
+# union comes from a few KB of counts instead of the transactions themselves.
+# A value is reported as its bin's midpoint, at most RELATIVE_ACCURACY away
+# from the exact percentile (tickets outside [MIN_TICKET, MAX_TICKET] are
+# clamped into the first / last bin).
+RELATIVE_ACCURACY = 0.01
+MIN_TICKET = 1.0
+MAX_TICKET = 1e7
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+N_BINS = math.ceil(math.log(MAX_TICKET / MIN_TICKET) / _LOG_GAMMA) + 1
+
+# Percentiles shown next to the mean ticket
+PERCENTILES = {"חציון עסקה": 0.5, "עסקה P90": 0.9}
+
+
+def bin_index(values):
+    """Bin of each ticket value: bin i holds (MIN_TICKET * gamma^(i-1), MIN_TICKET * gamma^i]."""
+    values = np.maximum(np.asarray(values, dtype=float), MIN_TICKET)
+    bins = np.ceil(np.log(values / MIN_TICKET) / _LOG_GAMMA - 1e-9)
+    return np.clip(bins, 0, N_BINS - 1).astype(np.int64)
+
+
+def bin_value(index):
+    """Representative ticket value of a bin (within RELATIVE_ACCURACY of any value in it)."""
+    if index == 0:
+        return MIN_TICKET
+    return MIN_TICKET * 2 * _GAMMA ** index / (_GAMMA + 1)
+
+
+class TicketSketch:
+    """Histogram of ticket sizes over the shared bins; `a.merge(b)` is the sketch of both."""
+
+    def __init__(self, counts=None):
+        self.counts = np.zeros(N_BINS, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+
+    @classmethod
+    def from_values(cls, values):
+        return cls(np.bincount(bin_index(values), minlength=N_BINS))
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def merge(self, other):
+        return TicketSketch(self.counts + other.counts)
+
+    def quantile(self, q):
+        """Ticket size at quantile q (lower rank), or None for an empty sketch."""
+        n = self.count
+        if n == 0:
+            return None
+        rank = int(math.floor(q * (n - 1)))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank + 1))
+        return bin_value(index)
+
+    @property
+    def nbytes(self):
+        return int(self.counts.nbytes)
+
+
+def merge_all(sketches):
+    """One sketch of many (an empty sketch if there are none)."""
+    merged = TicketSketch()
+    for sketch in sketches:
+        merged = merged.merge(sketch)
+    return merged
+
+
+class BranchSketches:
+    """
+    Ticket sketches of one SALES frame: the branch (positive net transactions,
+    as net_sales) and each seller (positive net per transaction and seller,
+    as the seller table's ממוצע עסקה).
+    """
+
+    def __init__(self, kernel):
+        txn_net = group_sum(kernel.txn_codes, kernel.amount, len(kernel.txn_keys))
+        self.branch = TicketSketch.from_values(txn_net[txn_net > 0])
+
+        pair_net = group_sum(kernel.pair_codes, kernel.amount, len(kernel.pair_seller))
+        positive = pair_net > 0
+        n_sellers = len(kernel.seller_keys)
+        # (seller, bin) pairs counted in one pass
+        flat = kernel.pair_seller[positive] * N_BINS + bin_index(pair_net[positive])
+        self.seller_counts = np.bincount(flat, minlength=n_sellers * N_BINS).reshape(n_sellers, N_BINS)
+        self.seller_names = kernel.seller_names.to_numpy()
+
+    def seller(self, position):
+        return TicketSketch(self.seller_counts[position])
+
+    def by_seller_name(self):
+        """{seller name: sketch}; sellers sharing a name are merged."""
+        sketches = {}
+        for position, name in enumerate(self.seller_names):
+            sketch = self.seller(position)
+            sketches[name] = sketches[name].merge(sketch) if name in sketches else sketch
+        return sketches
+
+    @property
+    def nbytes(self):
+        return int(self.branch.nbytes + self.seller_counts.nbytes)
+
+
+def build(kernel):
+    """BranchSketches of a SALES kernel, or None without data."""
+    return None if kernel is None else BranchSketches(kernel)
+
+
+def percentiles(sketch):
+    """{label: value} of PERCENTILES for one sketch (None values when empty)."""
+    return {label: sketch.quantile(q) for label, q in PERCENTILES.items()}
+
+
+def seller_percentiles(sketches):
+    """Per seller name: PERCENTILES columns, indexed by שם מוכר."""
+    rows = {name: percentiles(sketch) for name, sketch in sketches.by_seller_name().items()}
+    return pd.DataFrame.from_dict(rows, orient="index", columns=list(PERCENTILES)).rename_axis("שם מוכר")
+
+
+# --- Storage (sparse rows: name, bin, count) ---
+
+def to_frame(named_sketches):
+    """{name: sketch} -> rows (name, bin, count) of the non-empty bins."""
+    frames = []
+    for name, sketch in named_sketches.items():
+        bins = np.flatnonzero(sketch.counts)
+        frames.append(pd.DataFrame({"name": name, "bin": bins.astype(np.int32), "count": sketch.counts[bins]}))
+    if not frames:
+        return pd.DataFrame({"name": pd.Series(dtype=object), "bin": pd.Series(dtype=np.int32),
+                             "count": pd.Series(dtype=np.int64)})
+    return pd.concat(frames, ignore_index=True)
+
+
+def from_frame(df):
+    """Inverse of to_frame: {name: sketch}."""
+    sketches = {}
+    for name, rows in df.groupby("name", sort=False):
+        counts = np.zeros(N_BINS, dtype=np.int64)
+        np.add.at(counts, rows["bin"].to_numpy(dtype=np.int64), rows["count"].to_numpy(dtype=np.int64))
+        sketches[name] = TicketSketch(counts)
+    return sketches
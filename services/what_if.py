@@ -0,0 +1,101 @@
+import calendar
+
+import numpy as np
+
+from services.agg_kernel import group_sum
+
+# What-if projections for the month. Net sales to date and the daily pace per
+# weekday are computed once per dataset revision (PaceBase); a whole grid of
+# targets x pace scenarios x extra selling days is then evaluated in one
+# numpy pass (simulate), so exploring targets never re-nets transactions.
+
+# pandas weekday numbers (Monday=0) in display order, Sunday first
+WEEKDAY_NAMES = {6: "ראשון", 0: "שני", 1: "שלישי", 2: "רביעי", 3: "חמישי", 4: "שישי", 5: "שבת"}
+
+
+class PaceBase:
+    """Target-independent aggregates of one SALES frame for the month of its last sale."""
+
+    def __init__(self, sales_df, kernel):
+        self.period_end = kernel.period_end
+        self.actual_to_date = kernel.net_sales()
+
+        _, self.days_in_month = calendar.monthrange(self.period_end.year, self.period_end.month)
+        self.elapsed_days = self.period_end.day
+        self.remaining_days = self.days_in_month - self.period_end.day
+        self.avg_daily = self.actual_to_date / max(self.elapsed_days, 1)
+
+        # Net sales per day of the month: positive transactions, dated by their first line
+        n_txns = len(kernel.txn_keys)
+        txn_net = group_sum(kernel.txn_codes, kernel.amount, n_txns)
+        valid = np.flatnonzero(kernel.txn_codes >= 0)
+        _, first = np.unique(kernel.txn_codes[valid], return_index=True)
+        txn_dates = sales_df['date'].iloc[valid[first]]
+        in_month = ((txn_dates.dt.year == self.period_end.year) & (txn_dates.dt.month == self.period_end.month)).to_numpy()
+        days = np.where(in_month & (txn_net > 0), txn_dates.dt.day.to_numpy() - 1, -1)
+        daily = group_sum(days, txn_net, self.days_in_month)
+
+        # Average per weekday over the elapsed days (days without sales count as 0)
+        weekdays = np.array([calendar.weekday(self.period_end.year, self.period_end.month, d + 1)
+                             for d in range(self.days_in_month)])
+        elapsed = weekdays[:self.elapsed_days]
+        self.elapsed_weekdays = np.bincount(elapsed, minlength=7)
+        weekday_totals = np.bincount(elapsed, weights=daily[:self.elapsed_days], minlength=7)
+        self.weekday_avg = np.divide(weekday_totals, self.elapsed_weekdays, out=np.zeros(7), where=self.elapsed_weekdays > 0)
+        self.remaining_weekdays = np.bincount(weekdays[self.elapsed_days:], minlength=7)
+
+    @property
+    def weekday_weights(self):
+        """Pace of each weekday relative to the average day so far (1.0 for weekdays not seen yet)."""
+        if self.avg_daily <= 0:
+            return np.ones(7)
+        return np.where(self.elapsed_weekdays > 0, self.weekday_avg / self.avg_daily, 1.0)
+
+    @property
+    def nbytes(self):
+        return int(self.weekday_avg.nbytes + self.remaining_weekdays.nbytes)
+
+
+def build_base(sales_df, kernel=None):
+    """PaceBase of a SALES frame, or None without data."""
+    if sales_df is None or sales_df.empty or kernel is None:
+        return None
+    return PaceBase(sales_df, kernel)
+
+
+def simulate(base, targets, extra_days=(0,), weekday_weights=None):
+    """
+    Month-end projections over a grid of scenarios.
+
+    Args:
+        base: PaceBase
+        targets: Monthly targets, shape (T,)
+        extra_days: Selling days added to (or removed from) the rest of the month, shape (E,)
+        weekday_weights: Pace scenarios, shape (S, 7): multiplier of the average daily pace
+            per weekday (pandas numbering, Monday=0). None = the flat pace of calculate_kpis.
+
+    Returns:
+        {"projected_amount": (S, E), "projected_percent": (T, S, E), "required_daily": (T, E)}
+    """
+    targets = np.asarray(targets, dtype=float)
+    extra_days = np.asarray(extra_days, dtype=float)
+    weights = np.ones((1, 7)) if weekday_weights is None else np.atleast_2d(np.asarray(weekday_weights, dtype=float))
+
+    # Sales still to come per scenario, and that scenario's pace per remaining day
+    remaining_amount = weights @ (base.remaining_weekdays * base.avg_daily)
+    if base.remaining_days > 0:
+        pace = remaining_amount / base.remaining_days
+    else:
+        pace = weights.mean(axis=1) * base.avg_daily
+
+    days = np.maximum(base.remaining_days + extra_days, 0)
+    projected = (base.actual_to_date + remaining_amount)[:, None] + pace[:, None] * (days - base.remaining_days)[None, :]
+
+    percent = np.zeros((len(targets),) + projected.shape)
+    np.divide(projected[None, :, :] * 100, targets[:, None, None], out=percent, where=targets[:, None, None] > 0)
+
+    remainder = np.maximum(targets - base.actual_to_date, 0)
+    required = np.zeros((len(targets), len(days)))
+    np.divide(remainder[:, None], days[None, :], out=required, where=days[None, :] > 0)
+
+    return {"projected_amount": projected, "projected_percent": percent, "required_daily": required}
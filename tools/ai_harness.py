@@ -0,0 +1,159 @@
+"""
+AI-path latency harness (Tab 4), fully offline.
+
+Builds the Tab 4 inputs (KPIs, seller table, top products, ITEMS) from the
+DEMO workbooks or a synthetic branch, then runs both generation modes
+(management analysis, team message) end to end through
+summarize_data -> prompt -> call_gemini against the fake model backend
+(services/ai_assistant.FakeBackend) with configurable latency, token rate
+and error injection, behind the shared gateway (services/ai_gateway).
+
+Reports prompt sizes, sequential latency split into prompt build / model
+call, and latency percentiles, throughput and errors for concurrent
+requests. A burst sends the same prompt from every worker (managers of one
+branch pressing the button together); --distinct gives each its own prompt.
+
+Usage:
+    python tools/ai_harness.py --requests 20 --concurrency 8 --latency 1.5 --tokens-per-sec 40
+    python tools/ai_harness.py --rows 50000 --error-rate 0.1 --distinct --rate-per-min 60
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+TOPIC = "יעד וקצב"
+TONE = "מפרגן"
+
+
+def load_inputs(rows=0):
+    """Tab 4 inputs from the DEMO workbooks, or from a synthetic branch of `rows` sales rows."""
+    from services.load_sales import load_and_normalize_sales
+    from services.load_items import load_and_normalize_items
+    from services.kpi_tab1 import calculate_kpis
+    from services import kpi_tab2
+
+    if rows:
+        from tools.load_harness import make_synthetic_branch
+        folder = tempfile.mkdtemp(prefix="ai_harness_")
+        make_synthetic_branch(folder, rows=rows, fmt="parquet")
+        sales_path, items_path = os.path.join(folder, "sales.parquet"), os.path.join(folder, "items.parquet")
+        fmt = "parquet"
+    else:
+        sales_path = os.path.join(ROOT_DIR, "APPDEMO", "sales_demo.xlsx")
+        items_path = os.path.join(ROOT_DIR, "APPDEMO", "items_demo.xlsx")
+        fmt = "xlsx"
+
+    with open(sales_path, "rb") as f:
+        sales_df = load_and_normalize_sales(f, fmt)
+    with open(items_path, "rb") as f:
+        items_df = load_and_normalize_items(f, fmt)
+
+    return (
+        calculate_kpis(sales_df, target=500000),
+        kpi_tab2.get_seller_table(sales_df, items_df),
+        kpi_tab2.get_top_products_qty(sales_df),
+        kpi_tab2.get_top_products_amount(sales_df),
+        items_df
+    )
+
+
+def modes(inputs):
+    """(name, prompt builder) for both generation modes."""
+    from services import ai_assistant
+    return [
+        ("management", lambda: ai_assistant.build_management_prompt(*inputs)),
+        ("team_message", lambda: ai_assistant.build_team_message_prompt(TOPIC, TONE, *inputs)),
+    ]
+
+
+def run_once(build_prompt, suffix=""):
+    """One end-to-end request. Returns (build seconds, call seconds, ok)."""
+    from services import ai_assistant
+    start = time.perf_counter()
+    prompt = build_prompt() + suffix
+    built = time.perf_counter()
+    result = ai_assistant.call_gemini(prompt)
+    done = time.perf_counter()
+    return built - start, done - built, "Error" not in result
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20, help="Requests per mode")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent requests in the burst phase")
+    parser.add_argument("--rows", type=int, default=0, help="Synthetic sales rows (0 = DEMO workbooks)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake backend fixed latency (seconds)")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="Fake backend output token rate (0 = instant)")
+    parser.add_argument("--output-tokens", type=int, default=400, help="Fake backend output tokens per reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls failing with 429/503")
+    parser.add_argument("--distinct", action="store_true", help="Unique prompt per burst request (no coalescing)")
+    parser.add_argument("--rate-per-min", type=float, default=6000, help="Gateway request rate limit")
+    parser.add_argument("--max-concurrent", type=int, default=8, help="Gateway concurrent call limit")
+    args = parser.parse_args(argv)
+
+    os.environ["AI_BACKEND"] = "fake"
+    from services import ai_assistant, ai_gateway
+    ai_gateway.set_gateway(ai_gateway.GeminiGateway(
+        rate_per_minute=args.rate_per_min,
+        burst=args.max_concurrent,
+        max_concurrent=args.max_concurrent,
+        backoff_base=0.1
+    ))
+    backend = ai_assistant.FakeBackend(
+        latency=args.latency,
+        tokens_per_sec=args.tokens_per_sec,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        seed=0
+    )
+    ai_assistant.set_backend(backend)
+
+    inputs = load_inputs(args.rows)
+    print(f"data={'synthetic ' + str(args.rows) + ' rows' if args.rows else 'DEMO'} "
+          f"backend latency={args.latency}s tokens/s={args.tokens_per_sec or 'inf'} "
+          f"output_tokens={args.output_tokens} error_rate={args.error_rate}")
+
+    for name, build_prompt in modes(inputs):
+        prompt = build_prompt()
+        print(f"\n[{name}] prompt chars={len(prompt)} ~tokens={ai_assistant.estimate_tokens(prompt)}")
+
+        # Sequential: what one manager waits for
+        sequential = [run_once(build_prompt) for _ in range(max(args.requests // 4, 1))]
+        build_times = [b for b, _, _ in sequential]
+        call_times = [c for _, c, _ in sequential]
+        print(f"  sequential build p50={percentile(build_times, 50) * 1000:.1f}ms "
+              f"call p50={percentile(call_times, 50) * 1000:.0f}ms")
+
+        # Burst: many managers pressing the button together
+        calls_before = backend.calls
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(
+                lambda i: run_once(build_prompt, f"\n#{i}" if args.distinct else ""), range(args.requests)
+            ))
+        wall = time.perf_counter() - start
+
+        totals = [b + c for b, c, _ in results]
+        errors = sum(1 for _, _, ok in results if not ok)
+        print(f"  burst x{args.requests} (concurrency {args.concurrency}) "
+              f"p50={percentile(totals, 50) * 1000:.0f}ms p95={percentile(totals, 95) * 1000:.0f}ms "
+              f"p99={percentile(totals, 99) * 1000:.0f}ms")
+        print(f"  throughput={args.requests / wall:.1f} req/s errors={errors} "
+              f"backend calls={backend.calls - calls_before}")
+    print(f"\ngateway {ai_gateway.get_gateway().stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Regional KPI export (CLI).
+
+Writes the KPI summary, seller table and category pivot of one, several or
+all BRANCH_MAP branches into a single Excel workbook (one sheet per report,
+one row group per branch) or a zip of CSVs. Branches are loaded and written
+one at a time through streaming writers (services/report_export), so memory
+stays flat however many branches are exported.
+
+Reads branch folders from Google Drive (GCP_SERVICE_ACCOUNT_JSON) or from a
+local directory laid out like Drive (--local-root <root>/<folder_id>/...).
+
+Usage:
+    python tools/export_reports.py --branches all --output region.xlsx
+    python tools/export_reports.py --branches S23,S24 --format csv --output s23_s24.zip --target 500000
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--branches", default="all", help="Comma-separated branch codes, or 'all'")
+    parser.add_argument("--format", choices=["xlsx", "csv"], default="xlsx", help="Workbook or zip of CSVs")
+    parser.add_argument("--output", help="Output path (default: kpi_<scope>_<date>.xlsx/.zip)")
+    parser.add_argument("--target", type=float, default=0, help="Monthly target used for the KPI columns")
+    parser.add_argument("--local-root", help="Local directory standing in for Drive")
+    args = parser.parse_args(argv)
+
+    if args.local_root:
+        os.environ["LOCAL_DRIVE_ROOT"] = args.local_root
+
+    import app
+    from services import report_export
+
+    if args.branches == "all":
+        branch_map = dict(app.BRANCH_MAP)
+    else:
+        codes = [code.strip() for code in args.branches.split(",") if code.strip()]
+        unknown = [code for code in codes if code not in app.BRANCH_MAP]
+        if unknown:
+            parser.error(f"Unknown branches: {', '.join(unknown)}")
+        branch_map = {code: app.BRANCH_MAP[code] for code in codes}
+
+    source = app.get_data_source()
+    if source is None:
+        print("Could not connect to Google Drive (set GCP_SERVICE_ACCOUNT_JSON or --local-root).", file=sys.stderr)
+        return 1
+
+    scope = "all" if args.branches == "all" else "_".join(branch_map)
+    output = args.output or report_export.export_file_name(scope, args.format)
+
+    exported = []
+
+    def reports():
+        for branch, tables in report_export.iter_source_reports(source, branch_map, args.target):
+            exported.append(branch)
+            print(f"  {branch}: {len(tables['sellers'])} sellers")
+            yield branch, tables
+
+    start = time.perf_counter()
+    report_export.write_export(output, reports(), args.format)
+    print(f"Exported {len(exported)}/{len(branch_map)} branches to {output} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
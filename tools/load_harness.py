@@ -0,0 +1,250 @@
+"""
+Concurrent-session load harness for the Streamlit app.
+
+Drives N simulated managers through streamlit.testing AppTest against a local
+directory standing in for Drive (LOCAL_DRIVE_ROOT) filled with synthetic
+branch files, plus the DEMO branch, with the fake model backend
+(AI_BACKEND=fake). Each session logs in, visits every NAV_OPTIONS page,
+types a seller search one keystroke at a time and requests an AI analysis.
+
+Sessions run as concurrent threads in this one process, as `streamlit run`
+serves them: they share the dataset registry, caches and interpreter, and
+their reruns overlap. AppTest normally installs a fresh Streamlit runtime for
+every rerun and removes it afterwards, which is not safe across threads, so
+the harness pins one shared runtime for the whole run (share_runtime).
+With --mode serialized the same threads take turns and one rerun executes at a
+time: that measures per-rerun cost, not concurrent capacity.
+"rerun" is the script execution time, "response" adds the time a session
+waited behind other sessions' reruns (serialized mode only).
+
+Reports rerun/response latency percentiles, throughput, peak RSS and the
+memory split of this process.
+
+Usage:
+    python tools/load_harness.py --sessions 10 --branches 3 --rows 20000
+"""
+import argparse
+import contextlib
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT_DIR, "app.py")
+sys.path.insert(0, ROOT_DIR)
+
+NAV_PAGES = ["מצב החנות", "צוות ומכירות", "תמהיל מוצרים", "תובנות ופעולות"]
+SEARCH_TEXT = "Seller 1"
+CATEGORIES = ["הנעלה", "ביגוד", "גרביים", "תיקים", "כדורים", "כובעים", "ציוד ותכשירי ניקוי", "תחתונים", 'הנה"ח']
+
+
+def make_synthetic_branch(folder, rows=20000, sellers=12, products=400, seed=0, fmt="xlsx"):
+    """Writes sales/items files with the raw Hebrew ERP headers into `folder`."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+
+    n_txn = max(rows // 2, 1)
+    txn = rng.integers(0, n_txn, rows)
+    seller = txn % sellers
+    day = rng.integers(1, 21, rows)
+    qty = np.where(rng.random(rows) < 0.05, -1, 1)
+
+    sales = pd.DataFrame({
+        "עסקה": [f"Tr-{t}" for t in txn],
+        "תאריך": pd.to_datetime("2026-01-01") + pd.to_timedelta(day - 1, unit="D"),
+        "תאור מוצר": [f"Product {p}" for p in rng.integers(0, products, rows)],
+        "כמות": qty,
+        "סה'כ לשורה": np.round(qty * rng.gamma(2.0, 80.0, rows), 2),
+        "מוכרן": 1000 + seller,
+        "שם מוכרן": [f"Seller {s + 1}" for s in seller]
+    })
+
+    items = pd.DataFrame(
+        [(1000 + s, f"Seller {s + 1}", cat, int(rng.integers(1, 300)), float(rng.integers(50, 5000)), int(rng.integers(1, 100)))
+         for s in range(sellers) for cat in CATEGORIES],
+        columns=["מספר מוכרן", "שם מוכרן", "תאור פרמטר 12 למוצר", "כמות פריטים", "סכום לתשלום כולל מעם", "מספר עסקאות"]
+    )
+
+    if fmt == "parquet":
+        sales.to_parquet(os.path.join(folder, "sales.parquet"), index=False)
+        items.to_parquet(os.path.join(folder, "items.parquet"), index=False)
+    else:
+        sales.to_excel(os.path.join(folder, "sales.xlsx"), index=False)
+        items.to_excel(os.path.join(folder, "items.xlsx"), index=False)
+
+
+# --mode serialized: sessions take turns, one rerun at a time
+RUN_LOCK = threading.Lock()
+
+
+class SessionStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.responses = []
+        self.exceptions = 0
+        self.ui_errors = 0
+
+    def record(self, rerun, response, exceptions, ui_errors):
+        with self.lock:
+            self.latencies.append(rerun)
+            self.responses.append(response)
+            self.exceptions += exceptions
+            self.ui_errors += ui_errors
+
+
+def timed_run(at, stats, timeout, lock):
+    requested = time.perf_counter()
+    with lock:
+        start = time.perf_counter()
+        at.run(timeout=timeout)
+        end = time.perf_counter()
+    stats.record(end - start, end - requested, len(at.exception), len(at.error))
+
+
+def simulate_session(branch, stats, timeout=120, lock=contextlib.nullcontext()):
+    """One manager: login, visit every page, type a seller search."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    timed_run(at, stats, timeout, lock)
+
+    at.selectbox[0].select(branch)
+    at.text_input[0].input("2410")
+    at.button[0].click()
+    timed_run(at, stats, timeout, lock)      # login -> load
+    if not at.sidebar.radio:
+        timed_run(at, stats, timeout, lock)  # load -> first page
+
+    for page in NAV_PAGES:
+        if not at.sidebar.radio:
+            break
+        at.sidebar.radio[0].set_value(page)
+        timed_run(at, stats, timeout, lock)
+
+        if page == "צוות ומכירות":
+            search = next((t for t in at.text_input if t.label == "חיפוש מוכר"), None)
+            for i in range(1, len(SEARCH_TEXT) + 1):
+                if search is None:
+                    break
+                search.input(SEARCH_TEXT[:i])
+                timed_run(at, stats, timeout, lock)
+                search = next((t for t in at.text_input if t.label == "חיפוש מוכר"), None)
+
+        if page == "תובנות ופעולות":
+            generate = next((b for b in at.button if b.label == "צור ניתוח נתונים"), None)
+            if generate is not None:
+                generate.click()
+                timed_run(at, stats, timeout, lock)
+
+
+@contextlib.contextmanager
+def share_runtime():
+    """
+    One Streamlit runtime for every AppTest rerun while the block runs.
+
+    AppTest sets Runtime._instance to a new mock before each rerun and back to
+    None after it, and patches the config for the duration of the rerun; with
+    concurrent reruns one session would pull the runtime from under another.
+    Runtime.instance() returns the shared runtime instead (so st.cache_* is
+    shared between sessions as on a server), app.py is compiled once into one
+    ScriptCache (parsing it in several threads at once is not safe), and the
+    appTest config flag stays set until the outermost patch is undone.
+    """
+    from streamlit.components.v2.component_manager import BidiComponentManager
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1.util import patch_config_options
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    runtime.bidi_component_registry = BidiComponentManager()
+    runtime.bidi_component_registry.discover_and_register_components(start_file_watching=False)
+    script_cache = ScriptCache()
+    with patch.object(Runtime, "instance", classmethod(lambda cls: runtime)), \
+            patch.object(Runtime, "exists", classmethod(lambda cls: True)), \
+            patch("streamlit.testing.v1.app_test.ScriptCache", lambda: script_cache), \
+            patch("streamlit.testing.v1.local_script_runner.ScriptCache", lambda: script_cache), \
+            patch_config_options({"global.appTest": True}):
+        yield runtime
+
+
+def run_sessions(targets, timeout, serialized=False):
+    """Every session as a thread of this process; returns (SessionStats, peak RSS MB, memory, seconds)."""
+    from services.dataset_registry import process_memory
+
+    stats = SessionStats()
+    lock = RUN_LOCK if serialized else contextlib.nullcontext()
+    with share_runtime():
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+            for future in [pool.submit(simulate_session, b, stats, timeout, lock) for b in targets]:
+                future.result()
+        elapsed = time.perf_counter() - start
+    return stats, peak_rss_mb(), process_memory(), elapsed
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent simulated managers")
+    parser.add_argument("--branches", type=int, default=3, help="Synthetic branches (plus DEMO)")
+    parser.add_argument("--rows", type=int, default=20000, help="Sales rows per synthetic branch")
+    parser.add_argument("--format", choices=["xlsx", "parquet"], default="xlsx", help="Synthetic file format")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-rerun timeout (seconds)")
+    parser.add_argument("--mode", choices=["threads", "serialized"], default="threads",
+                        help="Concurrent session threads, or the same threads taking turns")
+    args = parser.parse_args(argv)
+
+    from app import BRANCH_MAP
+
+    drive_root = tempfile.mkdtemp(prefix="kpi_load_")
+    branches = list(BRANCH_MAP)[:args.branches]
+    for i, branch in enumerate(branches):
+        make_synthetic_branch(os.path.join(drive_root, BRANCH_MAP[branch]), rows=args.rows, seed=i, fmt=args.format)
+    os.environ["LOCAL_DRIVE_ROOT"] = drive_root
+    os.environ["AI_BACKEND"] = "fake"
+    os.environ.setdefault("FAKE_AI_LATENCY", "0.5")
+
+    targets = [(branches + ["DEMO"])[i % (len(branches) + 1)] for i in range(args.sessions)]
+    stats, peak_rss, memory, elapsed = run_sessions(targets, args.timeout, serialized=args.mode == "serialized")
+
+    lat, resp = stats.latencies, stats.responses
+    print(f"sessions={args.sessions} branches={len(branches)}+DEMO rows/branch={args.rows} format={args.format}")
+    if args.mode == "threads":
+        print("mode=threads: concurrent sessions in one process, reruns overlap")
+    else:
+        print("mode=serialized: one rerun at a time in one process - per-rerun cost, not concurrent capacity")
+    print(f"reruns={len(lat)} exceptions={stats.exceptions} ui_errors={stats.ui_errors} wall={elapsed:.1f}s throughput={len(lat) / elapsed:.1f} reruns/s")
+    for label, values in (("rerun", lat), ("response", resp)):
+        print(f"{label} latency p50={percentile(values, 50) * 1000:.0f}ms "
+              f"p95={percentile(values, 95) * 1000:.0f}ms p99={percentile(values, 99) * 1000:.0f}ms")
+    print(f"peak RSS={peak_rss:.0f} MB rss={memory['rss'] / 1e6:.0f} MB pss={memory['pss'] / 1e6:.0f} MB "
+          f"shared={memory['shared'] / 1e6:.0f} MB private={memory['private'] / 1e6:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
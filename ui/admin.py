@@ -0,0 +1,111 @@
+import streamlit as st
+import pandas as pd
+
+from services import memory_accounting
+
+
+def fmt_bytes(n):
+    if abs(n) < 1e6:
+        return f"{n / 1e3:,.1f} KB"
+    return f"{n / 1e6:,.1f} MB"
+
+
+def render():
+    """
+    Renders the admin memory panel: process memory, shared datasets and their
+    derived tables, per-session private state and per-branch totals, plus
+    on-demand tracemalloc snapshots (services/memory_accounting).
+    """
+    report = memory_accounting.report()
+    process, totals = report["process"], report["totals"]
+
+    # --- Process ---
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("RSS", fmt_bytes(process["rss"]))
+    c2.metric("PSS", fmt_bytes(process["pss"]))
+    c3.metric("משותף", fmt_bytes(process["shared"]))
+    c4.metric("פרטי", fmt_bytes(process["private"]))
+
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("נתוני סניפים", fmt_bytes(totals["dataset_bytes"]))
+    c2.metric("טבלאות נגזרות", fmt_bytes(totals["derived_bytes"]))
+    c3.metric(f"סשנים ({totals['sessions']})", fmt_bytes(totals["session_bytes"]))
+    c4.metric("תשובות AI", fmt_bytes(totals["ai_bytes"]))
+
+    if totals["partition_cache_bytes"]:
+        st.caption(f"קבצים יומיים במטמון: {fmt_bytes(totals['partition_cache_bytes'])}")
+    if totals["delta_state_bytes"]:
+        st.caption(f"מצב טעינה מצטברת (מעבר לנתוני הסניפים): {fmt_bytes(totals['delta_state_bytes'])}")
+
+    if st.button("כתוב סיכום ללוג"):
+        memory_accounting.log_report(report)
+        st.toast("נכתב ללוג")
+
+    # --- Per branch ---
+    st.subheader("לפי סניף")
+    if report["branches"]:
+        st.dataframe(
+            pd.DataFrame([
+                {"סניף": branch, "סשנים": b["sessions"], "נתונים": fmt_bytes(b["dataset_bytes"]),
+                 "נגזרות": fmt_bytes(b["derived_bytes"]), "סשנים (פרטי)": fmt_bytes(b["session_bytes"]),
+                 "סה\"כ": fmt_bytes(b["total_bytes"])}
+                for branch, b in report["branches"].items()
+            ]),
+            use_container_width=True, hide_index=True
+        )
+    else:
+        st.info("אין נתונים טעונים.")
+
+    # --- Datasets and derived tables ---
+    st.subheader("גרסאות נתונים")
+    for d in report["datasets"]:
+        title = (f"{d['branch']} · {fmt_bytes(d['sales_bytes'] + d['items_bytes'] + d['derived_bytes'])}"
+                 f" · {d['refcount']} סשנים")
+        with st.expander(title):
+            st.caption(f"מכירות {fmt_bytes(d['sales_bytes'])} · פריטים {fmt_bytes(d['items_bytes'])} · גרסה {d['revision'][:60]}")
+            if d["derived"]:
+                derived = pd.DataFrame(
+                    sorted(d["derived"].items(), key=lambda kv: -kv[1]), columns=["טבלה", "bytes"]
+                )
+                derived["גודל"] = derived["bytes"].apply(fmt_bytes)
+                st.dataframe(derived[["טבלה", "גודל"]], use_container_width=True, hide_index=True)
+
+    # --- Sessions ---
+    st.subheader("סשנים")
+    if report["sessions"]:
+        st.dataframe(
+            pd.DataFrame([
+                {"סשן": s["session"][:8], "סניף": s["branch"], "AI": fmt_bytes(s['ai_bytes']),
+                 "אחר": fmt_bytes(s['other_bytes'])}
+                for s in sorted(report["sessions"], key=lambda s: -(s["ai_bytes"] + s["other_bytes"]))
+            ]),
+            use_container_width=True, hide_index=True
+        )
+
+    # --- tracemalloc ---
+    st.subheader("tracemalloc")
+    c1, c2 = st.columns(2)
+    if memory_accounting.tracing():
+        if c1.button("עצור מעקב"):
+            memory_accounting.stop_tracing()
+            st.session_state.pop("memory_snapshot", None)
+            st.rerun()
+        if c2.button("צלם מצב"):
+            st.session_state["memory_snapshot"] = memory_accounting.take_snapshot()
+    else:
+        st.caption("מעקב הקצאות כבוי (מאט את התהליך כשהוא פעיל).")
+        if c1.button("התחל מעקב"):
+            memory_accounting.start_tracing()
+            st.rerun()
+
+    snapshot = st.session_state.get("memory_snapshot")
+    if snapshot:
+        st.caption(f"במעקב: {fmt_bytes(snapshot['traced_bytes'])} (שיא {fmt_bytes(snapshot['peak_bytes'])})")
+        st.dataframe(
+            pd.DataFrame([
+                {"מיקום": t["site"], "גודל": fmt_bytes(t["bytes"]), "בלוקים": t["count"],
+                 "שינוי": "—" if t["growth"] is None else fmt_bytes(t["growth"])}
+                for t in snapshot["top"]
+            ]),
+            use_container_width=True, hide_index=True
+        )
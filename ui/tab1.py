@@ -1,14 +1,30 @@
+import numpy as np
+import pandas as pd
 import streamlit as st
 
-def render(kpis):
+from services import what_if
+
+# Widget changes rerun only their own fragment, not the whole app script
+# (on Streamlit versions without st.fragment the whole script reruns, as before)
+fragment = getattr(st, "fragment", lambda func: func)
+
+def render(kpis, comparisons=None, get_pace_base=None, partial=None):
     """
     Renders the Monthly Dashboard Tab (Tab 1) UI.
     Updated for Mobile-First, RTL, and Clean Design.
+    comparisons: optional {baseline: {...}} from services.snapshot_archive.kpi_comparisons
+    get_pace_base: optional callable returning the services.what_if.PaceBase, only called
+    when the what-if expander is open.
+    partial: share of the SALES rows read so far while loading (services/progressive);
+    the cards are marked as provisional.
     """
     if not kpis:
         st.warning("אין נתונים להצגה.")
         return
 
+    if partial is not None:
+        st.info(f"נתונים חלקיים: נקראו {partial:.0%} משורות המכירות. הערכים יתעדכנו בסיום הטעינה.")
+
     # Check for unconfigured target
     if kpis['target'] == 0:
         st.warning("שים לב: יעד חודשי לא מוגדר (מוצג כ-0).")
@@ -152,6 +168,26 @@ def render(kpis):
         st.markdown(card_html("תחזית סיום חודש", fmt_nis(proj_amount), sub, p_color), unsafe_allow_html=True)
 
 
+    # --- SECTION B2: השוואה לתקופות קודמות (only when archived months exist) ---
+    if comparisons:
+        from services.snapshot_archive import BASELINES
+
+        st.markdown("<div class='section-header'>השוואה לתקופות קודמות</div>", unsafe_allow_html=True)
+
+        cols = st.columns(len(BASELINES))
+        for col, (baseline, label) in zip(cols, BASELINES.items()):
+            comp = comparisons.get(baseline)
+            with col:
+                if not comp:
+                    st.markdown(card_html(label, "—", "אין נתונים שמורים"), unsafe_allow_html=True)
+                    continue
+                delta = comp["delta_pct"]
+                d_color = "" if delta is None else ("val-green" if delta >= 0 else "val-red")
+                d_text = "—" if delta is None else f"{delta:+.1f}%"
+                sub = f"{comp['period']}: {fmt_nis(comp['to_date'])} עד אותו יום (חודש מלא {fmt_nis(comp['full_month'])})"
+                st.markdown(card_html(f"שינוי מול {label}", d_text, sub, d_color), unsafe_allow_html=True)
+
+
     # --- SECTION C: מה עושים היום ---
     st.markdown("<div class='section-header'>מה עושים היום</div>", unsafe_allow_html=True)
     
@@ -161,3 +197,74 @@ def render(kpis):
         insight = f"אנחנו מתחת לקצב. היום צריך לשאוף לקצב יומי של {fmt_nis(avg_daily_required)} כדי להתקרב ליעד."
         
     st.markdown(f"<div class='insight-box'>{insight}</div>", unsafe_allow_html=True)
+
+
+    # --- SECTION D: סימולציית יעד וקצב (on demand) ---
+    if get_pace_base is not None:
+        render_what_if_section(get_pace_base, kpis['target'])
+
+
+@fragment
+def render_what_if_section(get_pace_base, target):
+    """What-if expander; its widgets rerun only this fragment."""
+    st.markdown("<div style='margin-top: 30px;'></div>", unsafe_allow_html=True)
+    try:
+        # Track open/closed so nothing is computed while it is collapsed
+        expander = st.expander("סימולציית יעד וקצב", key="status_what_if", on_change="rerun")
+    except TypeError:
+        expander = st.expander("סימולציית יעד וקצב")
+    with expander:
+        if getattr(expander, "open", True) is not False:
+            render_what_if(get_pace_base(), target)
+
+
+# Target grid around the current target, and selling days added / removed
+WHAT_IF_TARGET_STEPS = (0.8, 0.85, 0.9, 0.95, 1.0, 1.05, 1.1, 1.15, 1.2)
+WHAT_IF_EXTRA_DAYS = (-3, -2, -1, 0, 1, 2, 3)
+
+
+def render_what_if(base, target):
+    """Projected finish (% of target) and required daily pace over targets x extra days."""
+    if base is None:
+        st.info("אין נתונים לסימולציה.")
+        return
+
+    order = list(what_if.WEEKDAY_NAMES)
+    learned = base.weekday_weights
+
+    pace_options = ["קצב אחיד", "לפי ימי השבוע", "מותאם אישית"]
+    pace_choice = st.radio("קצב לשאר החודש", pace_options, horizontal=True, key="what_if_pace")
+
+    custom = learned
+    if pace_choice == "מותאם אישית":
+        st.caption("משקל לכל יום (1 = יום ממוצע עד כה, 0 = סגור)")
+        edited = st.data_editor(
+            pd.DataFrame([[round(float(learned[d]), 2) for d in order]], columns=list(what_if.WEEKDAY_NAMES.values())),
+            hide_index=True, key="what_if_weights"
+        )
+        custom = np.zeros(7)
+        custom[order] = edited.iloc[0].fillna(0).clip(lower=0).to_numpy(dtype=float)
+
+    # One pass over every scenario: flat / learned / custom x targets x extra days
+    base_target = target if target > 0 else base.avg_daily * base.days_in_month
+    targets = np.array([base_target * step for step in WHAT_IF_TARGET_STEPS])
+    grid = what_if.simulate(base, targets, WHAT_IF_EXTRA_DAYS, np.vstack([np.ones(7), learned, custom]))
+
+    scenario = pace_options.index(pace_choice)
+    no_extra = WHAT_IF_EXTRA_DAYS.index(0)
+    finishes = [f"{name}: ₪{amount:,.0f}" for name, amount in zip(pace_options, grid['projected_amount'][:, no_extra])]
+    st.caption("תחזית סיום חודש - " + "  |  ".join(finishes))
+
+    cells = [
+        [f"{grid['projected_percent'][t, scenario, e]:.0f}% · ₪{grid['required_daily'][t, e]:,.0f}"
+         for e in range(len(WHAT_IF_EXTRA_DAYS))]
+        for t in range(len(targets))
+    ]
+    table = pd.DataFrame(
+        cells,
+        index=[f"₪{t:,.0f}" for t in targets],
+        columns=["ללא שינוי" if e == 0 else f"{e:+d} ימים" for e in WHAT_IF_EXTRA_DAYS]
+    )
+    table.index.name = "יעד"
+    st.dataframe(table, use_container_width=True)
+    st.caption(f"בכל תא: צפי סיום כאחוז מהיעד · נדרש ליום בשאר החודש ({base.remaining_days} ימים נותרו)")
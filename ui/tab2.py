@@ -1,10 +1,25 @@
 import streamlit as st
 import pandas as pd
 
-def render(df_sellers, df_top_qty, df_top_amount):
+# Widget changes rerun only their own fragment, not the whole app script
+# (on Streamlit versions without st.fragment the whole script reruns, as before)
+fragment = getattr(st, "fragment", lambda func: func)
+
+def render(df_sellers, df_top_qty, df_top_amount, get_deltas=None, seller_search=None, search_products=None,
+           get_basket=None, ticket_sketches=None, ticket_percentiles=None, get_region_tickets=None):
     """
     Renders Tab 2: Team & Sales (צוות ומכירות).
     Polished for Mobile-First, RTL, and Readability.
+    get_deltas(baseline): optional per-seller ratio changes vs an archived month
+    (services.snapshot_archive.seller_deltas), or None when there is no snapshot.
+    seller_search: optional services.search_index.SearchIndex over df_sellers['שם מוכר'].
+    search_products(query): optional product totals (תיאור מוצר / כמות / סכום) matching a query.
+    get_basket: optional callable returning the services.basket.BasketIndex, only called when
+    the "bought together" expander is open.
+    ticket_sketches / ticket_percentiles: optional services.ticket_sketch.BranchSketches and the
+    per-seller median / p90 ticket (indexed by שם מוכר).
+    get_region_tickets(): optional (merged TicketSketch, branches) of the month over all archived branches.
+    The seller list, product lookup and basket are fragments: their widgets rerun only themselves.
     """
     # --- CSS Styles ---
     st.markdown("""
@@ -87,6 +102,61 @@ def render(df_sellers, df_top_qty, df_top_amount):
         st.info("אין נתונים להצגה.")
         return
 
+    # Ticket size distribution (the mean alone is skewed by a few large baskets)
+    if ticket_sketches is not None:
+        render_ticket_summary(ticket_sketches.branch, get_region_tickets)
+
+    render_sellers(df_sellers, get_deltas, seller_search, ticket_percentiles)
+
+    # --- TOP 5 LISTS ---
+    st.markdown("<div style='margin-top: 30px;'></div>", unsafe_allow_html=True)
+    
+    col_q, col_a = st.columns(2)
+    
+    def render_compact_list(title, df, label_col, val_col, fmt_func):
+        html = f"<div class='section-header'>{title}</div>"
+        if df.empty:
+            html += "<div style='text-align:right'>אין נתונים</div>"
+        else:
+            for _, row in df.head(5).iterrows():
+                val = fmt_func(row[val_col])
+                name = row[label_col]
+                # Construct HTML without indentation to avoid Markdown code block interpretation
+                html += f"<div class='compact-list-row'><div class='list-name' title='{name}'>{name}</div><div class='list-val'>{val}</div></div>"
+        return html
+
+    with col_q:
+        html = render_compact_list(
+            "טופ 5 לפי כמות", 
+            df_top_qty, 
+            "תיאור מוצר", 
+            "כמות", 
+            lambda x: f"{int(x)}"
+        )
+        st.markdown(html, unsafe_allow_html=True)
+
+    with col_a:
+        html = render_compact_list(
+            "טופ 5 לפי סכום", 
+            df_top_amount, 
+            "תיאור מוצר", 
+            "סכום", 
+            lambda x: f"₪{x:,.0f}"
+        )
+        st.markdown(html, unsafe_allow_html=True)
+
+    # --- PRODUCT LOOKUP ---
+    if search_products is not None:
+        render_product_lookup(search_products)
+
+    # --- BOUGHT TOGETHER ---
+    if get_basket is not None:
+        render_basket(get_basket)
+
+
+@fragment
+def render_sellers(df_sellers, get_deltas=None, seller_search=None, ticket_percentiles=None):
+    """Seller controls (sort / search / view / comparison) and the seller cards or table."""
     # --- CONTROLS ---
     c1, c2, c3 = st.columns([2, 2, 1])
     
@@ -100,22 +170,43 @@ def render(df_sellers, df_top_qty, df_top_amount):
         # Reverse mapping for dataframe sort
         sort_col_map = {v: k for k, v in sort_opts.items()}
         
-        sort_choice = st.selectbox("מיון לפי", list(sort_opts.keys()))
+        sort_choice = st.selectbox("מיון לפי", list(sort_opts.keys()), key="team_sort")
         sort_col = sort_opts[sort_choice]
         
     with c2:
-        search_term = st.text_input("חיפוש מוכר", "")
+        search_term = st.text_input("חיפוש מוכר", "", key="team_search")
         
     with c3:
         # View Toggle (Default to True/Cards for mobile feel)
-        card_view = st.toggle("תצוגת כרטיסים", value=True)
+        card_view = st.toggle("תצוגת כרטיסים", value=True, key="team_cards")
+
+    # Optional comparison vs an archived month
+    deltas = None
+    if get_deltas is not None:
+        from services.snapshot_archive import BASELINES
+        compare_opts = {"ללא": None, **{label: key for key, label in BASELINES.items()}}
+        compare_choice = st.radio("השוואה ל", list(compare_opts.keys()), horizontal=True, key="team_compare")
+        if compare_opts[compare_choice]:
+            deltas = get_deltas(compare_opts[compare_choice])
+            if deltas is None:
+                st.caption("אין נתונים שמורים לתקופה זו.")
 
     # --- FILTER & SORT ---
     df_display = df_sellers.copy()
+    if deltas is not None:
+        delta_cols = [c for c in deltas.columns if c != 'שם מוכר']
+        for col in delta_cols:
+            df_display[col] = deltas[col].values
+    if ticket_percentiles is not None:
+        for col in ticket_percentiles.columns:
+            df_display[col] = df_display['שם מוכר'].map(ticket_percentiles[col])
     
     # Search
     if search_term:
-        df_display = df_display[df_display['שם מוכר'].astype(str).str.contains(search_term, case=False)]
+        if seller_search is not None:
+            df_display = df_display.iloc[seller_search.search(search_term)]
+        else:
+            df_display = df_display[df_display['שם מוכר'].astype(str).str.contains(search_term, case=False, regex=False)]
     
     # Sort (Always Descending for these metrics)
     if sort_col in df_display.columns:
@@ -133,6 +224,13 @@ def render(df_sellers, df_top_qty, df_top_amount):
             avg_t = f"₪{row['ממוצע עסקה']:,.0f}"
             avg_i = f"{row['ממוצע פריטים לעסקה']:.1f}"
             ratio = f"{row['יחס מוצר משלים לעסקה']:.2f}"
+            delta = ""
+            if deltas is not None and pd.notna(row.get('Δ יחס מוצר משלים לעסקה')):
+                delta = f" ({row['Δ יחס מוצר משלים לעסקה']:+.2f})"
+            ticket_row = ""
+            if pd.notna(row.get('חציון עסקה')):
+                ticket_row = (f"<div class='seller-row'><span>חציון עסקה: <b>₪{row['חציון עסקה']:,.0f}</b></span>"
+                              f"<span>P90: <b>₪{row['עסקה P90']:,.0f}</b></span></div>")
             
             st.markdown(f"""
             <div class='seller-card'>
@@ -145,7 +243,8 @@ def render(df_sellers, df_top_qty, df_top_amount):
                     <span>ממוצע עסקה: <b>{avg_t}</b></span>
                     <span>ממוצע פריטים: <b>{avg_i}</b></span>
                 </div>
-                <div class='seller-highlight'>יחס משלים: {ratio}</div>
+                {ticket_row}
+                <div class='seller-highlight'>יחס משלים: {ratio}{delta}</div>
             </div>
             """, unsafe_allow_html=True)
     else:
@@ -156,9 +255,16 @@ def render(df_sellers, df_top_qty, df_top_amount):
         # Format columns (Strings for display)
         tbl["מכירות"] = tbl["מכירות"].apply(lambda x: f"₪{x:,.0f}")
         tbl["ממוצע עסקה"] = tbl["ממוצע עסקה"].apply(lambda x: f"₪{x:,.0f}")
+        for col in ("חציון עסקה", "עסקה P90"):
+            if col in tbl.columns:
+                tbl[col] = tbl[col].apply(lambda x: f"₪{x:,.0f}" if pd.notna(x) else "—")
         tbl["מספר עסקאות"] = tbl["מספר עסקאות"].apply(lambda x: int(x))
         tbl["ממוצע פריטים לעסקה"] = tbl["ממוצע פריטים לעסקה"].apply(lambda x: f"{x:.1f}")
         tbl["יחס מוצר משלים לעסקה"] = tbl["יחס מוצר משלים לעסקה"].apply(lambda x: f"{x:.2f}")
+        if deltas is not None:
+            tbl["Δ ממוצע עסקה"] = tbl["Δ ממוצע עסקה"].apply(lambda x: f"{x:+,.0f}" if pd.notna(x) else "—")
+            tbl["Δ ממוצע פריטים לעסקה"] = tbl["Δ ממוצע פריטים לעסקה"].apply(lambda x: f"{x:+.1f}" if pd.notna(x) else "—")
+            tbl["Δ יחס מוצר משלים לעסקה"] = tbl["Δ יחס מוצר משלים לעסקה"].apply(lambda x: f"{x:+.2f}" if pd.notna(x) else "—")
 
         st.dataframe(
             tbl, 
@@ -171,39 +277,67 @@ def render(df_sellers, df_top_qty, df_top_amount):
             }
         )
 
-    # --- TOP 5 LISTS ---
-    st.markdown("<div style='margin-top: 30px;'></div>", unsafe_allow_html=True)
-    
-    col_q, col_a = st.columns(2)
-    
-    def render_compact_list(title, df, label_col, val_col, fmt_func):
-        html = f"<div class='section-header'>{title}</div>"
-        if df.empty:
-            html += "<div style='text-align:right'>אין נתונים</div>"
+
+def render_ticket_summary(branch_sketch, get_region_tickets=None):
+    """Median / p90 ticket of the branch, and of all archived branches for the month when there are several."""
+    from services import ticket_sketch
+
+    def line(title, sketch):
+        values = ticket_sketch.percentiles(sketch)
+        parts = [f"{label}: ₪{value:,.0f}" for label, value in values.items() if value is not None]
+        return f"{title} ({sketch.count:,} עסקאות): " + " · ".join(parts)
+
+    if branch_sketch.count == 0:
+        return
+    lines = [line("עסקה בסניף", branch_sketch)]
+    region = get_region_tickets() if get_region_tickets is not None else None
+    if region is not None:
+        region_sketch, branches = region
+        if len(branches) > 1 and region_sketch.count:
+            lines.append(line(f"כל הסניפים ({len(branches)})", region_sketch))
+    st.caption("  \n".join(lines))
+
+
+@fragment
+def render_product_lookup(search_products):
+    """Product totals matching a search term (see render)."""
+    st.markdown("<div class='section-header'>חיפוש מוצר</div>", unsafe_allow_html=True)
+    product_term = st.text_input("חיפוש מוצר", "", placeholder="חלק משם המוצר", label_visibility="collapsed",
+                                 key="team_product_search")
+    if product_term:
+        matches = search_products(product_term).sort_values("כמות", ascending=False)
+        if matches.empty:
+            st.caption("לא נמצאו מוצרים.")
         else:
-            for _, row in df.head(5).iterrows():
-                val = fmt_func(row[val_col])
-                name = row[label_col]
-                # Construct HTML without indentation to avoid Markdown code block interpretation
-                html += f"<div class='compact-list-row'><div class='list-name' title='{name}'>{name}</div><div class='list-val'>{val}</div></div>"
-        return html
+            st.caption(f"נמצאו {len(matches):,} מוצרים" + (" (מוצגים 50 המובילים בכמות)" if len(matches) > 50 else ""))
+            tbl = matches.head(50).copy()
+            tbl["כמות"] = tbl["כמות"].apply(lambda x: int(x))
+            tbl["סכום"] = tbl["סכום"].apply(lambda x: f"₪{x:,.0f}")
+            st.dataframe(tbl, use_container_width=True, hide_index=True)
 
-    with col_q:
-        html = render_compact_list(
-            "טופ 5 לפי כמות", 
-            df_top_qty, 
-            "תיאור מוצר", 
-            "כמות", 
-            lambda x: f"{int(x)}"
-        )
-        st.markdown(html, unsafe_allow_html=True)
 
-    with col_a:
-        html = render_compact_list(
-            "טופ 5 לפי סכום", 
-            df_top_amount, 
-            "תיאור מוצר", 
-            "סכום", 
-            lambda x: f"₪{x:,.0f}"
-        )
-        st.markdown(html, unsafe_allow_html=True)
+@fragment
+def render_basket(get_basket):
+    """Products bought together with a chosen product, built only while the expander is open."""
+    st.markdown("<div style='margin-top: 30px;'></div>", unsafe_allow_html=True)
+    try:
+        # Track open/closed so the basket index is only built when it is shown
+        expander = st.expander("נקנים יחד", key="team_basket", on_change="rerun")
+    except TypeError:
+        expander = st.expander("נקנים יחד")
+    with expander:
+        if getattr(expander, "open", True) is False:
+            return
+        basket = get_basket()
+        products = basket.products() if basket is not None else []
+        if not products:
+            st.info("אין מספיק עסקאות עם כמה מוצרים.")
+            return
+        product = st.selectbox("מוצר", products, key="basket_product")
+        companions = basket.companions(product)
+        st.caption(f"{basket.transactions(product):,} עסקאות עם המוצר")
+        tbl = companions.copy()
+        tbl["% מעסקאות המוצר"] = tbl["% מעסקאות המוצר"].apply(lambda x: f"{x:.1f}%")
+        tbl["תמיכה %"] = tbl["תמיכה %"].apply(lambda x: f"{x:.2f}%")
+        tbl["Lift"] = tbl["Lift"].apply(lambda x: f"{x:.2f}")
+        st.dataframe(tbl, use_container_width=True, hide_index=True)
@@ -3,10 +3,19 @@ import pandas as pd
 import altair as alt
 from services import kpi_tab3
 
-def render(items_df):
+# Widget changes rerun only their own fragment, not the whole app script
+# (on Streamlit versions without st.fragment the whole script reruns, as before)
+fragment = getattr(st, "fragment", lambda func: func)
+
+def render(items_df, seller_index=None, get_pivot=None, get_share_deltas=None):
     """
     Renders Tab 3: Product Mix (תמהיל מוצרים).
     Final Version: Units Only, Chart First, Compact Table Second.
+    seller_index: optional SellerIndex built at load time (options + per-seller slices).
+    get_pivot: optional callable returning the full pivot, only called when the expander is open.
+    get_share_deltas(df_dist, seller_name, baseline): optional share change (pp) per category
+    vs an archived month (services.snapshot_archive.category_share_deltas).
+    The seller mix and the full pivot are fragments: their widgets rerun only themselves.
     """
     # --- CSS Styles ---
     st.markdown("""
@@ -63,13 +72,25 @@ def render(items_df):
         st.info("אין נתוני פריטים להצגה.")
         return
 
+    render_seller_mix(items_df, seller_index, get_share_deltas)
+
+    # --- 3. EXPANDER: FULL PIVOT TABLE ---
+    render_full_pivot(items_df, get_pivot)
+
+
+@fragment
+def render_seller_mix(items_df, seller_index=None, get_share_deltas=None):
+    """Seller selector, category chart and breakdown table (with optional comparison)."""
     # --- CONTROL: Seller Selector ---
     # Default to "All Branch"
-    all_sellers = sorted(list(items_df['seller_name'].unique()))
+    if seller_index is not None:
+        all_sellers = seller_index.sellers
+    else:
+        all_sellers = sorted(list(items_df['seller_name'].unique()))
     options = ["כל הסניף"] + all_sellers
     
     # Simple selectbox
-    selected_option = st.selectbox("בחר מוכר (אופציונלי):", options)
+    selected_option = st.selectbox("בחר מוכר (אופציונלי):", options, key="mix_seller")
     
     # Map to service logic: service handles "הכל" or we interpret None.
     # We will pass specific name or 'None' if 'כל הסניף'
@@ -79,7 +100,9 @@ def render(items_df):
 
     # --- DATA PREP (Units Only) ---
     # 1. Distribution (for Chart & Compact Table)
-    df_dist = kpi_tab3.build_category_distribution(items_df, metric="units", seller_name=seller_arg)
+    df_dist = kpi_tab3.build_category_distribution(
+        items_df, metric="units", seller_name=seller_arg, seller_index=seller_index
+    )
     
     if df_dist.empty:
         st.info("אין נתונים לקטגוריות הנבחרות.")
@@ -115,11 +138,25 @@ def render(items_df):
     
     st.markdown("<div style='margin-bottom: 10px;'></div>", unsafe_allow_html=True)
     
+    # Optional share change vs an archived month
+    share_deltas = None
+    if get_share_deltas is not None:
+        from services.snapshot_archive import BASELINES
+        compare_opts = {"ללא": None, **{label: key for key, label in BASELINES.items()}}
+        compare_choice = st.radio("השוואה ל", list(compare_opts.keys()), horizontal=True, key="mix_compare")
+        if compare_opts[compare_choice]:
+            share_deltas = get_share_deltas(df_dist, seller_arg, compare_opts[compare_choice])
+            if share_deltas is None:
+                st.caption("אין נתונים שמורים לתקופה זו.")
+
+    delta_header = "<div class='mix-pct'>Δ נק' אחוז</div>" if share_deltas is not None else ""
+
     # Render Header
-    st.markdown("""
+    st.markdown(f"""
     <div class='mix-row' style='background-color:#f9f9f9; padding:5px; font-weight:bold;'>
         <div class='mix-cat'>קטגוריה</div>
         <div class='mix-pct'>אחוז</div>
+        {delta_header}
         <div class='mix-val'>כמות</div>
     </div>
     """, unsafe_allow_html=True)
@@ -129,11 +166,15 @@ def render(items_df):
         cat = row['category']
         val = int(row['value'])
         pct = f"{row['percent']:.1f}%"
+        delta_cell = ""
+        if share_deltas is not None:
+            delta_cell = f"<div class='mix-pct'>{share_deltas.get(cat, 0):+.1f}</div>"
         
         st.markdown(f"""
         <div class='mix-row'>
             <div class='mix-cat'>{cat}</div>
             <div class='mix-pct'>{pct}</div>
+            {delta_cell}
             <div class='mix-val'>{val}</div>
         </div>
         """, unsafe_allow_html=True)
@@ -142,16 +183,30 @@ def render(items_df):
     <div class='mix-row' style='border-top: 2px solid #eee; font-weight:bold;'>
         <div class='mix-cat'>סה"כ</div>
         <div class='mix-pct'>100%</div>
+        {"<div class='mix-pct'></div>" if share_deltas is not None else ""}
         <div class='mix-val'>{int(total_val)}</div>
     </div>
     """, unsafe_allow_html=True)
 
 
-    # --- 3. EXPANDER: FULL PIVOT TABLE ---
+@fragment
+def render_full_pivot(items_df, get_pivot=None):
+    """Full seller x category pivot, built only while the expander is open."""
     st.markdown("<div style='margin-top: 30px;'></div>", unsafe_allow_html=True)
-    with st.expander("הצג טבלה מלאה לפי עובדים"):
+    try:
+        # Track open/closed so the pivot is only built when it is shown
+        expander = st.expander("הצג טבלה מלאה לפי עובדים", key="mix_full_pivot", on_change="rerun")
+    except TypeError:
+        # Older Streamlit without expander state
+        expander = st.expander("הצג טבלה מלאה לפי עובדים")
+    with expander:
+        if getattr(expander, "open", True) is False:
+            return
         # Always Units
-        pivot = kpi_tab3.build_category_pivot(items_df, metric="units")
+        if get_pivot is not None:
+            pivot = get_pivot()
+        else:
+            pivot = kpi_tab3.build_category_pivot(items_df, metric="units")
         if not pivot.empty:
              st.dataframe(pivot, use_container_width=True)
         else:
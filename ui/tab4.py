@@ -2,7 +2,12 @@ import streamlit as st
 from services import ai_assistant
 from datetime import datetime
 
-def render(kpis, df_sellers, df_top_qty, df_top_amt, items_df):
+def show_queue_position(placeholder, position):
+    """Shows the request's place in the shared AI queue (services/ai_gateway)."""
+    placeholder.info(f"הבקשה ממתינה בתור (מקום {position}). עומס בקשות AI כרגע.")
+
+
+def render(kpis, df_sellers, df_top_qty, df_top_amt, items_df, general_seller=None):
     """
     Renders the AI Assistant Tab (Tab 4).
     Production-ready: Cached results, Copy buttons, WhatsApp style.
@@ -74,11 +79,15 @@ def render(kpis, df_sellers, df_top_qty, df_top_amt, items_df):
         st.markdown("<div class='helper-text'>עוזר אישי מסכם מה קורה בסניף ומה עושים הלאה.</div>", unsafe_allow_html=True)
         
         if st.button("צור ניתוח נתונים", type="primary"):
+            queue_note = st.empty()
             with st.spinner("מנתח נתונים ומבצע חשיבה ניהולית..."):
                 try:
                     result = ai_assistant.generate_management_analysis(
-                        kpis, df_sellers, df_top_qty, df_top_amt, items_df
+                        kpis, df_sellers, df_top_qty, df_top_amt, items_df,
+                        on_queue=lambda position: show_queue_position(queue_note, position),
+                        general_seller=general_seller
                     )
+                    queue_note.empty()
                     
                     if "Error" in result:
                         st.error("לא הצלחתי לייצר כרגע (שגיאת חיבור). נסה שוב בעוד רגע.")
@@ -117,11 +126,15 @@ def render(kpis, df_sellers, df_top_qty, df_top_amt, items_df):
             )
             
         if st.button("צור הודעה לצוות", type="primary"):
+            queue_note = st.empty()
             with st.spinner("מנסח הודעה לצוות..."):
                 try:
                     msg_result = ai_assistant.generate_team_message(
-                        topic, tone, kpis, df_sellers, df_top_qty, df_top_amt, items_df
+                        topic, tone, kpis, df_sellers, df_top_qty, df_top_amt, items_df,
+                        on_queue=lambda position: show_queue_position(queue_note, position),
+                        general_seller=general_seller
                     )
+                    queue_note.empty()
                     
                     if "Error" in msg_result:
                          st.error("לא הצלחתי לייצר הודעה כרגע. נסה שוב.")